@@ -3,8 +3,29 @@ AI服务模块
 负责处理AI相关功能，如摘要生成和关键词提取
 """
 
-from openai import OpenAI
+import time
+from openai import APIStatusError, OpenAI
 import streamlit as st
+from cache_backend import get_cache_backend, make_cache_key
+from chat_models import MAX_HISTORY_MESSAGES
+from circuit_breaker import get_circuit_breaker
+from tracing import tracer
+
+
+# 问答结果缓存的默认配置：进程内LRU + 本地磁盘两级缓存
+DEFAULT_CHAT_CACHE = {
+    "backend": "tiered",
+    "memory_entries": 200,
+    "max_entries": 5000,
+    "sqlite_path": "cache/chat_cache.db",
+}
+
+
+def _is_provider_failure(error):
+    """连接失败、超时、限流和 5xx 才说明服务商不可用，请求参数错误（如上下文过长）不计入熔断"""
+    if isinstance(error, APIStatusError):
+        return error.status_code >= 500 or error.status_code == 429
+    return True
 
 
 class AIService:
@@ -20,17 +41,71 @@ class AIService:
         self.config_manager = config_manager
         self.config = config_manager.get_config()
         
-        # 获取默认服务商
-        self.default_provider = self.config.get("default_provider", "openai")
+        # 获取默认服务商并初始化客户端
+        self.set_provider(self.config.get("default_provider", "openai"))
+        
+        # 进程级共享缓存（摘要和关键词）
+        self.cache = get_cache_backend(config_manager.get_cache_config())
+        # 问答结果缓存（服务商、模型、消息和生成参数完全相同时直接复用回答）
+        self._apply_chat_cache_config(config_manager.get_chat_cache_config())
+        
+        config_manager.subscribe(self._on_config_change)
+    
+    def set_provider(self, provider):
+        """
+        切换AI服务商并重建客户端
+        
+        Args:
+            provider (str): 服务商名称（配置中的键）
+        """
+        self.default_provider = provider
         
         # 获取当前服务商配置
-        self.current_provider_config = self.config.get(self.default_provider, {})
+        self.current_provider_config = self.config.get(provider, {})
         
-        # 初始化 OpenAI 客户端
+        # 初始化 OpenAI 客户端（显式设置超时，避免服务商无响应时长时间等待）
         self.client = OpenAI(
             base_url=self.current_provider_config.get("base_url", "https://api.openai.com/v1"),
             api_key=self.current_provider_config.get("api_key", ""),
+            timeout=self.current_provider_config.get("timeout", 60),
+            max_retries=self.current_provider_config.get("max_retries", 2),
         )
+        # 每个服务商一个熔断器（进程级共享）
+        self.breaker = get_circuit_breaker(f"llm:{provider}", self.config.get("circuit_breaker", {}))
+    
+    @property
+    def available(self):
+        """当前服务商是否可用（未熔断）"""
+        return self.breaker.available
+    
+    def _on_config_change(self, old_config, new_config):
+        """配置变更回调，只有当前服务商配置或缓存配置变化时才重建"""
+        self.config = new_config
+        provider = self.default_provider
+        # 仍在使用旧的默认服务商时跟随新的默认服务商
+        if provider == old_config.get("default_provider", "openai"):
+            provider = new_config.get("default_provider", "openai")
+        if provider != self.default_provider or old_config.get(provider) != new_config.get(provider):
+            self.set_provider(provider)
+        if old_config.get("cache") != new_config.get("cache"):
+            self.cache = get_cache_backend(new_config.get("cache", {}))
+        if old_config.get("chat_cache") != new_config.get("chat_cache"):
+            self._apply_chat_cache_config(new_config.get("chat_cache", {}))
+        if old_config.get("circuit_breaker") != new_config.get("circuit_breaker"):
+            self.breaker = get_circuit_breaker(f"llm:{self.default_provider}", new_config.get("circuit_breaker", {}))
+    
+    def _apply_chat_cache_config(self, chat_cache_config):
+        """根据配置创建问答结果缓存，关闭时为None"""
+        self.chat_cache_ttl = chat_cache_config.get("ttl", 24 * 3600)
+        if chat_cache_config.get("enabled", True):
+            self.chat_cache = get_cache_backend(dict(DEFAULT_CHAT_CACHE, **chat_cache_config))
+        else:
+            self.chat_cache = None
+    
+    def _chat_cache_key(self, messages, temperature, max_tokens):
+        """问答结果缓存键（按完整消息列表计算）"""
+        model = self.current_provider_config.get("model", "gpt-3.5-turbo")
+        return make_cache_key(self.default_provider, model, messages, temperature, max_tokens)
     
     def generate_summary(self, text, max_tokens=128):
         """
@@ -43,22 +118,8 @@ class AIService:
         Returns:
             str: 生成的摘要
         """
-        prompt = f"请用中文对以下内容生成简明摘要,只需返回摘要，别的任何说明都不返回：\n{text}"
-        
         try:
-            response = self.client.chat.completions.create(
-                model=self.current_provider_config.get("model", "gpt-3.5-turbo"),
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "你是一个专业的中文摘要助手，只需返回摘要，别的任何说明都不返回。"
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,  # 控制生成文本的随机性
-                max_tokens=max_tokens  # 限制生成文本的最大长度
-            )
-            return response.choices[0].message.content.strip()
+            return self._request_summary(text, max_tokens)
             
         except Exception as e:
             return f"摘要生成失败: {e}"
@@ -74,11 +135,78 @@ class AIService:
         Returns:
             str: 提取的关键词
         """
-        prompt = f"请用中文对以下内容生成关键词,只需返回关键词，别的任何说明都不返回：\n{text}"
-        
         try:
+            return self._request_keywords(text, max_tokens)
+            
+        except Exception as e:
+            return f"关键词生成失败: {e}"
+    
+    def generate_enrichment(self, text, max_tokens=128):
+        """
+        生成文本的摘要和关键词（供离线任务使用，失败时抛出异常而不是返回错误文本）
+        
+        Args:
+            text (str): 文档内容
+            max_tokens (int): 最大生成长度
+            
+        Returns:
+            tuple: (摘要, 关键词)
+        """
+        summary, keywords = self.cache.get_or_compute(
+            "enrichment",
+            self._enrichment_cache_key(text, max_tokens),
+            lambda: [self._request_summary(text, max_tokens), self._request_keywords(text, max_tokens)]
+        )
+        return summary, keywords
+    
+    def get_cached_enrichment(self, text, max_tokens=128):
+        """
+        只从缓存读取文本的摘要和关键词，不调用模型
+
+        Args:
+            text (str): 文档内容
+            max_tokens (int): 生成时使用的最大长度
+
+        Returns:
+            tuple or None: (摘要, 关键词)，未缓存时返回None
+        """
+        cached = self.cache.get(f"enrichment:{self._enrichment_cache_key(text, max_tokens)}")
+        return tuple(cached) if cached else None
+
+    def _enrichment_cache_key(self, text, max_tokens):
+        """摘要/关键词缓存键（内容、服务商、模型和长度限制相同的结果可复用）"""
+        model = self.current_provider_config.get("model", "gpt-3.5-turbo")
+        return make_cache_key(self.default_provider, model, max_tokens, text)
+    
+    def _request_summary(self, text, max_tokens):
+        """请求生成摘要，失败时抛出异常"""
+        prompt = f"请用中文对以下内容生成简明摘要,只需返回摘要，别的任何说明都不返回：\n{text}"
+        model = self.current_provider_config.get("model", "gpt-3.5-turbo")
+        with tracer.span("llm.summary", provider=self.default_provider, model=model) as span, \
+                self.breaker.protect(_is_provider_failure):
             response = self.client.chat.completions.create(
-                model=self.current_provider_config.get("model", "gpt-3.5-turbo"),
+                model=model,
+                messages=[
+                    {
+                        "role": "system", 
+                        "content": "你是一个专业的中文摘要助手，只需返回摘要，别的任何说明都不返回。"
+                    },
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.3,  # 控制生成文本的随机性
+                max_tokens=max_tokens  # 限制生成文本的最大长度
+            )
+            span.record_usage(response)
+        return response.choices[0].message.content.strip()
+    
+    def _request_keywords(self, text, max_tokens):
+        """请求生成关键词，失败时抛出异常"""
+        prompt = f"请用中文对以下内容生成关键词,只需返回关键词，别的任何说明都不返回：\n{text}"
+        model = self.current_provider_config.get("model", "gpt-3.5-turbo")
+        with tracer.span("llm.keywords", provider=self.default_provider, model=model) as span, \
+                self.breaker.protect(_is_provider_failure):
+            response = self.client.chat.completions.create(
+                model=model,
                 messages=[
                     {
                         "role": "system", 
@@ -89,12 +217,10 @@ class AIService:
                 temperature=0.3,  # 控制生成文本的随机性
                 max_tokens=max_tokens  # 限制生成文本的最大长度
             )
-            return response.choices[0].message.content.strip()
-            
-        except Exception as e:
-            return f"关键词生成失败: {e}"
+            span.record_usage(response)
+        return response.choices[0].message.content.strip()
     
-    def chat_completion(self, messages, temperature=0.7, max_tokens=1000):
+    def chat_completion(self, messages, temperature=0.7, max_tokens=1000, raise_errors=False, use_cache=True):
         """
         支持聊天对话的AI完成接口
         
@@ -102,56 +228,133 @@ class AIService:
             messages (list): 对话消息列表
             temperature (float): 生成文本的随机性控制
             max_tokens (int): 最大生成长度
+            raise_errors (bool): 调用失败时是否抛出异常（默认返回错误提示文本）
+            use_cache (bool): 是否读取问答结果缓存（重新回答时为False，新回答仍会写入缓存）
             
         Returns:
             str: AI生成的回答
         """
         try:
+            if self.chat_cache is None:
+                return self._request_chat(messages, temperature, max_tokens)
+            key = self._chat_cache_key(messages, temperature, max_tokens)
+            if use_cache:
+                return self.chat_cache.get_or_compute(
+                    "chat", key, lambda: self._request_chat(messages, temperature, max_tokens),
+                    ttl=self.chat_cache_ttl, cacheable=bool
+                )
+            answer = self._request_chat(messages, temperature, max_tokens)
+            if answer:
+                self.chat_cache.set(f"chat:{key}", answer, self.chat_cache_ttl)
+            return answer
+            
+        except Exception as e:
+            if raise_errors:
+                raise
+            return f"AI回答生成失败: {e}"
+    
+    def _request_chat(self, messages, temperature, max_tokens):
+        """请求模型生成回答，失败时抛出异常"""
+        model = self.current_provider_config.get("model", "gpt-3.5-turbo")
+        with tracer.span("llm.chat", provider=self.default_provider, model=model) as span, \
+                self.breaker.protect(_is_provider_failure):
             response = self.client.chat.completions.create(
-                model=self.current_provider_config.get("model", "gpt-3.5-turbo"),
+                model=model,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens
             )
-            return response.choices[0].message.content.strip()
+            span.record_usage(response)
+        return response.choices[0].message.content.strip()
+    
+    def chat_completion_stream(self, messages, temperature=0.7, max_tokens=1000, use_cache=True):
+        """
+        流式聊天完成接口，逐段返回生成的文本（命中问答结果缓存时一次返回完整回答）
+        
+        Args:
+            messages (list): 对话消息列表
+            temperature (float): 生成文本的随机性控制
+            max_tokens (int): 最大生成长度
+            use_cache (bool): 是否读取问答结果缓存（重新回答时为False，新回答仍会写入缓存）
             
-        except Exception as e:
-            return f"AI回答生成失败: {e}"
+        Yields:
+            str: 增量文本片段
+            
+        Raises:
+            Exception: AI服务调用失败时抛出
+        """
+        cache_key = None
+        if self.chat_cache is not None:
+            cache_key = f"chat:{self._chat_cache_key(messages, temperature, max_tokens)}"
+            if use_cache:
+                cached = self.chat_cache.get(cache_key)
+                tracer.record_cache("chat", cached is not None)
+                if cached is not None:
+                    yield cached
+                    return
+        
+        model = self.current_provider_config.get("model", "gpt-3.5-turbo")
+        with tracer.span("llm.chat_stream", provider=self.default_provider, model=model) as span, \
+                self.breaker.protect(_is_provider_failure):
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            completion_chars = 0
+            parts = []
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not completion_chars:
+                        span.set(ttft_ms=round((time.perf_counter_ns() - span.start_ns) / 1e6, 2))
+                    completion_chars += len(delta)
+                    parts.append(delta)
+                    yield delta
+            span.set(completion_chars=completion_chars)
+        # 只缓存完整接收的回答（中途出错或调用方提前停止时不会执行到这里）
+        if cache_key and parts:
+            self.chat_cache.set(cache_key, "".join(parts), self.chat_cache_ttl)
     
-    def generate_chat_response(self, user_message, context=None, chat_history=None):
+    def build_chat_messages(self, user_message, context=None, chat_history=None):
         """
-        生成聊天回答，支持上下文和历史对话
+        构建聊天消息列表（页面问答流水线、批量问答和接口服务共用，保证相同问题得到相同的提示词和缓存键）
         
         Args:
             user_message (str): 用户消息
-            context (str, optional): 额外的上下文信息（如搜索结果）
+            context (str or dict, optional): 额外的上下文信息（如搜索结果），多个检索来源时为 来源名称 -> 文本
             chat_history (list, optional): 对话历史
             
         Returns:
-            str: AI生成的回答
+            list: 消息列表
         """
-        try:
-            # 构建消息列表
-            messages = []
-            
-            # 添加系统消息
-            system_content = "你是一个有用的AI助手。请用中文回答用户的问题，提供准确、有用的信息。"
-            messages.append({"role": "system", "content": system_content})
-            
-            # 添加历史对话（限制数量避免token过多）
-            if chat_history:
-                max_history = min(len(chat_history), 10)  # 最多10条历史消息
-                for msg in chat_history[-max_history:]:
-                    if msg.get("role") in ["user", "assistant"]:
-                        messages.append({
-                            "role": msg["role"],
-                            "content": msg["content"]
-                        })
-            
-            # 构建当前用户消息
-            if context:
-                # 有上下文时整合搜索结果
-                user_content = f"""基于以下信息回答我的问题：
+        # 构建消息列表
+        messages = []
+        
+        # 添加系统消息
+        system_content = "你是一个有用的AI助手。请用中文回答用户的问题，提供准确、有用的信息。"
+        messages.append({"role": "system", "content": system_content})
+        
+        # 添加历史对话（限制数量避免token过多）
+        if chat_history:
+            max_history = min(len(chat_history), MAX_HISTORY_MESSAGES)
+            for msg in chat_history[-max_history:]:
+                if msg.get("role") in ["user", "assistant"]:
+                    messages.append({
+                        "role": msg["role"],
+                        "content": msg["content"]
+                    })
+        
+        # 构建当前用户消息
+        if isinstance(context, dict):
+            context = "\n\n".join(f"{name}：\n{text}" for name, text in context.items() if text)
+        if context:
+            # 有上下文时整合搜索结果
+            user_content = f"""基于以下信息回答我的问题：
 
 参考信息：
 {context}
@@ -159,10 +362,26 @@ class AIService:
 我的问题：{user_message}
 
 请根据参考信息回答问题，如果信息不足，请结合你的知识给出最佳回答。"""
-            else:
-                user_content = user_message
+        else:
+            user_content = user_message
+        
+        messages.append({"role": "user", "content": user_content})
+        return messages
+    
+    def generate_chat_response(self, user_message, context=None, chat_history=None):
+        """
+        生成聊天回答，支持上下文和历史对话
+        
+        Args:
+            user_message (str): 用户消息
+            context (str, optional): 额外的上下文信息（如搜索结果）
+            chat_history (list, optional): 对话历史
             
-            messages.append({"role": "user", "content": user_content})
+        Returns:
+            str: AI生成的回答
+        """
+        try:
+            messages = self.build_chat_messages(user_message, context, chat_history)
             
             # 调用聊天完成接口
             return self.chat_completion(messages)
@@ -182,11 +401,21 @@ class AIService:
         """
         if not content:
             return '无内容', '无关键词'
+        # AI服务熔断期间不再实时生成，已缓存的结果仍可使用
+        if not self.available:
+            cached = self.get_cached_enrichment(content)
+            return cached or ('AI服务暂不可用，暂不生成摘要', 'AI服务暂不可用，暂不生成关键词')
         
         try:
             with st.spinner("正在生成摘要和关键词..."):
-                summary = self.generate_summary(content)
-                keywords = self.extract_keywords(content)
+                # 生成失败的结果不写入缓存，下次访问时重试
+                summary, keywords = self.cache.get_or_compute(
+                    "enrichment",
+                    self._enrichment_cache_key(content, 128),
+                    lambda: [self.generate_summary(content), self.extract_keywords(content)],
+                    cacheable=lambda result: not result[0].startswith("摘要生成失败")
+                    and not result[1].startswith("关键词生成失败")
+                )
             return summary, keywords
         except Exception as e:
             st.error(f"处理内容失败：{str(e)}")
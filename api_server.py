@@ -0,0 +1,437 @@
+"""
+HTTP/JSON 接口服务模块
+基于 asyncio 的轻量HTTP服务，复用 SearchService、AIService、WebSearchService，
+提供 /search、/enrich、/chat（支持SSE流式输出）、/export（流式导出全部结果）和 /indexes 接口，可与 ai.py 并行运行或单独部署
+
+运行命令: python api_server.py --host 0.0.0.0 --port 8600
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from ai_service import AIService
+from chat_pipeline import WEB_SEARCH_SOURCE
+from circuit_breaker import circuit_breaker_states
+from config_manager import ConfigManager
+from dedup_service import ResultDeduplicator
+from export_service import ENRICHMENT_MODES, SearchExporter, encode_rows
+from search_service import SearchService, describe_filter_error
+from tracing import tracer
+from web_search_service import WebSearchService
+
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+_STREAM_END = object()
+
+
+class HTTPError(Exception):
+    """接口错误，携带HTTP状态码"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _number_param(body, key, default, kind=int, minimum=None, maximum=None):
+    """
+    读取并校验数值参数
+
+    Args:
+        body (dict): 请求体
+        key (str): 参数名
+        default: 缺省值
+        kind (type): int 或 float
+        minimum / maximum (optional): 取值范围（含边界）
+
+    Returns:
+        int or float: 参数值
+
+    Raises:
+        HTTPError: 参数不是合法数值或超出范围时返回 400
+    """
+    value = body.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{key} 必须是数值")
+    try:
+        value = kind(value)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{key} 必须是{'整数' if kind is int else '数值'}")
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{key} 超出取值范围 [{minimum}, {maximum}]")
+    return value
+
+
+def _string_param(body, key, default=None, required=False):
+    """
+    读取并校验字符串参数
+
+    Raises:
+        HTTPError: 缺少必填参数或类型不是字符串时返回 400
+    """
+    value = body.get(key, default)
+    if value is None or value == "":
+        if required:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"缺少 {key} 参数")
+        return value
+    if not isinstance(value, str):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{key} 必须是字符串")
+    return value
+
+
+class APIServer:
+    """HTTP接口服务类"""
+
+    def __init__(self, config_manager, max_workers=None):
+        """
+        初始化接口服务
+
+        Args:
+            config_manager: 配置管理器实例
+            max_workers (int, optional): 执行阻塞调用的线程数
+        """
+        self.config_manager = config_manager
+        self.logger = logging.getLogger(__name__)
+        api_config = config_manager.get_api_config()
+        self.search_config = config_manager.get_search_config()
+        self.search_service = SearchService(config_manager)
+        self.ai_service = AIService(config_manager)
+        self.web_search_service = WebSearchService(config_manager)
+        self.deduplicator = ResultDeduplicator(config_manager.get_dedup_config())
+        self.export_config = config_manager.get_export_config()
+        self.exporter = SearchExporter(self.search_service, self.ai_service, self.export_config)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or api_config.get("max_workers", 32))
+        self.keep_alive_timeout = api_config.get("keep_alive_timeout", 15)
+        self.routes = {
+            ("GET", "/health"): self.handle_health,
+            ("GET", "/indexes"): self.handle_indexes,
+            ("POST", "/search"): self.handle_search,
+            ("POST", "/enrich"): self.handle_enrich,
+            ("POST", "/chat"): self.handle_chat,
+            ("POST", "/export"): self.stream_export,
+        }
+
+    async def _run_blocking(self, func, *args):
+        """在线程池中执行阻塞调用"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    async def handle_health(self, body):
+        # 有依赖熔断时仍返回 200，由调用方根据 dependencies 判断降级范围
+        dependencies = circuit_breaker_states()
+        degraded = any(state["state"] != "closed" for state in dependencies)
+        return {"status": "degraded" if degraded else "ok", "dependencies": dependencies}
+
+    async def handle_indexes(self, body):
+        return {"indexes": await self._run_blocking(self.search_service.get_available_indexes)}
+
+    async def handle_search(self, body):
+        query = _string_param(body, "query", required=True)
+        knowledge_base = _string_param(body, "knowledge_base", self.search_config.get("default_knowledge_base"))
+        top_k = _number_param(body, "top_k", self.search_config.get("default_top_k", 10), int,
+                              1, self.search_config.get("max_top_k", 100))
+        semantic_ratio = _number_param(body, "semantic_ratio", self.search_config.get("default_semantic_ratio", 0.5),
+                                       float, 0, 1)
+
+        with tracer.span("api.search", query=query[:100], knowledge_base=knowledge_base):
+            hits, success = await self._run_blocking(
+                self.search_service.search_hybrid, query, knowledge_base, top_k, semantic_ratio
+            )
+        if not success:
+            raise HTTPError(HTTPStatus.BAD_GATEWAY, "搜索服务不可用")
+        if body.get("dedup", True):
+            # 去重需要计算 MinHash 签名，放到线程池中执行，避免阻塞其他连接
+            clusters = await self._run_blocking(self.deduplicator.deduplicate, hits)
+            hits = [dict(cluster["primary"], duplicate_count=len(cluster["duplicates"])) for cluster in clusters]
+        return {"hits": hits, "count": len(hits)}
+
+    async def handle_enrich(self, body):
+        items = body.get("documents") or [{"content": _string_param(body, "content", "")}]
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "documents 必须是对象数组")
+
+        def enrich(item):
+            if item.get("ai_summary") and item.get("ai_keywords"):
+                return {"summary": item["ai_summary"], "keywords": item["ai_keywords"]}
+            content = item.get("content", "") or item.get("abstract", "")
+            if not content:
+                return {"summary": "无内容", "keywords": "无关键词"}
+            try:
+                summary, keywords = self.ai_service.generate_enrichment(content)
+                return {"summary": summary, "keywords": keywords}
+            except Exception as e:
+                return {"error": str(e)}
+
+        # 多个文档并发生成
+        results = await asyncio.gather(*(self._run_blocking(enrich, item) for item in items))
+        return {"results": list(results)}
+
+    async def _prepare_chat(self, body):
+        """执行联网搜索（可选）并构建消息列表"""
+        message = _string_param(body, "message", required=True)
+        history = body.get("history") or []
+        if not isinstance(history, list) or not all(
+                isinstance(item, dict) and isinstance(item.get("role"), str) and isinstance(item.get("content"), str)
+                for item in history):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "history 必须是由 {role, content} 对象组成的数组")
+        search_info = {"used_search": False, "search_failed": False}
+        context = None
+        if body.get("use_web_search"):
+            search_result = await self._run_blocking(self.web_search_service.search_web, message)
+            if search_result.get("success"):
+                # 与页面问答流水线使用相同的来源名称，相同问题得到相同的提示词和问答缓存键
+                context = {WEB_SEARCH_SOURCE: self.web_search_service.format_search_results(search_result)}
+                search_info = {"used_search": True, "search_failed": False, "query": message}
+            else:
+                search_info = {"used_search": False, "search_failed": True, "query": message,
+                               "error": search_result.get("error", "搜索失败")}
+        messages = self.ai_service.build_chat_messages(message, context, history)
+        return messages, search_info
+
+    @staticmethod
+    def _generation_params(body):
+        """读取并校验生成参数"""
+        return (_number_param(body, "temperature", 0.7, float, 0, 2),
+                _number_param(body, "max_tokens", 1500, int, 1, 32000))
+
+    async def handle_chat(self, body):
+        temperature, max_tokens = self._generation_params(body)
+        messages, search_info = await self._prepare_chat(body)
+        response = await self._run_blocking(
+            self.ai_service.chat_completion, messages, temperature, max_tokens,
+            False, not body.get("no_cache", False)
+        )
+        return {"response": response, "search_info": search_info}
+
+    async def stream_chat(self, body, writer):
+        """以 Server-Sent Events 格式流式返回回答；客户端断开后停止读取模型输出"""
+        temperature, max_tokens = self._generation_params(body)
+        messages, search_info = await self._prepare_chat(body)
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+        )
+
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            stream = self.ai_service.chat_completion_stream(
+                messages, temperature, max_tokens, not body.get("no_cache", False)
+            )
+            try:
+                for delta in stream:
+                    if cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(chunks.put_nowait, ("delta", {"content": delta}))
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, ("error", {"message": str(e)}))
+            finally:
+                # 关闭生成器，释放与模型服务商的连接
+                stream.close()
+                loop.call_soon_threadsafe(chunks.put_nowait, _STREAM_END)
+
+        # 响应头已发送，之后的异常只能以 error 事件告知客户端
+        try:
+            writer.write(self._sse("search_info", search_info))
+            await writer.drain()
+            threading.Thread(target=produce, daemon=True).start()
+            while True:
+                item = await chunks.get()
+                if item is _STREAM_END:
+                    break
+                writer.write(self._sse(*item))
+                await writer.drain()
+            writer.write(self._sse("done", {}))
+            await writer.drain()
+        except ConnectionError:
+            self.logger.info("客户端已断开，停止生成回答")
+        except Exception as e:
+            self.logger.exception("流式回答失败")
+            try:
+                writer.write(self._sse("error", {"message": str(e)}))
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            cancelled.set()
+
+    async def stream_export(self, body, writer):
+        """逐页导出查询的全部结果，每获取一页立即写出（CSV 或 JSONL）"""
+        query = _string_param(body, "query", required=True)
+        output_format = body.get("format", "jsonl")
+        if output_format not in ("csv", "jsonl"):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "format 仅支持 csv 和 jsonl")
+        enrichment = body.get("enrichment", self.export_config.get("enrichment", "cached"))
+        if enrichment not in ENRICHMENT_MODES:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"enrichment 仅支持 {'、'.join(ENRICHMENT_MODES)}")
+        knowledge_base = _string_param(body, "knowledge_base", self.search_config.get("default_knowledge_base"))
+        semantic_ratio = _number_param(body, "semantic_ratio", self.search_config.get("default_semantic_ratio", 0.5),
+                                       float, 0, 1)
+        max_results = _number_param(body, "max_results", None, int, 1)
+        filter_expression = _string_param(body, "filter")
+
+        pages = self.exporter.iter_pages(query, knowledge_base, semantic_ratio, enrichment, max_results,
+                                         filter_expression)
+        fields = self.exporter.fields(enrichment)
+        # 先获取第一页，向量或搜索失败时仍可返回JSON错误
+        try:
+            rows = await self._run_blocking(next, pages, None)
+        except Exception as e:
+            message = describe_filter_error(e)
+            if message is None:
+                raise
+            raise HTTPError(HTTPStatus.BAD_REQUEST, message)
+        content_type = "text/csv" if output_format == "csv" else "application/x-ndjson"
+        writer.write(
+            f"HTTP/1.1 200 OK\r\nContent-Type: {content_type}; charset=utf-8\r\n"
+            f"Content-Disposition: attachment; filename=export.{output_format}\r\n"
+            f"Connection: close\r\n\r\n".encode("latin-1")
+        )
+        if output_format == "csv":
+            writer.write(encode_rows([], fields, output_format, header=True).encode("utf-8"))
+        count = 0
+        try:
+            # 每次只在线程池中取一页，写出并等待客户端接收后再取下一页
+            while rows is not None:
+                writer.write(encode_rows(rows, fields, output_format).encode("utf-8"))
+                await writer.drain()
+                count += len(rows)
+                rows = await self._run_blocking(next, pages, None)
+        except Exception as e:
+            # 响应头已发送，只能记录错误并断开连接
+            self.logger.error(f"导出中断（已写出 {count} 条）: {e}")
+
+    @staticmethod
+    def _sse(event, data):
+        """编码一条SSE事件"""
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+    @staticmethod
+    def _response(status, payload, keep_alive):
+        """编码JSON响应"""
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        headers = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        return headers.encode("latin-1") + body
+
+    async def _read_request(self, reader):
+        """
+        读取一个HTTP请求
+
+        Returns:
+            tuple or None: (方法, 路径, 请求头, 请求体)，连接关闭时返回None
+        """
+        request_line = await asyncio.wait_for(reader.readline(), timeout=self.keep_alive_timeout)
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "请求行格式错误")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Content-Length 格式错误")
+        if length < 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Content-Length 格式错误")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "请求体过大")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), urlsplit(target).path, headers, body
+
+    async def handle_connection(self, reader, writer):
+        """处理一个客户端连接（支持 keep-alive）"""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except HTTPError as e:
+                    writer.write(self._response(e.status, {"error": e.message}, False))
+                    await writer.drain()
+                    return
+                if request is None:
+                    return
+
+                method, path, headers, raw_body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    body = json.loads(raw_body) if raw_body else {}
+                    if not isinstance(body, dict):
+                        raise HTTPError(HTTPStatus.BAD_REQUEST, "请求体必须是JSON对象")
+                    handler = self.routes.get((method, path))
+                    if handler is None:
+                        raise HTTPError(HTTPStatus.NOT_FOUND, f"未找到接口 {method} {path}")
+                    if path == "/chat" and body.get("stream"):
+                        await self.stream_chat(body, writer)
+                        return
+                    if path == "/export":
+                        await self.stream_export(body, writer)
+                        return
+                    payload = await handler(body)
+                    status = HTTPStatus.OK
+                except HTTPError as e:
+                    status, payload = e.status, {"error": e.message}
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    status, payload = HTTPStatus.BAD_REQUEST, {"error": "请求体不是合法的JSON"}
+                except Exception as e:
+                    self.logger.exception("处理请求失败")
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+                writer.write(self._response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        """启动服务并持续运行"""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        self.logger.info(f"接口服务已启动: http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="知识库搜索系统 HTTP/JSON 接口服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8600, help="监听端口")
+    parser.add_argument("--config", default="config.json", help="配置文件路径")
+    parser.add_argument("--workers", type=int, help="执行阻塞调用的线程数")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    config_manager = ConfigManager(args.config)
+    tracer.configure(config_manager.get_tracing_config())
+    server = APIServer(config_manager, args.workers)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
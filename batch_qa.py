@@ -0,0 +1,336 @@
+"""
+批量问答模块
+读取 CSV / JSONL 格式的问题列表，去重后并发执行"知识库检索 + 模型回答"，
+按服务商限制并发数和每分钟请求数，结果逐条追加写入输出文件，可在运行过程中下载
+"""
+
+import csv
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from chat_pipeline import KNOWLEDGE_SOURCE, format_knowledge_context
+from tracing import tracer
+
+
+# 问题列可使用的列名/字段名
+QUESTION_FIELDS = ("question", "问题", "query", "q")
+
+# 输出文件的字段
+OUTPUT_FIELDS = ["index", "question", "answer", "sources", "success", "error", "duplicate", "latency_ms"]
+
+# 未在配置中指定时每个服务商的限制
+DEFAULT_PROVIDER_LIMITS = {"max_concurrency": 4, "requests_per_minute": 60}
+
+# 进程级服务商限流器，所有会话的批量任务共享
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def load_questions(filename, data):
+    """
+    解析上传的问题文件
+
+    Args:
+        filename (str): 文件名（按扩展名区分 .csv / .jsonl）
+        data (bytes): 文件内容
+
+    Returns:
+        list: 问题列表（保持原始顺序，已去除空行）
+
+    Raises:
+        ValueError: 格式不支持或找不到问题列时抛出
+    """
+    text = data.decode('utf-8-sig')
+    questions = []
+    if filename.lower().endswith((".jsonl", ".json")):
+        for line_number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"第 {line_number} 行不是有效的JSON: {e}")
+            if isinstance(item, dict):
+                item = next((item[field] for field in QUESTION_FIELDS if item.get(field)), "")
+            questions.append(str(item))
+    elif filename.lower().endswith(".csv"):
+        rows = list(csv.reader(io.StringIO(text)))
+        if not rows:
+            return []
+        header = [cell.strip().lower() for cell in rows[0]]
+        column = next((header.index(field) for field in QUESTION_FIELDS if field in header), None)
+        if column is None:
+            # 没有表头时使用第一列
+            column, body = 0, rows
+        else:
+            body = rows[1:]
+        questions = [row[column] for row in body if len(row) > column]
+    else:
+        raise ValueError("仅支持 .csv 和 .jsonl 文件")
+    return [question.strip() for question in questions if question and question.strip()]
+
+
+def normalize_question(question):
+    """去重用的问题规范化：合并空白并忽略大小写"""
+    return re.sub(r"\s+", " ", question).strip().casefold()
+
+
+class ProviderLimiter:
+    """单个服务商的并发数和请求速率限制"""
+
+    def __init__(self, max_concurrency, requests_per_minute):
+        """
+        初始化限流器
+
+        Args:
+            max_concurrency (int): 最大并发请求数
+            requests_per_minute (int): 每分钟最大请求数，0 表示不限
+        """
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, cancel_event=None):
+        """
+        获取一个请求名额（先占并发名额，再按速率等待发送时间）
+
+        Args:
+            cancel_event (threading.Event, optional): 取消事件，设置后停止等待
+
+        Raises:
+            InterruptedError: 等待期间任务被取消时抛出
+        """
+        self._semaphore.acquire()
+        try:
+            if self.interval:
+                with self._lock:
+                    now = time.monotonic()
+                    send_at = max(now, self._next_slot)
+                    self._next_slot = send_at + self.interval
+                delay = send_at - now
+                if delay > 0:
+                    if cancel_event is None:
+                        time.sleep(delay)
+                    elif cancel_event.wait(delay):
+                        raise InterruptedError("任务已取消")
+            yield
+        finally:
+            self._semaphore.release()
+
+
+def get_provider_limiter(provider, batch_config=None):
+    """
+    获取服务商的进程级限流器（配置变化时重建）
+
+    Args:
+        provider (str): 服务商名称
+        batch_config (dict, optional): 批量问答配置
+
+    Returns:
+        ProviderLimiter: 限流器实例
+    """
+    provider_limits = (batch_config or {}).get("provider_limits", {})
+    limits = dict(DEFAULT_PROVIDER_LIMITS, **provider_limits.get("default", {}), **provider_limits.get(provider, {}))
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if (limiter is None or limiter.max_concurrency != limits["max_concurrency"]
+                or limiter.requests_per_minute != limits["requests_per_minute"]):
+            limiter = _limiters[provider] = ProviderLimiter(limits["max_concurrency"], limits["requests_per_minute"])
+        return limiter
+
+
+class BatchQAJob:
+    """批量问答任务类"""
+
+    def __init__(self, questions, ai_service, search_service=None, knowledge_base=None,
+                 batch_config=None, output_format="jsonl"):
+        """
+        初始化批量问答任务
+
+        Args:
+            questions (list): 问题列表（可包含重复问题）
+            ai_service: AI服务实例（任务独占，避免页面切换服务商影响运行中的任务）
+            search_service: 搜索服务实例，为空时不检索知识库
+            knowledge_base (str, optional): 检索的知识库名称
+            batch_config (dict, optional): 批量问答配置
+            output_format (str): 输出格式 jsonl / csv
+        """
+        batch_config = batch_config or {}
+        self.logger = logging.getLogger(__name__)
+        self.ai_service = ai_service
+        self.search_service = search_service
+        self.knowledge_base = knowledge_base
+        self.top_k = batch_config.get("top_k", 5)
+        self.semantic_ratio = batch_config.get("semantic_ratio", 0.5)
+        self.temperature = batch_config.get("temperature", 0.3)
+        self.max_tokens = batch_config.get("max_tokens", 1500)
+        self.max_retries = batch_config.get("max_retries", 2)
+        self.provider = ai_service.default_provider
+        self.limiter = get_provider_limiter(self.provider, batch_config)
+
+        # 相同问题只回答一次：规范化问题 -> 原始序号列表
+        self.questions = questions
+        self.groups = OrderedDict()
+        for index, question in enumerate(questions):
+            self.groups.setdefault(normalize_question(question), []).append(index)
+
+        self.job_id = time.strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6]
+        self.output_format = output_format
+        output_dir = batch_config.get("output_dir", "batch_results")
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_path = os.path.join(output_dir, f"{self.job_id}.{output_format}")
+
+        self.answered = 0
+        self.failed = 0
+        self.recent = deque(maxlen=5)
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def total(self):
+        """问题总数（含重复）"""
+        return len(self.questions)
+
+    @property
+    def unique_total(self):
+        """去重后的问题数"""
+        return len(self.groups)
+
+    @property
+    def running(self):
+        """任务是否仍在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def progress(self):
+        """完成比例（按去重后的问题计算）"""
+        return (self.answered + self.failed) / self.unique_total if self.unique_total else 1.0
+
+    @property
+    def elapsed(self):
+        """已运行时间（秒）"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def start(self):
+        """在后台线程中启动任务"""
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name=f"batch-qa-{self.job_id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """取消任务（已发出的请求会执行完毕）"""
+        self._cancel.set()
+
+    def _run(self):
+        """并发回答所有去重后的问题，完成一条写入一条"""
+        try:
+            with open(self.output_path, 'w', encoding='utf-8-sig' if self.output_format == "csv" else 'utf-8',
+                      newline='') as output:
+                writer = csv.DictWriter(output, fieldnames=OUTPUT_FIELDS) if self.output_format == "csv" else None
+                if writer:
+                    writer.writeheader()
+                # 线程数与服务商并发上限一致，检索阶段也按此并发
+                with ThreadPoolExecutor(max_workers=self.limiter.max_concurrency,
+                                        thread_name_prefix="batch-qa") as executor:
+                    futures = {
+                        executor.submit(self._answer, self.questions[indices[0]]): indices
+                        for indices in self.groups.values()
+                    }
+                    for future in as_completed(futures):
+                        self._write_results(output, writer, futures[future], future.result())
+        except Exception as e:
+            self.logger.error(f"批量问答任务 {self.job_id} 失败: {e}")
+        finally:
+            self.finished_at = time.time()
+
+    def _answer(self, question):
+        """
+        回答单个问题（不抛出异常）
+
+        Returns:
+            dict: {"answer", "sources", "success", "error", "latency_ms"}
+        """
+        if self._cancel.is_set():
+            return {"answer": "", "sources": "", "success": False, "error": "任务已取消", "latency_ms": 0}
+        start = time.perf_counter()
+        sources, contexts = "", {}
+        with tracer.span("batch.question", provider=self.provider, query=question[:100]) as span:
+            try:
+                if self.search_service is not None and self.knowledge_base:
+                    hits = self.search_service.search_page(question, self.knowledge_base, self.top_k, self.semantic_ratio)
+                    sources = "; ".join(hit.get('title', '无标题') for hit in hits)
+                    if hits:
+                        contexts[KNOWLEDGE_SOURCE] = format_knowledge_context(hits)
+                messages = self.ai_service.build_chat_messages(question, contexts)
+                answer = self._complete_with_retry(messages)
+                result = {"answer": answer, "sources": sources, "success": True, "error": ""}
+            except Exception as e:
+                span.set(failed=True)
+                result = {"answer": "", "sources": sources, "success": False, "error": str(e)}
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    def _complete_with_retry(self, messages):
+        """在服务商限流名额内调用模型，失败时按指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.limiter.slot(self._cancel):
+                    return self.ai_service.chat_completion(messages, self.temperature, self.max_tokens, raise_errors=True)
+            except InterruptedError:
+                raise
+            except Exception:
+                if attempt == self.max_retries or self._cancel.wait(2 ** attempt):
+                    raise
+
+    def _write_results(self, output, writer, indices, result):
+        """为同一问题的所有原始序号写入结果"""
+        with self._write_lock:
+            for position, index in enumerate(indices):
+                row = {
+                    "index": index + 1,
+                    "question": self.questions[index],
+                    "duplicate": position > 0,
+                    **result,
+                }
+                if writer:
+                    writer.writerow(row)
+                else:
+                    output.write(json.dumps(row, ensure_ascii=False) + "\n")
+            output.flush()
+            if result["success"]:
+                self.answered += 1
+            else:
+                self.failed += 1
+            self.recent.appendleft({"question": self.questions[indices[0]], **result})
+
+    def read_output(self):
+        """
+        读取当前已写入的结果（用于下载）
+
+        Returns:
+            bytes: 输出文件内容
+        """
+        with self._write_lock:
+            if not os.path.exists(self.output_path):
+                return b""
+            with open(self.output_path, 'rb') as f:
+                return f.read()
@@ -0,0 +1,296 @@
+"""
+基准测试桩服务模块
+在本地模拟向量嵌入服务、Meilisearch 搜索接口、OpenAI 兼容聊天接口（含流式）和网络搜索接口，
+每个接口的延迟分布和错误率均可配置
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# 各接口默认的延迟与错误配置
+DEFAULT_STUB_PROFILE = {
+    "embedding": {"distribution": "lognormal", "median_ms": 30, "sigma": 0.4, "error_rate": 0.0},
+    "meilisearch": {"distribution": "lognormal", "median_ms": 15, "sigma": 0.5, "error_rate": 0.0},
+    "chat": {"distribution": "lognormal", "median_ms": 400, "sigma": 0.5, "error_rate": 0.0,
+             "stream_chunks": 20, "chunk_interval_ms": 20},
+    "web_search": {"distribution": "lognormal", "median_ms": 300, "sigma": 0.6, "error_rate": 0.0},
+}
+
+_SAMPLE_TEXT = "人工智能产业链持续景气，算力需求快速增长，大模型应用加速落地。"
+
+# 拼接模拟文档正文的句子；每篇文档按编号选取不同的句子和数字，
+# 避免所有文档内容相同（共享同一个摘要缓存键、被去重合并为一篇）
+_SAMPLE_SENTENCES = [
+    _SAMPLE_TEXT,
+    "公司营业收入同比增长{n}%，毛利率环比提升。",
+    "半导体设备国产化率提升至{n}%，订单饱满。",
+    "新能源汽车渗透率达到{n}%，产业链景气度较高。",
+    "光伏组件出货量约{n}GW，价格企稳回升。",
+    "维持“买入”评级，目标价{n}元。",
+    "风险提示：下游需求不及预期，行业竞争加剧，第{n}项假设存在不确定性。",
+    "消费电子需求回暖，库存周期进入第{n}个月的补库阶段。",
+    "创新药进入医保目录，预计贡献收入{n}亿元。",
+    "数据中心资本开支增加{n}亿元，带动光模块需求。",
+]
+
+
+def sample_latency_ms(profile, rng=random):
+    """
+    按配置的分布采样一次延迟
+
+    Args:
+        profile (dict): 延迟配置，distribution 支持 fixed / uniform / lognormal
+        rng: 随机数生成器
+
+    Returns:
+        float: 延迟毫秒数
+    """
+    distribution = profile.get("distribution", "fixed")
+    median_ms = profile.get("median_ms", 0)
+    if distribution == "uniform":
+        return rng.uniform(profile.get("min_ms", 0), profile.get("max_ms", median_ms * 2))
+    if distribution == "lognormal":
+        return rng.lognormvariate(0, profile.get("sigma", 0.5)) * median_ms
+    return median_ms
+
+
+class StubServer:
+    """本地桩服务类"""
+
+    def __init__(self, profile=None, host="127.0.0.1", port=0, seed=None, dimensions=1024, documents=200):
+        """
+        初始化桩服务
+
+        Args:
+            profile (dict, optional): 各接口延迟与错误配置，会与默认配置合并
+            host (str): 监听地址
+            port (int): 监听端口，0 表示随机端口
+            seed (int, optional): 随机种子，便于复现
+            dimensions (int): 返回的向量维度
+            documents (int): 模拟索引中的文档数量
+        """
+        self.profile = {key: dict(value) for key, value in DEFAULT_STUB_PROFILE.items()}
+        for key, value in (profile or {}).items():
+            self.profile.setdefault(key, {}).update(value)
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.dimensions = dimensions
+        self.documents = [self._make_document(i) for i in range(documents)]
+        self.request_counts = {}
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """桩服务根地址"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_document(self, i):
+        """生成一条模拟研报文档"""
+        return {
+            "_sha256": f"{i:064x}",
+            "title": f"模拟研报 {i}",
+            "author": "分析师",
+            "organization": f"券商{i % 10}",
+            "industry": ["计算机", "电子", "通信", "传媒"][i % 4],
+            "publish_time": f"2024-{i % 12 + 1:02d}-01",
+            "source": "stub",
+            "content": self._make_content(i),
+        }
+
+    @staticmethod
+    def _make_content(i):
+        """生成第 i 篇文档的正文（同一编号每次生成的内容相同）"""
+        rng = random.Random(i)
+        return f"模拟研报 {i}：" + "".join(
+            rng.choice(_SAMPLE_SENTENCES).format(n=rng.randint(1, 999)) for _ in range(20)
+        )
+
+    def _delay(self, endpoint):
+        """
+        模拟接口延迟并按错误率决定是否返回错误
+
+        Args:
+            endpoint (str): 接口名称
+
+        Returns:
+            bool: 本次请求是否应返回错误
+        """
+        profile = self.profile.get(endpoint, {})
+        with self.rng_lock:
+            delay_ms = sample_latency_ms(profile, self.rng)
+            failed = self.rng.random() < profile.get("error_rate", 0.0)
+            self.request_counts[endpoint] = self.request_counts.get(endpoint, 0) + 1
+        time.sleep(delay_ms / 1000)
+        return failed
+
+    def _make_handler(self):
+        """创建请求处理类"""
+        stub = self
+
+        class StubHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _read_json(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _send_json(self, payload, status=200):
+                body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.startswith("/indexes"):
+                    if stub._delay("meilisearch"):
+                        return self._send_json({"message": "stub error", "code": "internal"}, 500)
+                    return self._send_json({
+                        "results": [{"uid": "broker_reports", "primaryKey": "_sha256",
+                                     "createdAt": "2024-01-01T00:00:00.000Z", "updatedAt": "2024-01-01T00:00:00.000Z"}],
+                        "offset": 0, "limit": 20, "total": 1,
+                    })
+                self._send_json({"message": "not found"}, 404)
+
+            def do_POST(self):
+                payload = self._read_json()
+                if self.path.startswith("/embedding"):
+                    return self._handle_embedding(payload)
+                if self.path.startswith("/indexes/") and self.path.endswith("/search"):
+                    return self._handle_search(payload)
+                if self.path.startswith("/indexes/") and self.path.endswith("/documents/fetch"):
+                    return self._handle_fetch(payload)
+                if self.path.endswith("/chat/completions"):
+                    return self._handle_chat(payload)
+                if self.path.startswith("/websearch"):
+                    return self._handle_web_search(payload)
+                self._send_json({"message": "not found"}, 404)
+
+            def _handle_embedding(self, payload):
+                if stub._delay("embedding"):
+                    return self._send_json({"error": "stub error"}, 500)
+                vector = [0.01] * stub.dimensions
+                self._send_json({"data": [
+                    {"index": i, "embedding": vector} for i in range(len(payload.get("texts", [])))
+                ]})
+
+            def _handle_search(self, payload):
+                if stub._delay("meilisearch"):
+                    return self._send_json({"message": "stub error", "code": "internal"}, 500)
+                offset = payload.get("offset", 0)
+                limit = payload.get("limit", 20)
+                hits = stub.documents[offset:offset + limit]
+                result = {
+                    "hits": hits, "query": payload.get("q", ""), "offset": offset, "limit": limit,
+                    "estimatedTotalHits": len(stub.documents), "processingTimeMs": 1,
+                }
+                if payload.get("facets"):
+                    result["facetDistribution"] = {
+                        field: dict(Counter(str(doc[field]) for doc in stub.documents if field in doc))
+                        for field in payload["facets"]
+                    }
+                self._send_json(result)
+
+            def _handle_fetch(self, payload):
+                if stub._delay("meilisearch"):
+                    return self._send_json({"message": "stub error", "code": "internal"}, 500)
+                offset = payload.get("offset", 0)
+                limit = payload.get("limit", 20)
+                fields = payload.get("fields")
+                results = stub.documents[offset:offset + limit]
+                if fields:
+                    results = [{key: doc.get(key) for key in fields if key in doc} for doc in results]
+                self._send_json({"results": results, "offset": offset, "limit": limit,
+                                 "total": len(stub.documents)})
+
+            def _handle_chat(self, payload):
+                failed = stub._delay("chat")
+                if failed:
+                    return self._send_json({"error": {"message": "stub error", "type": "server_error"}}, 500)
+                prompt_tokens = sum(len(str(m.get("content", ""))) for m in payload.get("messages", [])) // 2
+                answer = _SAMPLE_TEXT
+                if not payload.get("stream"):
+                    return self._send_json({
+                        "id": "chatcmpl-stub", "object": "chat.completion", "created": int(time.time()),
+                        "model": payload.get("model", "stub"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": answer}}],
+                        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(answer),
+                                  "total_tokens": prompt_tokens + len(answer)},
+                    })
+
+                profile = stub.profile["chat"]
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                chunks = max(1, profile.get("stream_chunks", 20))
+                piece = max(1, len(answer) // chunks)
+                for start in range(0, len(answer), piece):
+                    chunk = {
+                        "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": payload.get("model", "stub"),
+                        "choices": [{"index": 0, "delta": {"content": answer[start:start + piece]},
+                                     "finish_reason": None}],
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(profile.get("chunk_interval_ms", 20) / 1000)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _handle_web_search(self, payload):
+                if stub._delay("web_search"):
+                    return self._send_json({"error": "stub error"}, 500)
+                self._send_json({"content": f"关于“{payload.get('query', '')}”的网络搜索结果：{_SAMPLE_TEXT}"})
+
+        return StubHandler
+
+    def build_config(self):
+        """
+        生成指向桩服务的应用配置
+
+        Returns:
+            dict: 配置字典
+        """
+        return {
+            "openai": {"api_key": "stub", "base_url": f"{self.base_url}/v1", "model": "stub-chat"},
+            "meilisearch": {"url": self.base_url, "api_key": "stub"},
+            "embedding": {"url": f"{self.base_url}/embedding", "api_key": "stub", "model": "stub-embed"},
+            "search": {"default_knowledge_base": "broker_reports", "default_semantic_ratio": 0.5,
+                       "default_top_k": 10, "max_top_k": 100},
+            "web_search": {"url": f"{self.base_url}/websearch", "api_key": "stub",
+                           "default_tool": "quark_search", "timeout": 30},
+            "chat": {"max_history_length": 50, "max_message_length": 2000, "default_web_search_enabled": False},
+        }
+
+    def start(self):
+        """在后台线程启动桩服务"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """停止桩服务"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
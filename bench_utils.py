@@ -0,0 +1,33 @@
+"""
+基准测试与评估工具共用的辅助函数
+基准测试（benchmark.py）和检索效果评估（evaluate_retrieval.py）都使用这里的分位数计算和代码版本记录，
+不依赖任何外部服务
+"""
+
+import subprocess
+
+
+def percentile(sorted_values, quantile):
+    """
+    计算已排序序列的分位数
+
+    Args:
+        sorted_values (list): 已排序的数值列表
+        quantile (float): 分位点（0~1）
+
+    Returns:
+        float or None: 分位数
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(quantile * len(sorted_values)))]
+
+
+def git_revision():
+    """获取当前代码版本，便于对比不同提交的结果"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
@@ -0,0 +1,271 @@
+"""
+基准测试模块
+使用本地桩服务（或真实配置）驱动 SearchService、AIService、WebSearchService 以及完整的搜索/问答流程，
+在不同并发度下统计吞吐量和延迟分位数，并与基线结果对比
+
+运行命令: python benchmark.py --concurrency 1 4 16 --requests 200 --baseline benchmark_results/baseline.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_service import AIService
+from bench_stubs import StubServer
+from bench_utils import git_revision, percentile
+from config_manager import ConfigManager
+from dedup_service import ResultDeduplicator
+from search_service import SearchService
+from tracing import tracer
+from web_search_service import WebSearchService
+
+
+SCENARIOS = ["embedding", "search", "web_search", "chat", "chat_stream", "search_flow", "chat_flow"]
+
+BENCH_QUERIES = ["人工智能", "算力芯片", "新能源汽车", "半导体设备", "大模型应用", "消费电子", "光伏", "创新药"]
+
+
+class BenchmarkRunner:
+    """基准测试执行器类"""
+
+    def __init__(self, config_manager, enrich_top=3):
+        """
+        初始化基准测试执行器
+
+        Args:
+            config_manager: 配置管理器实例
+            enrich_top (int): 搜索流程中生成摘要/关键词的结果数量
+        """
+        self.config_manager = config_manager
+        self.search_service = SearchService(config_manager)
+        self.ai_service = AIService(config_manager)
+        self.web_search_service = WebSearchService(config_manager)
+        self.deduplicator = ResultDeduplicator(config_manager.get_dedup_config())
+        self.knowledge_base = config_manager.get_search_config().get("default_knowledge_base")
+        self.enrich_top = enrich_top
+
+    def _run_embedding(self, query):
+        return {"ok": self.search_service.get_embedding(query) is not None}
+
+    def _run_search(self, query):
+        hits, success = self.search_service.search_hybrid(query, self.knowledge_base, 10, 0.5)
+        return {"ok": success}
+
+    def _run_web_search(self, query):
+        return {"ok": self.web_search_service.search_web(query).get("success", False)}
+
+    def _run_chat(self, query):
+        # 直接调用客户端，异常即视为失败（chat_completion 会把异常转为文本）
+        response = self.ai_service.client.chat.completions.create(
+            model=self.ai_service.current_provider_config.get("model", "gpt-3.5-turbo"),
+            messages=[{"role": "user", "content": query}],
+            temperature=0.7,
+            max_tokens=256
+        )
+        return {"ok": bool(response.choices)}
+
+    def _run_chat_stream(self, query):
+        start = time.perf_counter()
+        first_token_ms = None
+        stream = self.ai_service.client.chat.completions.create(
+            model=self.ai_service.current_provider_config.get("model", "gpt-3.5-turbo"),
+            messages=[{"role": "user", "content": query}],
+            temperature=0.7,
+            max_tokens=256,
+            stream=True
+        )
+        for chunk in stream:
+            if first_token_ms is None and chunk.choices and chunk.choices[0].delta.content:
+                first_token_ms = (time.perf_counter() - start) * 1000
+        return {"ok": first_token_ms is not None, "ttft_ms": first_token_ms}
+
+    def _run_search_flow(self, query):
+        hits, success = self.search_service.search_hybrid(query, self.knowledge_base, 10, 0.5)
+        if not success:
+            return {"ok": False}
+        clusters = self.deduplicator.deduplicate(hits)
+        for cluster in clusters[:self.enrich_top]:
+            hit = cluster["primary"]
+            if hit.get("ai_summary") and hit.get("ai_keywords"):
+                continue
+            content = hit.get("content", "") or hit.get("abstract", "")
+            self.ai_service.generate_enrichment(content)
+        return {"ok": True}
+
+    def _run_chat_flow(self, query):
+        search_result = self.web_search_service.search_web(query)
+        context = None
+        if search_result.get("success"):
+            context = self.web_search_service.format_search_results(search_result)
+        answer = self.ai_service.generate_chat_response(query, context=context)
+        return {"ok": not answer.startswith(("AI回答生成失败", "生成聊天回答失败"))}
+
+    def run_scenario(self, scenario, concurrency, total_requests):
+        """
+        以指定并发度执行一个场景
+
+        Args:
+            scenario (str): 场景名称
+            concurrency (int): 并发数
+            total_requests (int): 请求总数
+
+        Returns:
+            dict: 场景统计结果
+        """
+        operation = getattr(self, f"_run_{scenario}")
+
+        def timed_call(i):
+            start = time.perf_counter()
+            try:
+                outcome = operation(BENCH_QUERIES[i % len(BENCH_QUERIES)])
+            except Exception as e:
+                outcome = {"ok": False, "error": str(e)}
+            outcome["latency_ms"] = (time.perf_counter() - start) * 1000
+            return outcome
+
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(timed_call, range(total_requests)))
+        wall_seconds = time.perf_counter() - wall_start
+
+        latencies = sorted(outcome["latency_ms"] for outcome in outcomes)
+        ttfts = sorted(outcome["ttft_ms"] for outcome in outcomes if outcome.get("ttft_ms") is not None)
+        result = {
+            "scenario": scenario,
+            "concurrency": concurrency,
+            "requests": total_requests,
+            "errors": sum(1 for outcome in outcomes if not outcome["ok"]),
+            "throughput_rps": round(total_requests / wall_seconds, 2) if wall_seconds else None,
+            "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "p50_ms": percentile(latencies, 0.5),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+        }
+        if ttfts:
+            result["ttft_p50_ms"] = percentile(ttfts, 0.5)
+            result["ttft_p95_ms"] = percentile(ttfts, 0.95)
+        return result
+
+
+def compare_with_baseline(results, baseline, threshold=0.1):
+    """
+    与基线结果对比
+
+    Args:
+        results (list): 本次结果
+        baseline (dict): 基线结果文件内容
+        threshold (float): 判定为退化的相对变化阈值
+
+    Returns:
+        list: 对比行，包含各指标的相对变化和是否退化
+    """
+    baseline_rows = {(row["scenario"], row["concurrency"]): row for row in baseline.get("results", [])}
+    comparison = []
+    for row in results:
+        base = baseline_rows.get((row["scenario"], row["concurrency"]))
+        if not base:
+            continue
+        deltas = {}
+        regressed = False
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if not base.get(metric) or row.get(metric) is None:
+                continue
+            change = (row[metric] - base[metric]) / base[metric]
+            deltas[metric] = round(change, 4)
+            # 延迟上升或吞吐下降超过阈值视为退化
+            if (metric == "throughput_rps" and change < -threshold) or (metric != "throughput_rps" and change > threshold):
+                regressed = True
+        comparison.append({"scenario": row["scenario"], "concurrency": row["concurrency"],
+                           "deltas": deltas, "regressed": regressed})
+    return comparison
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="知识库搜索系统基准测试")
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS, help="要执行的场景")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16], help="并发度列表")
+    parser.add_argument("--requests", type=int, default=100, help="每个场景每个并发度的请求数")
+    parser.add_argument("--profile", help="桩服务延迟/错误配置文件（JSON），覆盖默认值")
+    parser.add_argument("--seed", type=int, default=42, help="桩服务随机种子")
+    parser.add_argument("--config", help="使用真实服务配置文件而不启动桩服务")
+    parser.add_argument("--cache-backend", default="none", choices=["none", "memory", "sqlite", "redis"],
+                        help="桩服务模式下使用的缓存后端，默认不缓存以测量服务本身的耗时")
+    parser.add_argument("--output-dir", default="benchmark_results", help="结果保存目录")
+    parser.add_argument("--baseline", help="基线结果文件，用于对比")
+    parser.add_argument("--threshold", type=float, default=0.1, help="退化判定阈值（相对变化）")
+    parser.add_argument("--fail-on-regression", action="store_true", help="存在退化时以非零状态退出")
+    args = parser.parse_args()
+
+    profile = {}
+    if args.profile:
+        with open(args.profile, 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+
+    stub = None
+    config_path = args.config
+    if not config_path:
+        stub = StubServer(profile, seed=args.seed).start()
+        stub_config = stub.build_config()
+        stub_config["cache"] = {"backend": args.cache_backend}
+        # 问答结果缓存与共享缓存一同开关，默认测量模型调用本身的耗时
+        stub_config["chat_cache"] = (
+            {"enabled": False} if args.cache_backend == "none" else {"backend": args.cache_backend}
+        )
+        fd, config_path = tempfile.mkstemp(suffix=".json", prefix="bench_config_")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(stub_config, f, ensure_ascii=False)
+
+    try:
+        runner = BenchmarkRunner(ConfigManager(config_path))
+        results = []
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                row = runner.run_scenario(scenario, concurrency, args.requests)
+                results.append(row)
+                print(f"{scenario:<12} c={concurrency:<4} rps={row['throughput_rps']:<8} "
+                      f"p50={row['p50_ms']:.1f}ms p95={row['p95_ms']:.1f}ms p99={row['p99_ms']:.1f}ms "
+                      f"errors={row['errors']}")
+    finally:
+        if stub:
+            stub.stop()
+            os.remove(config_path)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "stubbed": stub is not None,
+            "cache_backend": args.cache_backend if stub else None,
+            "profile": stub.profile if stub else None,
+            "requests": args.requests,
+        },
+        "results": results,
+        "stages": tracer.stage_percentiles(),
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            report["comparison"] = compare_with_baseline(results, json.load(f), args.threshold)
+        for row in report["comparison"]:
+            flag = "⚠️ 退化" if row["regressed"] else "✅"
+            print(f"{flag} {row['scenario']} c={row['concurrency']} {row['deltas']}")
+        if args.fail_on_regression and any(row["regressed"] for row in report["comparison"]):
+            exit_code = 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output_path}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
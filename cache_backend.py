@@ -0,0 +1,582 @@
+"""
+共享缓存模块
+为向量嵌入、搜索结果、摘要/关键词和网络搜索结果提供统一的缓存后端，
+支持进程内（LRU）、本地磁盘（SQLite，多个工作进程共享）、两者组合的两级缓存和 Redis 协议等实现，
+均支持过期时间、容量限制和防击穿（同一键只计算一次，其他请求等待结果）
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from tracing import tracer
+
+
+# 未在配置中指定时各命名空间的默认过期时间（秒）
+DEFAULT_TTLS = {
+    "embedding": 7 * 24 * 3600,
+    "search": 300,
+    "facets": 600,
+    "enrichment": 7 * 24 * 3600,
+    "web_search": 1800,
+}
+
+# 进程级缓存实例，按配置复用，保证同一进程内所有会话共享
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def make_cache_key(*parts):
+    """
+    根据任意参数生成稳定的缓存键
+
+    Args:
+        *parts: 参与计算的参数（需可JSON序列化）
+
+    Returns:
+        str: SHA256十六进制字符串
+    """
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    """同一缓存键正在进行的一次计算"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.failed = False
+        self.waiters = 0
+
+
+class CacheBackend:
+    """缓存后端基类，子类实现 _get/_set/_delete，可选实现分布式租约"""
+
+    def __init__(self, cache_config=None):
+        """
+        初始化缓存后端
+
+        Args:
+            cache_config (dict, optional): 缓存配置
+        """
+        cache_config = cache_config or {}
+        self.logger = logging.getLogger(__name__)
+        self.default_ttl = cache_config.get("default_ttl", 3600)
+        self.ttls = dict(DEFAULT_TTLS, **cache_config.get("ttl", {}))
+        self.max_entries = cache_config.get("max_entries", 10000)
+        self.max_value_bytes = cache_config.get("max_value_bytes", 1024 * 1024)
+        self.lock_timeout = cache_config.get("lock_timeout", 30)
+        # 进行中的计算（键 -> _Flight），同一键的并发请求等待并直接取用首个请求的结果
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+
+    def ttl_for(self, namespace):
+        """获取命名空间的过期时间（秒），0 或 None 表示不过期"""
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def get(self, key):
+        """
+        读取缓存
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            object: 缓存值，不存在或已过期时返回None
+        """
+        try:
+            return self._get(key)
+        except Exception as e:
+            # 缓存故障不影响业务，视为未命中
+            self.logger.warning(f"读取缓存失败: {e}")
+            return None
+
+    def set(self, key, value, ttl=None):
+        """
+        写入缓存
+
+        Args:
+            key (str): 缓存键
+            value: 缓存值（需可JSON序列化，None 不会被缓存）
+            ttl (float, optional): 过期时间（秒）
+        """
+        if value is None:
+            return
+        try:
+            self._set(key, value, ttl)
+        except Exception as e:
+            self.logger.warning(f"写入缓存失败: {e}")
+
+    def delete(self, key):
+        """删除缓存"""
+        try:
+            self._delete(key)
+        except Exception as e:
+            self.logger.warning(f"删除缓存失败: {e}")
+
+    def get_or_compute(self, namespace, key, compute, ttl=None, cacheable=None):
+        """
+        读取缓存，未命中时计算并写入；同一键并发请求时只计算一次
+
+        Args:
+            namespace (str): 命名空间（用于区分缓存类型和统计命中率）
+            key (str): 命名空间内的缓存键
+            compute (callable): 计算函数，异常会直接抛出且不会被缓存
+            ttl (float, optional): 过期时间（秒），默认按命名空间配置
+            cacheable (callable, optional): 判断结果是否可缓存，默认缓存所有非None结果
+
+        Returns:
+            object: 缓存值或计算结果
+        """
+        full_key = f"{namespace}:{key}"
+        value = self.get(full_key)
+        if value is not None:
+            tracer.record_cache(namespace, True)
+            return value
+
+        while True:
+            with self._flights_lock:
+                flight = self._flights.get(full_key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[full_key] = _Flight()
+                else:
+                    flight.waiters += 1
+            if leader:
+                break
+            flight.done.wait()
+            if not flight.failed:
+                # 结果不可缓存（或未能写入缓存）时同样直接使用，不再重新计算
+                tracer.record_cache(namespace, True)
+                return copy.deepcopy(flight.value)
+            # 首个请求计算失败，由等待者重新竞争计算
+
+        try:
+            value = self.get(full_key)
+            hit = value is not None
+            if not hit:
+                value, hit = self._compute_with_lease(
+                    full_key, compute, ttl if ttl is not None else self.ttl_for(namespace), cacheable
+                )
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[full_key]
+            # 之后不会再有新的等待者；有等待者时保存一份副本，避免调用方修改返回值影响其他线程
+            if flight.waiters and not flight.failed:
+                flight.value = copy.deepcopy(value)
+            flight.done.set()
+        tracer.record_cache(namespace, hit)
+        return value
+
+    def _compute_with_lease(self, key, compute, ttl, cacheable):
+        """
+        获取跨进程租约后计算；租约被其他进程持有时等待其结果
+
+        Returns:
+            tuple: (值, 是否来自缓存)
+        """
+        if not self._acquire_lease(key):
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                value = self.get(key)
+                if value is not None:
+                    return value, True
+                if self._acquire_lease(key):
+                    break
+            # 等待超时（持有者可能已退出）时直接计算
+
+        try:
+            value = compute()
+            if value is not None and (cacheable is None or cacheable(value)):
+                self.set(key, value, ttl)
+            return value, False
+        finally:
+            self._release_lease(key)
+
+    def _acquire_lease(self, key):
+        """获取跨进程租约，进程内实现无需租约"""
+        return True
+
+    def _release_lease(self, key):
+        """释放跨进程租约"""
+
+    def _encode(self, value):
+        """序列化缓存值，超过大小限制时返回None"""
+        data = json.dumps(value, ensure_ascii=False)
+        if self.max_value_bytes and len(data.encode('utf-8')) > self.max_value_bytes:
+            return None
+        return data
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def _delete(self, key):
+        raise NotImplementedError
+
+
+class NullCache(CacheBackend):
+    """不缓存任何内容（用于关闭缓存或基准测试）"""
+
+    def get_or_compute(self, namespace, key, compute, ttl=None, cacheable=None):
+        """不缓存时直接计算，并发请求互不等待"""
+        tracer.record_cache(namespace, False)
+        return compute()
+
+    def _get(self, key):
+        return None
+
+    def _set(self, key, value, ttl):
+        pass
+
+    def _delete(self, key):
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """进程内LRU缓存，缓存值以 JSON 文本保存：与其他后端一样受 max_value_bytes 限制，每次读取返回新的对象"""
+
+    def __init__(self, cache_config=None):
+        super().__init__(cache_config)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 所有缓存值的估算字节数，供内存管理器使用
+        self._bytes = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, data, _ = entry
+            if expires_at and expires_at < time.time():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+        # 在锁外反序列化，调用方修改返回值不会影响缓存中的数据
+        return json.loads(data)
+
+    def _set(self, key, value, ttl):
+        data = self._encode(value)
+        if data is None:
+            return
+        expires_at = time.time() + ttl if ttl else None
+        size = sys.getsizeof(data) + sys.getsizeof(key)
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (expires_at, data, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries:
+                self._pop(next(iter(self._entries)))
+
+    def _delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def _pop(self, key):
+        """移除缓存项并更新字节数（调用方需持有锁），返回释放的字节数"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return 0
+        self._bytes -= entry[2]
+        return entry[2]
+
+    def memory_bytes(self):
+        """缓存值的估算字节数"""
+        return self._bytes
+
+    def trim(self, bytes_to_free=None):
+        """
+        按最近最少使用顺序移除缓存项
+
+        Args:
+            bytes_to_free (int, optional): 需要释放的字节数，为空时移除一半缓存项
+
+        Returns:
+            int: 实际释放的估算字节数
+        """
+        freed = 0
+        with self._lock:
+            count = len(self._entries) // 2 if bytes_to_free is None else len(self._entries)
+            while self._entries and count > 0 and (bytes_to_free is None or freed < bytes_to_free):
+                freed += self._pop(next(iter(self._entries)))
+                count -= 1
+        return freed
+
+
+class SQLiteCache(CacheBackend):
+    """本地磁盘缓存，基于 SQLite（WAL 模式），同一主机上的多个工作进程共享"""
+
+    # 访问时间的更新间隔（秒），避免每次读取都写库
+    TOUCH_INTERVAL = 60
+    # 每写入多少次检查一次容量
+    PRUNE_EVERY = 100
+
+    def __init__(self, cache_config=None):
+        super().__init__(cache_config)
+        cache_config = cache_config or {}
+        self.path = cache_config.get("sqlite_path", "cache/shared_cache.db")
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache_entries (accessed_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+
+    def _connection(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.lock_timeout, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key):
+        entry = self._get_entry(key)
+        return None if entry is None else entry[0]
+
+    def _get_entry(self, key):
+        """
+        读取缓存值及其过期时间
+
+        Returns:
+            tuple or None: (值, 过期时间戳或None)，不存在或已过期时返回None
+        """
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM cache_entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, accessed_at = row
+        now = time.time()
+        if expires_at and expires_at < now:
+            conn.execute("DELETE FROM cache_entries WHERE key = ? AND expires_at < ?", (key, now))
+            return None
+        if now - accessed_at > self.TOUCH_INTERVAL:
+            conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value), expires_at
+
+    def _set(self, key, value, ttl):
+        data = self._encode(value)
+        if data is None:
+            return
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, data, now + ttl if ttl else None, now)
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def _delete(self, key):
+        self._connection().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def prune(self):
+        """删除过期条目，并按访问时间淘汰超出容量的条目"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute("DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+        conn.execute("DELETE FROM cache_leases WHERE expires_at < ?", (now,))
+        count = conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM cache_entries WHERE key IN "
+                "(SELECT key FROM cache_entries ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def _acquire_lease(self, key):
+        try:
+            conn = self._connection()
+            now = time.time()
+            conn.execute("DELETE FROM cache_leases WHERE key = ? AND expires_at < ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO cache_leases (key, expires_at) VALUES (?, ?)",
+                (key, now + self.lock_timeout)
+            )
+            return cursor.rowcount == 1
+        except sqlite3.Error as e:
+            self.logger.warning(f"获取缓存租约失败: {e}")
+            return True
+
+    def _release_lease(self, key):
+        try:
+            self._connection().execute("DELETE FROM cache_leases WHERE key = ?", (key,))
+        except sqlite3.Error as e:
+            self.logger.warning(f"释放缓存租约失败: {e}")
+
+
+class TieredCache(MemoryCache):
+    """
+    两级缓存：进程内LRU（容量为 memory_entries）在前，SQLite 磁盘缓存在后。
+    一级未命中时读取磁盘并按剩余过期时间回填；内存管理器裁剪一级缓存时数据仍保留在磁盘上
+    """
+
+    def __init__(self, cache_config=None):
+        cache_config = cache_config or {}
+        super().__init__(dict(cache_config, max_entries=cache_config.get("memory_entries", 200)))
+        self.disk = SQLiteCache(cache_config)
+
+    def _get(self, key):
+        value = super()._get(key)
+        if value is not None:
+            return value
+        entry = self.disk._get_entry(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        super()._set(key, value, expires_at - time.time() if expires_at else None)
+        return value
+
+    def _set(self, key, value, ttl):
+        super()._set(key, value, ttl)
+        self.disk._set(key, value, ttl)
+
+    def _delete(self, key):
+        super()._delete(key)
+        self.disk._delete(key)
+
+    def _acquire_lease(self, key):
+        return self.disk._acquire_lease(key)
+
+    def _release_lease(self, key):
+        self.disk._release_lease(key)
+
+
+class RedisCache(CacheBackend):
+    """Redis 协议缓存（Redis/KeyDB/Dragonfly 等），多个副本共享；容量由服务端 maxmemory 策略控制"""
+
+    def __init__(self, cache_config=None):
+        super().__init__(cache_config)
+        cache_config = cache_config or {}
+        # redis 为可选依赖，仅在使用该后端时导入
+        import redis
+
+        self.prefix = cache_config.get("redis_prefix", "kb_cache:")
+        self.client = redis.Redis.from_url(
+            cache_config.get("redis_url", "redis://localhost:6379/0"),
+            socket_timeout=cache_config.get("redis_timeout", 2),
+            socket_connect_timeout=cache_config.get("redis_timeout", 2),
+        )
+        self.client.ping()
+
+    def _get(self, key):
+        data = self.client.get(self.prefix + key)
+        return json.loads(data) if data is not None else None
+
+    def _set(self, key, value, ttl):
+        data = self._encode(value)
+        if data is not None:
+            self.client.set(self.prefix + key, data, ex=int(ttl) if ttl else None)
+
+    def _delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def _acquire_lease(self, key):
+        try:
+            return bool(self.client.set(f"{self.prefix}lease:{key}", os.getpid(), nx=True,
+                                        px=int(self.lock_timeout * 1000)))
+        except Exception as e:
+            self.logger.warning(f"获取缓存租约失败: {e}")
+            return True
+
+    def _release_lease(self, key):
+        try:
+            self.client.delete(f"{self.prefix}lease:{key}")
+        except Exception as e:
+            self.logger.warning(f"释放缓存租约失败: {e}")
+
+
+CACHE_BACKENDS = {
+    "none": NullCache,
+    "memory": MemoryCache,
+    "sqlite": SQLiteCache,
+    "tiered": TieredCache,
+    "redis": RedisCache,
+}
+
+
+def memory_cache_bytes():
+    """
+    进程内所有内存缓存的估算字节数
+
+    Returns:
+        int: 字节数
+    """
+    with _backends_lock:
+        backends = list(_backends.values())
+    return sum(backend.memory_bytes() for backend in backends if isinstance(backend, MemoryCache))
+
+
+def trim_memory_caches(bytes_to_free=None):
+    """
+    裁剪进程内所有内存缓存（缓存内容均可重新计算）
+
+    Args:
+        bytes_to_free (int, optional): 需要释放的字节数，为空时每个缓存移除一半缓存项
+
+    Returns:
+        int: 实际释放的估算字节数
+    """
+    with _backends_lock:
+        backends = [backend for backend in _backends.values() if isinstance(backend, MemoryCache)]
+    freed = 0
+    for backend in backends:
+        remaining = None if bytes_to_free is None else bytes_to_free - freed
+        if remaining is not None and remaining <= 0:
+            break
+        freed += backend.trim(remaining)
+    return freed
+
+
+def get_cache_backend(cache_config=None):
+    """
+    获取进程级共享缓存实例（相同配置返回同一实例）
+
+    Args:
+        cache_config (dict, optional): 缓存配置，backend 可选 none / memory / sqlite / tiered / redis
+
+    Returns:
+        CacheBackend: 缓存后端实例，指定后端不可用时退化为进程内缓存
+    """
+    cache_config = cache_config or {}
+    config_key = json.dumps(cache_config, sort_keys=True)
+    with _backends_lock:
+        backend = _backends.get(config_key)
+        if backend is None:
+            backend_name = cache_config.get("backend", "memory")
+            backend_class = CACHE_BACKENDS.get(backend_name)
+            if backend_class is None:
+                raise ValueError(f"未知的缓存后端: {backend_name}")
+            try:
+                backend = backend_class(cache_config)
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"缓存后端 {backend_name} 不可用，使用进程内缓存: {e}")
+                backend = MemoryCache(cache_config)
+            _backends[config_key] = backend
+        return backend
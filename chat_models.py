@@ -0,0 +1,339 @@
+"""
+对话消息模型模块
+使用紧凑的消息表示（__slots__ 数据类、驻留的角色字符串、整数时间戳）保存对话历史，
+限制每个用户内存中的对话数和每个对话的消息数，超出部分转存到磁盘
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from memory_governor import estimate_size
+
+
+ROLE_USER = sys.intern("user")
+ROLE_ASSISTANT = sys.intern("assistant")
+
+# 联网搜索状态
+SEARCH_NONE = 0
+SEARCH_USED = 1
+SEARCH_FAILED = 2
+
+DEFAULT_SESSION = "默认对话"
+
+# 问答提示词中最多携带的历史消息数（限制数量避免token过多）
+MAX_HISTORY_MESSAGES = 10
+
+# 进程内所有用户的对话存储（弱引用，会话结束后自动移除），用于内存报告
+_live_stores = weakref.WeakValueDictionary()
+_live_stores_lock = threading.Lock()
+
+
+@dataclass(slots=True)
+class ChatMessage:
+    """单条对话消息"""
+
+    role: str
+    content: str
+    timestamp: int = 0
+    search_status: int = SEARCH_NONE
+    search_query: Optional[str] = None
+    # 回答的首字延迟（毫秒），0 表示未记录
+    ttft_ms: int = 0
+
+    @classmethod
+    def create(cls, role, content, search_info=None, ttft_ms=None):
+        """
+        创建消息（时间戳取当前时间）
+
+        Args:
+            role (str): 角色（user / assistant）
+            content (str): 消息内容
+            search_info (dict, optional): 联网搜索信息
+            ttft_ms (float, optional): 回答的首字延迟（毫秒）
+
+        Returns:
+            ChatMessage: 消息实例
+        """
+        status, query = SEARCH_NONE, None
+        if search_info:
+            if search_info.get("used_search"):
+                status = SEARCH_USED
+            elif search_info.get("search_failed"):
+                status = SEARCH_FAILED
+            query = search_info.get("query") or None
+        return cls(sys.intern(role), content, int(time.time()), status, query, int(ttft_ms or 0))
+
+    @property
+    def search_info(self):
+        """联网搜索信息（与 _generate_ai_response 返回的格式一致）"""
+        if self.search_status == SEARCH_NONE and not self.search_query:
+            return None
+        return {
+            "used_search": self.search_status == SEARCH_USED,
+            "search_failed": self.search_status == SEARCH_FAILED,
+            "query": self.search_query or "",
+        }
+
+    def to_dict(self):
+        """转换为字典（用于写入磁盘）"""
+        data = {"role": self.role, "content": self.content, "timestamp": self.timestamp}
+        if self.search_status != SEARCH_NONE:
+            data["search_status"] = self.search_status
+        if self.search_query:
+            data["search_query"] = self.search_query
+        if self.ttft_ms:
+            data["ttft_ms"] = self.ttft_ms
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """从字典恢复消息"""
+        return cls(
+            sys.intern(data["role"]),
+            data["content"],
+            data.get("timestamp", 0),
+            data.get("search_status", SEARCH_NONE),
+            data.get("search_query"),
+            data.get("ttft_ms", 0),
+        )
+
+
+class ChatSessions:
+    """单个用户的对话存储类"""
+
+    def __init__(self, owner_id, chat_config=None):
+        """
+        初始化对话存储
+
+        Args:
+            owner_id (str): 用户（浏览器会话）标识，用于区分转存目录
+            chat_config (dict, optional): 聊天配置
+        """
+        chat_config = chat_config or {}
+        self.owner_id = owner_id
+        self.max_sessions = chat_config.get("max_sessions_in_memory", 10)
+        self.max_messages = chat_config.get("max_messages_in_memory", chat_config.get("max_history_length", 50))
+        self.spill_dir = os.path.join(chat_config.get("spill_dir", "chat_spill"), owner_id)
+        # 所有对话名称（按创建顺序），以及内存中的消息列表（按最近使用顺序）
+        self._names = [DEFAULT_SESSION]
+        self._memory = OrderedDict([(DEFAULT_SESSION, [])])
+        # 每个对话转存到磁盘的较早消息数量
+        self._archived = {}
+        # 内存管理器可能在其他会话的线程中调用 offload 和 memory_bytes，所有读写都需持有该锁
+        self._lock = threading.RLock()
+
+        # 用户会话结束、存储被回收时删除转存文件
+        weakref.finalize(self, shutil.rmtree, self.spill_dir, True)
+        with _live_stores_lock:
+            _live_stores[owner_id] = self
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._names
+
+    def __len__(self):
+        with self._lock:
+            return len(self._names)
+
+    def names(self):
+        """获取所有对话名称"""
+        with self._lock:
+            return list(self._names)
+
+    def _archive_path(self, name):
+        digest = hashlib.md5(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.jsonl")
+
+    def _append_archive(self, name, messages):
+        """把消息追加到对话的磁盘归档"""
+        if not messages:
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with open(self._archive_path(name), 'a', encoding='utf-8') as f:
+            for message in messages:
+                f.write(json.dumps(message.to_dict(), ensure_ascii=False) + "\n")
+        self._archived[name] = self._archived.get(name, 0) + len(messages)
+
+    def load_archived(self, name):
+        """
+        读取对话转存到磁盘的较早消息
+
+        Args:
+            name (str): 对话名称
+
+        Returns:
+            list: 消息列表（按时间顺序）
+        """
+        path = self._archive_path(name)
+        with self._lock:
+            if not self._archived.get(name) or not os.path.exists(path):
+                return []
+            with open(path, 'r', encoding='utf-8') as f:
+                return [ChatMessage.from_dict(json.loads(line)) for line in f if line.strip()]
+
+    def _remove_archive(self, name):
+        self._archived.pop(name, None)
+        path = self._archive_path(name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def archived_count(self, name):
+        """对话已转存到磁盘的消息数量"""
+        with self._lock:
+            return self._archived.get(name, 0)
+
+    def message_count(self, name):
+        """对话的消息总数（含已转存的消息）"""
+        with self._lock:
+            return len(self._memory.get(name, ())) + self._archived.get(name, 0)
+
+    def create(self, name):
+        """新建对话"""
+        with self._lock:
+            if name not in self._names:
+                self._names.append(name)
+                self._memory[name] = []
+                self._enforce_session_cap()
+
+    def delete(self, name):
+        """删除对话及其转存文件"""
+        with self._lock:
+            if name in self._names and name != DEFAULT_SESSION:
+                self._names.remove(name)
+                self._memory.pop(name, None)
+                self._remove_archive(name)
+
+    def clear(self, name):
+        """清空对话的所有消息"""
+        with self._lock:
+            if name in self._names:
+                self._memory[name] = []
+                self._memory.move_to_end(name)
+                self._remove_archive(name)
+
+    def messages(self, name):
+        """
+        获取对话在内存中的消息（较早的消息可能已转存到磁盘）
+
+        Args:
+            name (str): 对话名称
+
+        Returns:
+            list: 消息列表
+        """
+        with self._lock:
+            if name not in self._names:
+                return []
+            if name not in self._memory:
+                self._restore(name)
+            self._memory.move_to_end(name)
+            return self._memory[name]
+
+    def recent(self, name, count):
+        """获取对话最近的若干条消息"""
+        return self.messages(name)[-count:]
+
+    def append(self, name, message):
+        """
+        追加消息，超过单个对话的内存上限时把较早的消息转存到磁盘
+
+        Args:
+            name (str): 对话名称
+            message (ChatMessage): 消息
+        """
+        with self._lock:
+            messages = self.messages(name)
+            messages.append(message)
+            if len(messages) > self.max_messages:
+                cut = len(messages) - self.max_messages
+                # 保证内存中的第一条是用户消息，重新回答时能找到对应的问题
+                while cut < len(messages) - 1 and messages[cut].role != ROLE_USER:
+                    cut += 1
+                self._append_archive(name, messages[:cut])
+                del messages[:cut]
+
+    def replace(self, name, index, message):
+        """替换对话中指定位置（内存中）的消息"""
+        with self._lock:
+            self.messages(name)[index] = message
+
+    def offload(self):
+        """把所有对话整体转存到磁盘（用户空闲时由内存管理器调用），再次访问时自动加载"""
+        with self._lock:
+            while self._memory:
+                name, messages = self._memory.popitem(last=False)
+                self._append_archive(name, messages)
+
+    def _enforce_session_cap(self):
+        """内存中的对话数超过上限时，把最久未使用的对话整体转存到磁盘（调用方需持有锁）"""
+        while len(self._memory) > self.max_sessions:
+            name, messages = self._memory.popitem(last=False)
+            self._append_archive(name, messages)
+
+    def _restore(self, name):
+        """把整体转存的对话中最近的消息加载回内存（调用方需持有锁）"""
+        archived = self.load_archived(name)
+        keep = archived[-self.max_messages:] if archived else []
+        self._remove_archive(name)
+        if len(archived) > len(keep):
+            self._append_archive(name, archived[:len(archived) - len(keep)])
+        self._memory[name] = keep
+        self._enforce_session_cap()
+
+    def memory_bytes(self):
+        """估算内存中对话数据的字节数（内存管理器在其他线程中调用）"""
+        with self._lock:
+            return estimate_size(self._memory) + estimate_size(self._names) + estimate_size(self._archived)
+
+    def memory_report(self):
+        """
+        生成各对话的内存占用报告
+
+        Returns:
+            list: [{"session", "messages_in_memory", "archived_messages", "bytes"}]
+        """
+        with self._lock:
+            rows = []
+            for name in self._names:
+                messages = self._memory.get(name)
+                rows.append({
+                    "session": name,
+                    "messages_in_memory": len(messages) if messages is not None else 0,
+                    "archived_messages": self._archived.get(name, 0),
+                    "bytes": estimate_size(messages) if messages is not None else 0,
+                })
+            return rows
+
+
+def memory_report():
+    """
+    生成进程内所有用户的对话内存报告
+
+    Returns:
+        list: [{"owner", "sessions", "messages_in_memory", "archived_messages", "bytes"}]，按字节数降序
+    """
+    with _live_stores_lock:
+        stores = list(_live_stores.values())
+    rows = []
+    for store in stores:
+        # 其他用户的存储可能正在被转存或回收，在其锁内一次性读取，保证各列一致
+        with store._lock:
+            report = store.memory_report()
+            total_bytes = store.memory_bytes()
+        rows.append({
+            "owner": store.owner_id[:8],
+            "sessions": len(report),
+            "messages_in_memory": sum(row["messages_in_memory"] for row in report),
+            "archived_messages": sum(row["archived_messages"] for row in report),
+            "bytes": total_bytes,
+        })
+    return sorted(rows, key=lambda row: row["bytes"], reverse=True)
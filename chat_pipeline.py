@@ -0,0 +1,321 @@
+"""
+问答流水线模块
+在后台事件循环中执行单轮问答：各检索来源（联网搜索、知识库）并发执行，
+上下文就绪后立即开始流式生成，页面线程只负责消费文本流；
+标题生成、指标记录等后处理在回答返回后异步执行，不占用首字延迟
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import tracer
+
+
+# 流结束标记
+_STREAM_END = object()
+
+# 进程级流水线，所有会话共享同一个事件循环和线程池
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+# 检索来源名称（作为提示词中参考信息的小标题，接口服务使用相同的名称以得到相同的提示词）
+WEB_SEARCH_SOURCE = "网络搜索结果"
+KNOWLEDGE_SOURCE = "知识库检索结果"
+
+TITLE_PROMPT = "请为以下问题生成一个不超过12个字的对话标题，只返回标题本身，不要标点和引号：\n{question}"
+
+
+class RetrievalError(Exception):
+    """检索来源返回失败结果"""
+
+
+class ChatTurn:
+    """单轮问答的结果句柄，由页面线程消费"""
+
+    def __init__(self, user_message):
+        """
+        初始化问答句柄
+
+        Args:
+            user_message (str): 用户消息
+        """
+        self.user_message = user_message
+        self.search_info = {"used_search": False, "search_failed": False}
+        self.response = ""
+        self.success = True
+        self.ttft_ms = None
+        self.total_ms = None
+        self.title = None
+        self.started = time.perf_counter()
+        self._chunks = queue.Queue()
+        self._first_chunk = threading.Event()
+        self._done = threading.Event()
+        # 后处理（标题生成等）完成后设置
+        self.post_processed = threading.Event()
+
+    def _emit(self, text, from_model=True):
+        """在流水线线程中写入一段回答文本（错误提示不计入首字延迟）"""
+        if from_model and self.ttft_ms is None:
+            self.ttft_ms = round((time.perf_counter() - self.started) * 1000, 1)
+        self.response += text
+        self._chunks.put(text)
+        self._first_chunk.set()
+
+    def _finish(self):
+        """在流水线线程中标记回答结束"""
+        self.total_ms = round((time.perf_counter() - self.started) * 1000, 1)
+        self._chunks.put(_STREAM_END)
+        self._first_chunk.set()
+        self._done.set()
+
+    def wait_first_chunk(self, timeout=None):
+        """
+        等待首段文本（或回答结束）
+
+        Returns:
+            bool: 是否在超时前等到
+        """
+        return self._first_chunk.wait(timeout)
+
+    def stream(self):
+        """
+        逐段产出回答文本（可直接传给 st.write_stream）
+
+        Yields:
+            str: 增量文本片段
+        """
+        while True:
+            item = self._chunks.get()
+            if item is _STREAM_END:
+                return
+            yield item
+
+    def result(self, timeout=None):
+        """
+        等待回答结束并返回结果（格式与原同步实现一致，另含首字延迟）
+
+        Returns:
+            dict: {"response", "search_info", "success", "ttft_ms", "total_ms"}
+        """
+        self._done.wait(timeout)
+        return {
+            "response": self.response,
+            "search_info": self.search_info,
+            "success": self.success,
+            "ttft_ms": self.ttft_ms,
+            "total_ms": self.total_ms,
+        }
+
+
+def format_knowledge_context(hits, max_chars=500):
+    """
+    把知识库检索结果格式化为提示词中的参考信息
+
+    Args:
+        hits (list): 搜索结果列表
+        max_chars (int): 每条结果保留的最大字符数
+
+    Returns:
+        str: 参考信息文本
+    """
+    return "\n\n".join(
+        f"{i}. {hit.get('title', '无标题')}\n"
+        f"{(hit.get('ai_summary') or hit.get('abstract') or hit.get('content', ''))[:max_chars]}"
+        for i, hit in enumerate(hits, 1)
+    )
+
+
+class ChatPipeline:
+    """问答流水线类"""
+
+    def __init__(self, pipeline_config=None):
+        """
+        初始化流水线并启动后台事件循环
+
+        Args:
+            pipeline_config (dict, optional): 流水线配置
+        """
+        self.logger = logging.getLogger(__name__)
+        self.executor = None
+        self.max_workers = None
+        self.configure(pipeline_config)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="chat-pipeline-loop", daemon=True)
+        self.thread.start()
+        # 后处理任务的引用，避免任务未完成就被回收
+        self._background = set()
+
+    def configure(self, pipeline_config=None):
+        """
+        应用流水线配置（可重复调用，配置文件变化后自动生效）
+
+        Args:
+            pipeline_config (dict, optional): 流水线配置
+        """
+        pipeline_config = pipeline_config or {}
+        self.retrieval_timeout = pipeline_config.get("retrieval_timeout", 15)
+        self.generate_titles = pipeline_config.get("generate_titles", True)
+        self.temperature = pipeline_config.get("temperature", 0.7)
+        self.max_tokens = pipeline_config.get("max_tokens", 1500)
+        self.knowledge_base = pipeline_config.get("knowledge_base", "")
+        self.knowledge_top_k = pipeline_config.get("knowledge_top_k", 3)
+        max_workers = pipeline_config.get("max_workers", 8)
+        if max_workers != self.max_workers:
+            # 线程数变化时换用新的线程池；旧线程池不再被引用后，其线程在已提交的任务完成后退出
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat-pipeline")
+            self.max_workers = max_workers
+
+    def start_turn(self, user_message, history, ai_service, web_search_service=None, search_service=None,
+                   use_cache=True):
+        """
+        提交一轮问答，立即返回结果句柄
+
+        Args:
+            user_message (str): 用户消息
+            history (list): 本轮之前的对话历史 [{"role", "content"}]（需在页面线程中复制）
+            ai_service: AI服务实例
+            web_search_service: 网络搜索服务实例，为空时不联网搜索
+            search_service: 搜索服务实例，配置了 knowledge_base 时用于检索知识库
+            use_cache (bool): 是否读取问答结果缓存（重新回答时为False）
+
+        Returns:
+            ChatTurn: 问答句柄
+        """
+        turn = ChatTurn(user_message)
+        sources = {}
+        if web_search_service is not None:
+            if web_search_service.available:
+                sources[WEB_SEARCH_SOURCE] = functools.partial(self._search_web, web_search_service, user_message)
+            else:
+                # 网络搜索熔断期间不等待，直接不带网络搜索结果回答
+                turn.search_info = {"used_search": False, "search_failed": True, "query": user_message,
+                                    "error": "网络搜索暂不可用（已熔断）"}
+        if search_service is not None and self.knowledge_base:
+            sources[KNOWLEDGE_SOURCE] = functools.partial(self._search_knowledge_base, search_service, user_message)
+
+        # 在调用线程的追踪上下文中运行，使流水线的片段挂在 chat.turn 之下
+        context = contextvars.copy_context()
+        coroutine = self._run_turn(turn, list(history), ai_service, sources, use_cache)
+        self.loop.call_soon_threadsafe(functools.partial(self._spawn, coroutine, context))
+        return turn
+
+    def _spawn(self, coroutine, context=None):
+        """在事件循环中创建任务并保留引用"""
+        task = self.loop.create_task(coroutine, context=context)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _run_blocking(self, func, *args):
+        """在线程池中执行阻塞调用（保留追踪上下文）"""
+        context = contextvars.copy_context()
+        return await self.loop.run_in_executor(self.executor, functools.partial(context.run, func, *args))
+
+    async def _run_turn(self, turn, history, ai_service, sources, use_cache=True):
+        """执行检索、生成，并在回答结束后安排后处理"""
+        with tracer.span("chat.pipeline", provider=ai_service.default_provider) as span:
+            try:
+                contexts = await self._retrieve(turn, sources)
+                span.set(retrieval_ms=round((time.perf_counter() - turn.started) * 1000, 1))
+                messages = ai_service.build_chat_messages(turn.user_message, contexts, history)
+                await self._run_blocking(self._stream_completion, turn, ai_service, messages, use_cache)
+            except Exception as e:
+                turn.success = False
+                if turn.response:
+                    turn._emit(f"\n\n（回答生成中断: {str(e)}）", from_model=False)
+                else:
+                    turn._emit(f"抱歉，生成回答时发生错误: {str(e)}", from_model=False)
+            finally:
+                turn._finish()
+            span.set(ttft_ms=turn.ttft_ms, success=turn.success)
+
+        self._spawn(self._post_process(turn, history, ai_service))
+
+    async def _retrieve(self, turn, sources):
+        """
+        并发执行所有检索来源，单个来源失败或超时不影响其他来源
+
+        Returns:
+            dict: 来源名称 -> 格式化后的检索结果
+        """
+        if not sources:
+            return {}
+        names = list(sources)
+        results = await asyncio.gather(
+            *(asyncio.wait_for(self._run_blocking(sources[name]), self.retrieval_timeout) for name in names),
+            return_exceptions=True
+        )
+        contexts = {}
+        for name, result in zip(names, results):
+            if isinstance(result, BaseException):
+                error = "检索超时" if isinstance(result, asyncio.TimeoutError) else str(result)
+                self.logger.warning(f"{name}获取失败: {error}")
+                if name == WEB_SEARCH_SOURCE:
+                    turn.search_info = {"used_search": False, "search_failed": True,
+                                        "query": turn.user_message, "error": error}
+            elif result:
+                contexts[name] = result
+                if name == WEB_SEARCH_SOURCE:
+                    turn.search_info = {"used_search": True, "search_failed": False, "query": turn.user_message}
+        return contexts
+
+    @staticmethod
+    def _search_web(web_search_service, query):
+        """联网搜索来源"""
+        search_result = web_search_service.search_web(query)
+        if not search_result.get("success", False):
+            raise RetrievalError(search_result.get("error", "搜索失败"))
+        return web_search_service.format_search_results(search_result)
+
+    def _search_knowledge_base(self, search_service, query):
+        """知识库检索来源"""
+        semantic_ratio = search_service.config_manager.get_search_config().get("default_semantic_ratio", 0.5)
+        hits = search_service.search_page(query, self.knowledge_base, self.knowledge_top_k, semantic_ratio)
+        return format_knowledge_context(hits)
+
+    def _stream_completion(self, turn, ai_service, messages, use_cache=True):
+        """在线程池中消费模型的流式输出"""
+        for delta in ai_service.chat_completion_stream(messages, self.temperature, self.max_tokens, use_cache):
+            turn._emit(delta)
+
+    async def _post_process(self, turn, history, ai_service):
+        """后处理：记录指标；对话首轮成功时生成标题"""
+        try:
+            if turn.ttft_ms is not None:
+                tracer.observe("chat.ttft", turn.ttft_ms, provider=ai_service.default_provider)
+            tracer.increment("chat_turns", label="success" if turn.success else "failed")
+
+            if self.generate_titles and turn.success and not history:
+                messages = [{"role": "user", "content": TITLE_PROMPT.format(question=turn.user_message[:500])}]
+                with tracer.span("chat.title", provider=ai_service.default_provider):
+                    title = await self._run_blocking(ai_service.chat_completion, messages, 0.3, 30, True)
+                if title:
+                    turn.title = title.strip().strip('"“”《》').splitlines()[0][:20]
+        except Exception as e:
+            self.logger.warning(f"问答后处理失败: {e}")
+        finally:
+            turn.post_processed.set()
+
+
+def get_chat_pipeline(pipeline_config=None):
+    """
+    获取进程级问答流水线，传入配置时同时更新其配置
+
+    Args:
+        pipeline_config (dict, optional): 流水线配置
+
+    Returns:
+        ChatPipeline: 流水线实例
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = ChatPipeline(pipeline_config)
+        elif pipeline_config is not None:
+            _pipeline.configure(pipeline_config)
+        return _pipeline
@@ -0,0 +1,223 @@
+"""
+熔断器模块
+为每个外部依赖（向量嵌入服务、Meilisearch、网络搜索、各AI服务商）维护一个进程级熔断器：
+连续失败达到阈值后进入打开状态，期间请求直接失败而不再等待超时；
+冷却时间过后进入半开状态，只放行少量探测请求，成功则恢复，失败则重新打开
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from tracing import tracer
+
+
+# 熔断器状态
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# 进程级熔断器，按依赖名称复用，所有会话共享同一状态
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开时拒绝请求"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} 暂不可用（已熔断，{retry_after:.0f} 秒后重试）")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """熔断器类"""
+
+    def __init__(self, name, breaker_config=None):
+        """
+        初始化熔断器
+
+        Args:
+            name (str): 依赖名称，如 embedding、meilisearch、web_search、llm:openai
+            breaker_config (dict, optional): 熔断配置
+        """
+        self.name = name
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.last_error = ""
+        self.configure(breaker_config)
+
+    def configure(self, breaker_config=None):
+        """
+        更新熔断参数（保留当前状态）
+
+        Args:
+            breaker_config (dict, optional): 熔断配置
+        """
+        breaker_config = breaker_config or {}
+        with self.lock:
+            self.enabled = breaker_config.get("enabled", True)
+            self.failure_threshold = max(1, breaker_config.get("failure_threshold", 5))
+            self.recovery_timeout = breaker_config.get("recovery_timeout", 30)
+            self.half_open_max_calls = max(1, breaker_config.get("half_open_max_calls", 1))
+
+    def allow(self):
+        """
+        判断是否放行请求（半开状态下占用一个探测名额）
+
+        Returns:
+            bool: 是否放行
+        """
+        if not self.enabled:
+            return True
+        with self.lock:
+            if self.state == STATE_OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    return False
+                self._transition(STATE_HALF_OPEN)
+            if self.state == STATE_HALF_OPEN:
+                if self.probes >= self.half_open_max_calls:
+                    return False
+                self.probes += 1
+            return True
+
+    def retry_after(self):
+        """距离下次允许探测的秒数"""
+        with self.lock:
+            return max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+
+    def record_success(self):
+        """记录一次成功调用"""
+        with self.lock:
+            self.failures = 0
+            if self.state != STATE_CLOSED:
+                self._transition(STATE_CLOSED)
+
+    def record_failure(self, error=None):
+        """
+        记录一次失败调用
+
+        Args:
+            error (Exception, optional): 失败原因
+        """
+        with self.lock:
+            if error is not None:
+                self.last_error = str(error)[:200]
+            self.failures += 1
+            if self.state == STATE_HALF_OPEN or (self.state == STATE_CLOSED
+                                                 and self.failures >= self.failure_threshold):
+                self._transition(STATE_OPEN)
+
+    def release(self):
+        """归还未得出结果的探测名额（如调用方提前停止）"""
+        with self.lock:
+            if self.state == STATE_HALF_OPEN and self.probes:
+                self.probes -= 1
+
+    def _transition(self, state):
+        """切换状态（调用方需持有锁）"""
+        self.state = state
+        self.probes = 0
+        if state == STATE_OPEN:
+            self.opened_at = time.monotonic()
+            self.logger.warning(f"{self.name} 连续失败 {self.failures} 次，熔断 {self.recovery_timeout} 秒: "
+                                f"{self.last_error}")
+        else:
+            self.logger.info(f"{self.name} 熔断器状态: {state}")
+        tracer.increment("circuit_breaker", label=f"{self.name}:{state}")
+
+    @contextmanager
+    def protect(self, is_failure=None):
+        """
+        保护一次外部调用：熔断时直接抛出 CircuitOpenError，否则按调用结果更新状态
+
+        Args:
+            is_failure (callable, optional): 判断异常是否说明依赖不健康（如 4xx 请求错误不计入），默认所有异常都计入
+
+        Raises:
+            CircuitOpenError: 熔断器打开时抛出
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+        try:
+            yield self
+        except Exception as e:
+            if is_failure is None or is_failure(e):
+                self.record_failure(e)
+            else:
+                self.record_success()
+            raise
+        except BaseException:
+            self.release()
+            raise
+        else:
+            self.record_success()
+
+    @property
+    def available(self):
+        """是否可以发起请求（不占用探测名额）"""
+        if not self.enabled:
+            return True
+        with self.lock:
+            return self.state != STATE_OPEN or time.monotonic() - self.opened_at >= self.recovery_timeout
+
+    def status(self):
+        """
+        获取熔断器状态
+
+        Returns:
+            dict: 名称、状态、连续失败次数、剩余熔断时间和最近一次错误
+        """
+        with self.lock:
+            retry_after = (max(0.0, self.opened_at + self.recovery_timeout - time.monotonic())
+                           if self.state == STATE_OPEN else 0.0)
+            return {
+                "name": self.name,
+                "state": self.state,
+                "failures": self.failures,
+                "retry_after": round(retry_after, 1),
+                "last_error": self.last_error,
+            }
+
+
+def get_circuit_breaker(name, breaker_config=None):
+    """
+    获取进程级共享的熔断器（同名依赖返回同一实例，配置变化时更新参数）
+
+    Args:
+        name (str): 依赖名称；带服务商后缀时（如 llm:openai）按前缀查找单独配置
+        breaker_config (dict, optional): circuit_breaker 配置节，dependencies 中可按依赖覆盖参数
+
+    Returns:
+        CircuitBreaker: 熔断器实例
+    """
+    breaker_config = breaker_config or {}
+    overrides = breaker_config.get("dependencies", {})
+    settings = dict(breaker_config, **overrides.get(name.split(":")[0], {}), **overrides.get(name, {}))
+    settings.pop("dependencies", None)
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name, settings)
+            _breakers[name] = breaker
+        else:
+            breaker.configure(settings)
+        return breaker
+
+
+def circuit_breaker_states():
+    """
+    获取所有熔断器的状态
+
+    Returns:
+        list: 各依赖的状态字典，按名称排序
+    """
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return sorted((breaker.status() for breaker in breakers), key=lambda item: item["name"])
@@ -3,42 +3,354 @@
 负责加载和管理应用程序配置
 """
 
+import copy
+import errno
 import json
+import logging
 import os
+import tempfile
+import threading
+import time
+import weakref
 import streamlit as st
+from contextlib import contextmanager
+from tracing import tracer
 
+try:
+    import fcntl
+except ImportError:
+    # Windows 等平台没有 fcntl，退化为独占创建锁文件
+    fcntl = None
 
-class ConfigManager:
-    """配置管理器类"""
+
+# 检查配置文件是否变化的最小间隔（秒）
+CONFIG_CHECK_INTERVAL = 2.0
+
+# 配置版本号字段，每次保存时递增，用于乐观并发控制
+VERSION_KEY = "_version"
+
+# 等待配置文件锁的最长时间（秒）
+LOCK_TIMEOUT = 10
+
+# 未指定配置文件路径时的默认值，可用环境变量 CONFIG_PATH 覆盖（如容器中挂载的配置目录）
+DEFAULT_CONFIG_PATH = os.environ.get("CONFIG_PATH", "config.json")
+
+# 进程级配置存储，按配置文件绝对路径复用
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class ConfigVersionConflict(Exception):
+    """保存配置时发现配置已被其他会话或进程修改"""
+
+
+@contextmanager
+def config_file_lock(config_path, timeout=LOCK_TIMEOUT):
+    """
+    获取配置文件的跨进程写锁（锁文件为 <配置文件>.lock）
+    
+    Args:
+        config_path (str): 配置文件路径
+        timeout (float): 等待锁的最长时间（秒）
+        
+    Raises:
+        TimeoutError: 超时未获取到锁时抛出
+    """
+    lock_path = f"{config_path}.lock"
+    deadline = time.monotonic() + timeout
+    if fcntl is not None:
+        with open(lock_path, 'a') as lock_file:
+            while True:
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"等待配置文件锁超时: {lock_path}")
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        return
     
-    def __init__(self, config_path="config.json"):
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            # 持有者异常退出遗留的锁文件，超过超时时间后视为失效
+            try:
+                if time.time() - os.path.getmtime(lock_path) > timeout:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                pass
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"等待配置文件锁超时: {lock_path}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock_path)
+
+
+def write_config_atomic(config_path, config):
+    """
+    原子写入配置文件：先写入同目录临时文件并刷盘，再重命名覆盖
+    
+    Args:
+        config_path (str): 配置文件路径
+        config (dict): 配置字典
+    """
+    data = json.dumps(config, ensure_ascii=False, indent=2)
+    directory = os.path.dirname(os.path.abspath(config_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".config_", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.replace(tmp_path, config_path)
+        except OSError as e:
+            # 单文件绑定挂载不允许重命名覆盖，只能退化为原地写入（写入中途崩溃仍可能损坏文件），
+            # 部署时应挂载配置所在目录（见 docker-compose.yml）
+            if e.errno not in (errno.EBUSY, errno.EXDEV, errno.EPERM):
+                raise
+            logging.getLogger(__name__).warning(
+                f"无法原子替换 {config_path}（{e.strerror}），已改为原地写入；请挂载配置目录而不是单个文件"
+            )
+            with open(config_path, 'r+', encoding='utf-8') as f:
+                f.write(data)
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ConfigStore:
+    """进程级配置存储类，只解析一次配置文件，定期检查文件变化并通知订阅者"""
+    
+    def __init__(self, config_path, check_interval=CONFIG_CHECK_INTERVAL):
         """
-        初始化配置管理器
+        初始化配置存储
         
         Args:
             config_path (str): 配置文件路径
+            check_interval (float): 检查文件变化的最小间隔（秒）
+            
+        Raises:
+            Exception: 配置文件不存在或解析失败时抛出
         """
         self.config_path = config_path
-        self.config = self._load_config()
+        self.check_interval = check_interval
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._subscribers = []
+        self._last_check = time.monotonic()
+        self._signature = self._stat()
+        self._config = self._read()
+        # 每次发布新配置时递增
+        self.revision = 1
     
-    def _load_config(self):
+    def _stat(self):
+        """获取文件签名（修改时间、inode、大小），文件被替换或修改时会变化"""
+        stat = os.stat(self.config_path)
+        return stat.st_mtime_ns, stat.st_ino, stat.st_size
+    
+    def _read(self):
+        """读取并解析配置文件"""
+        with tracer.span("config.load"):
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    
+    @property
+    def version(self):
+        """当前配置版本号（每次通过 save_config 保存时递增）"""
+        return self._config.get(VERSION_KEY, 0)
+    
+    def save(self, new_config, expected_version=None):
         """
-        加载配置文件
+        在文件锁保护下原子保存配置并发布
+        
+        Args:
+            new_config (dict): 新的配置字典
+            expected_version (int, optional): 读取配置时的版本号，与文件中的版本不一致时拒绝保存
+            
+        Returns:
+            int: 保存后的版本号
+            
+        Raises:
+            ConfigVersionConflict: 配置已被其他会话或进程修改时抛出
+        """
+        with config_file_lock(self.config_path):
+            # 以文件中的版本为准，其他进程的修改同样能被检测到
+            try:
+                current_version = self._read().get(VERSION_KEY, 0)
+            except Exception:
+                current_version = self.version
+            if expected_version is not None and expected_version != current_version:
+                raise ConfigVersionConflict(
+                    f"配置已被修改（当前版本 {current_version}，读取时版本 {expected_version}）"
+                )
+            new_config = dict(new_config)
+            new_config[VERSION_KEY] = current_version + 1
+            write_config_atomic(self.config_path, new_config)
+        self.publish(new_config)
+        return new_config[VERSION_KEY]
+    
+    def get(self):
+        """
+        获取当前配置快照（调用方不应修改返回的字典）
         
         Returns:
             dict: 配置字典
         """
+        self.check_for_changes()
+        return self._config
+    
+    def check_for_changes(self, force=False):
+        """
+        检查配置文件是否被外部修改，变化时重新加载并通知订阅者
+        
+        Args:
+            force (bool): 是否忽略检查间隔立即检查
+        """
+        now = time.monotonic()
+        if not force and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if not force and now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            try:
+                signature = self._stat()
+                if signature == self._signature:
+                    return
+                new_config = self._read()
+            except Exception as e:
+                # 文件正在写入或格式错误时保留当前配置，下次检查时重试
+                self.logger.warning(f"重新加载配置文件失败，继续使用当前配置: {e}")
+                return
+            self._signature = signature
+        self.logger.info(f"检测到配置文件变化，已重新加载: {self.config_path}")
+        self.publish(new_config)
+    
+    def publish(self, new_config):
+        """
+        发布新配置：原子替换当前快照并通知订阅者
+        
+        Args:
+            new_config (dict): 新的配置字典
+        """
+        new_config = copy.deepcopy(new_config)
+        with self._lock:
+            old_config = self._config
+            self._config = new_config
+            self.revision += 1
+            try:
+                self._signature = self._stat()
+            except OSError:
+                pass
+            subscribers = list(self._subscribers)
+        
+        for ref, sections in subscribers:
+            callback = ref()
+            if callback is None:
+                continue
+            if sections is not None and all(old_config.get(key) == new_config.get(key) for key in sections):
+                continue
+            try:
+                callback(old_config, new_config)
+            except Exception as e:
+                self.logger.warning(f"配置变更通知失败: {e}")
+        self._prune_subscribers()
+    
+    def subscribe(self, callback, sections=None):
+        """
+        订阅配置变更（只保存弱引用，订阅者被回收后自动失效）
+        
+        Args:
+            callback (callable): 回调函数，参数为 (旧配置, 新配置)
+            sections (iterable, optional): 关注的配置节，只有这些节变化时才通知；None 表示任何变化都通知
+        """
+        ref = weakref.WeakMethod(callback) if hasattr(callback, "__self__") else weakref.ref(callback)
+        with self._lock:
+            self._subscribers.append((ref, tuple(sections) if sections is not None else None))
+    
+    def _prune_subscribers(self):
+        """清理已失效的订阅者"""
+        with self._lock:
+            self._subscribers = [entry for entry in self._subscribers if entry[0]() is not None]
+
+
+def get_config_store(config_path=DEFAULT_CONFIG_PATH):
+    """
+    获取进程级配置存储（同一路径只解析一次）
+    
+    Args:
+        config_path (str): 配置文件路径
+        
+    Returns:
+        ConfigStore: 配置存储实例
+    """
+    path = os.path.abspath(config_path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = ConfigStore(path)
+        return store
+
+
+class ConfigManager:
+    """配置管理器类"""
+    
+    def __init__(self, config_path=None):
+        """
+        初始化配置管理器
+        
+        Args:
+            config_path (str, optional): 配置文件路径，默认为环境变量 CONFIG_PATH 或 config.json
+        """
+        self.config_path = config_path or DEFAULT_CONFIG_PATH
+        self.store = self._load_store()
+    
+    def _load_store(self):
+        """
+        获取共享配置存储（首次使用时加载配置文件）
+        
+        Returns:
+            ConfigStore: 配置存储实例
+        """
         if not os.path.exists(self.config_path):
             st.error(f"配置文件 {self.config_path} 不存在！")
             st.stop()
         
         try:
-            with open(self.config_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return get_config_store(self.config_path)
         except Exception as e:
             st.error(f"读取配置文件失败：{str(e)}")
             st.stop()
     
+    @property
+    def config(self):
+        """当前配置快照"""
+        return self.store.get()
+    
+    def subscribe(self, callback, sections=None):
+        """
+        订阅配置变更
+        
+        Args:
+            callback (callable): 回调函数，参数为 (旧配置, 新配置)
+            sections (iterable, optional): 关注的配置节，None 表示任何变化都通知
+        """
+        self.store.subscribe(callback, sections)
+    
     def get_openai_config(self):
         """获取OpenAI配置"""
         return self.config.get("openai", {})
@@ -63,6 +375,70 @@ class ConfigManager:
         """获取聊天配置"""
         return self.config.get("chat", {})
     
+    def get_dedup_config(self):
+        """获取结果去重配置"""
+        return self.config.get("dedup", {})
+    
+    def get_ingest_config(self):
+        """获取文档导入配置"""
+        return self.config.get("ingest", {})
+    
+    def get_enrichment_config(self):
+        """获取离线增强任务配置"""
+        return self.config.get("enrichment", {})
+    
+    def get_suggestion_config(self):
+        """获取搜索建议配置"""
+        return self.config.get("suggestion", {})
+    
+    def get_tracing_config(self):
+        """获取链路追踪配置"""
+        return self.config.get("tracing", {})
+    
+    def get_api_config(self):
+        """获取HTTP接口服务配置"""
+        return self.config.get("api", {})
+    
+    def get_cache_config(self):
+        """获取共享缓存配置"""
+        return self.config.get("cache", {})
+    
+    def get_prefetch_config(self):
+        """获取后台预取配置"""
+        return self.config.get("prefetch", {})
+    
+    def get_memory_config(self):
+        """获取内存管理配置"""
+        return self.config.get("memory", {})
+    
+    def get_chat_pipeline_config(self):
+        """获取问答流水线配置"""
+        return self.config.get("chat_pipeline", {})
+    
+    def get_batch_qa_config(self):
+        """获取批量问答配置"""
+        return self.config.get("batch_qa", {})
+    
+    def get_export_config(self):
+        """获取搜索结果导出配置"""
+        return self.config.get("export", {})
+    
+    def get_facet_config(self):
+        """获取分面筛选配置"""
+        return self.config.get("facets", {})
+    
+    def get_chat_cache_config(self):
+        """获取问答结果缓存配置"""
+        return self.config.get("chat_cache", {})
+    
+    def get_local_embedding_config(self):
+        """获取本地嵌入模型配置"""
+        return self.config.get("local_embedding", {})
+    
+    def get_circuit_breaker_config(self):
+        """获取外部依赖熔断配置"""
+        return self.config.get("circuit_breaker", {})
+    
     def get_config(self, key=None):
         """
         获取配置项
@@ -77,18 +453,31 @@ class ConfigManager:
             return self.config
         return self.config.get(key, {})
     
-    def save_config(self, new_config):
+    def save_config(self, new_config, expected_version=None):
         """
-        保存配置到文件
+        保存配置到文件（原子写入，跨进程加锁）
         
         Args:
             new_config (dict): 新的配置字典
+            expected_version (int, optional): 读取配置时的版本号，用于检测并发修改
+            
+        Returns:
+            bool: 是否保存成功
         """
         try:
-            with open(self.config_path, 'w', encoding='utf-8') as f:
-                json.dump(new_config, f, ensure_ascii=False, indent=2)
-            self.config = new_config
+            # 保存后通知本进程内所有会话的服务，其他进程会通过文件检查发现变化
+            self.store.save(new_config, expected_version)
             return True
+        except ConfigVersionConflict:
+            # 立即加载其他会话保存的配置，重新提交时即可基于最新版本
+            self.store.check_for_changes(force=True)
+            st.warning("⚠️ 配置已被其他会话修改，已加载最新配置，请确认后重新保存")
+            return False
         except Exception as e:
             st.error(f"保存配置文件失败：{str(e)}")
-            return False
\ No newline at end of file
+            return False
+    
+    @property
+    def version(self):
+        """当前配置版本号"""
+        return self.store.version
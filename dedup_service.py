@@ -0,0 +1,384 @@
+"""
+结果去重模块
+负责对搜索结果进行精确去重（SHA256）和近似去重（MinHash）
+
+预计算签名缓存: python dedup_service.py --index broker_reports --output cache/dedup_signatures.json
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from tracing import tracer
+
+
+# MinHash 使用的梅森素数，保证哈希排列在 [0, 2^61-1) 范围内
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+_LOW_61_MASK = np.uint64(_MERSENNE_PRIME)
+_LOW_29_MASK = np.uint64((1 << 29) - 1)
+_LOW_32_MASK = np.uint64(_MAX_HASH)
+
+# 进程级签名缓存，避免每次页面重跑都重新计算签名
+_shared_signature_cache = {}
+_shared_cache_lock = threading.Lock()
+
+
+def _mod_mersenne(x):
+    """
+    逐元素把小于 2^63 的值对 2^61-1 取模（利用 2^61 ≡ 1 折叠高位，比整数除法快）
+
+    Args:
+        x (np.ndarray): uint64 数组
+
+    Returns:
+        np.ndarray: 取模结果（uint64）
+    """
+    x = (x >> np.uint64(61)) + (x & _LOW_61_MASK)
+    return x - _LOW_61_MASK * (x >= _LOW_61_MASK)
+
+
+def _mulmod_mersenne(a, h):
+    """
+    逐元素计算 (a * h) mod (2^61-1) 的同余值（小于 2^62），不会溢出 uint64
+
+    Args:
+        a (np.ndarray): 小于 2^61 的乘数（uint64）
+        h (np.ndarray): 小于 2^32 的乘数（uint64），可与 a 广播
+
+    Returns:
+        np.ndarray: 与 a * h 模 2^61-1 同余的值（uint64）
+    """
+    # a = a_hi * 2^32 + a_lo，两部分与 h 的乘积都在 uint64 范围内（a_hi * h < 2^61）
+    low = (a & _LOW_32_MASK) * h
+    high = (a >> np.uint64(32)) * h
+    # high * 2^32 mod p：利用 2^61 ≡ 1 (mod p) 把溢出部分折回低位
+    high = (high >> np.uint64(29)) + ((high & _LOW_29_MASK) << np.uint64(32))
+    low = (low >> np.uint64(61)) + (low & _LOW_61_MASK)
+    return high + low
+
+
+def get_document_sha256(hit):
+    """
+    获取文档的SHA256标识
+
+    Args:
+        hit (dict): 搜索结果项
+
+    Returns:
+        str: SHA256字符串，不存在时返回空字符串
+    """
+    return hit.get('_sha256') or hit.get('file_sha256') or ''
+
+
+class ResultDeduplicator:
+    """搜索结果去重器类"""
+
+    def __init__(self, dedup_config=None, signature_cache=None):
+        """
+        初始化去重器
+
+        Args:
+            dedup_config (dict, optional): 去重配置
+            signature_cache (dict, optional): 签名缓存，默认使用进程级共享缓存
+        """
+        dedup_config = dedup_config or {}
+        self.enabled = dedup_config.get("enabled", True)
+        self.num_perm = dedup_config.get("num_perm", 64)
+        self.shingle_size = dedup_config.get("shingle_size", 5)
+        self.threshold = dedup_config.get("near_duplicate_threshold", 0.8)
+        self.bands = dedup_config.get("lsh_bands", 16)
+        self.max_content_chars = dedup_config.get("max_content_chars", 3000)
+        self.max_cache_entries = dedup_config.get("max_cache_entries", 50000)
+        self.cache_path = dedup_config.get("signature_cache_path", "")
+
+        self.signature_cache = _shared_signature_cache if signature_cache is None else signature_cache
+
+        # 固定种子生成哈希排列参数，保证签名可跨进程复用
+        permutations = [
+            (self._seed_int(f"a{i}") % (_MERSENNE_PRIME - 1) + 1,
+             self._seed_int(f"b{i}") % _MERSENNE_PRIME)
+            for i in range(self.num_perm)
+        ]
+        # 列向量形式，与 shingle 哈希行向量广播后一次算出所有排列
+        self._perm_a = np.array([a for a, _ in permutations], dtype=np.uint64)[:, None]
+        self._perm_b = np.array([b for _, b in permutations], dtype=np.uint64)[:, None]
+
+        if self.cache_path and not self.signature_cache:
+            self.load_cache(self.cache_path)
+
+    @staticmethod
+    def _seed_int(seed):
+        """根据种子字符串生成稳定整数"""
+        return int.from_bytes(hashlib.blake2b(seed.encode('utf-8'), digest_size=8).digest(), 'big')
+
+    def _shingles(self, text):
+        """
+        生成字符级shingle的哈希集合（中文文本按字符切分效果更好）
+
+        Args:
+            text (str): 文本内容
+
+        Returns:
+            set: shingle哈希集合
+        """
+        text = "".join(text[:self.max_content_chars].split())
+        if len(text) < self.shingle_size:
+            return {self._seed_int(text) & _MAX_HASH} if text else set()
+        return {
+            int.from_bytes(
+                hashlib.blake2b(text[i:i + self.shingle_size].encode('utf-8'), digest_size=4).digest(),
+                'big'
+            )
+            for i in range(len(text) - self.shingle_size + 1)
+        }
+
+    def _cache_key(self, hit, content):
+        """获取签名缓存键，优先使用SHA256，否则使用内容摘要"""
+        sha = get_document_sha256(hit)
+        if sha:
+            return sha
+        return hashlib.md5(content[:self.max_content_chars].encode('utf-8')).hexdigest()
+
+    def compute_signature(self, text):
+        """
+        计算文本的MinHash签名
+
+        Args:
+            text (str): 文本内容
+
+        Returns:
+            tuple: MinHash签名
+        """
+        shingles = self._shingles(text)
+        if not shingles:
+            return ()
+        # 使用 numpy 对 num_perm × shingle 数的矩阵整体运算，结果与逐个计算完全一致
+        hashes = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))[None, :]
+        values = _mod_mersenne(_mulmod_mersenne(self._perm_a, hashes) + self._perm_b) & _LOW_32_MASK
+        return tuple(int(value) for value in values.min(axis=1))
+
+    def get_signature(self, hit):
+        """
+        获取搜索结果的MinHash签名（带缓存）
+
+        Args:
+            hit (dict): 搜索结果项
+
+        Returns:
+            tuple: MinHash签名
+        """
+        content = hit.get('content', '') or hit.get('abstract', '') or ''
+        key = self._cache_key(hit, content)
+        signature = self.signature_cache.get(key)
+        tracer.record_cache("dedup_signature", signature is not None)
+        if signature is None:
+            signature = self.compute_signature(content)
+            with _shared_cache_lock:
+                if len(self.signature_cache) >= self.max_cache_entries:
+                    # 简单淘汰最早写入的条目
+                    self.signature_cache.pop(next(iter(self.signature_cache)))
+                self.signature_cache[key] = signature
+        return signature
+
+    @staticmethod
+    def estimate_similarity(sig_a, sig_b):
+        """
+        通过MinHash签名估计Jaccard相似度
+
+        Args:
+            sig_a (tuple): 签名A
+            sig_b (tuple): 签名B
+
+        Returns:
+            float: 相似度（0~1）
+        """
+        if not sig_a or not sig_b or len(sig_a) != len(sig_b):
+            return 0.0
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+    def deduplicate(self, hits):
+        """
+        对搜索结果进行去重聚类
+
+        Args:
+            hits (list): 搜索结果列表
+
+        Returns:
+            list: 聚类列表，每项为 {"primary": 代表结果, "duplicates": 重复结果列表}，
+                  按代表结果在原列表中的顺序排列
+        """
+        if not hits:
+            return []
+        if not self.enabled:
+            return [{"primary": hit, "duplicates": []} for hit in hits]
+
+        parent = list(range(len(hits)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def union(i, j):
+            root_i, root_j = find(i), find(j)
+            if root_i != root_j:
+                # 保留排名靠前的结果作为代表
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+
+        # 第一步：按SHA256精确分组
+        sha_owner = {}
+        for i, hit in enumerate(hits):
+            sha = get_document_sha256(hit)
+            if not sha:
+                continue
+            if sha in sha_owner:
+                union(sha_owner[sha], i)
+            else:
+                sha_owner[sha] = i
+
+        # 第二步：MinHash + LSH分桶查找近似重复
+        signatures = [self.get_signature(hit) for hit in hits]
+        rows = max(1, self.num_perm // self.bands)
+        buckets = {}
+        for i, signature in enumerate(signatures):
+            if not signature:
+                continue
+            for band in range(self.bands):
+                band_key = (band, signature[band * rows:(band + 1) * rows])
+                buckets.setdefault(band_key, []).append(i)
+
+        checked = set()
+        for members in buckets.values():
+            for pos, i in enumerate(members):
+                for j in members[pos + 1:]:
+                    if (i, j) in checked or find(i) == find(j):
+                        continue
+                    checked.add((i, j))
+                    if self.estimate_similarity(signatures[i], signatures[j]) >= self.threshold:
+                        union(i, j)
+
+        clusters = {}
+        for i, hit in enumerate(hits):
+            root = find(i)
+            if root not in clusters:
+                clusters[root] = {"primary": hits[root], "duplicates": []}
+            if i != root:
+                clusters[root]["duplicates"].append(hit)
+
+        return [clusters[root] for root in sorted(clusters)]
+
+    def precompute_signatures(self, documents):
+        """
+        预计算文档签名并写入缓存（可在离线任务中批量调用）
+
+        Args:
+            documents (iterable): 文档字典迭代器
+
+        Returns:
+            int: 新计算的签名数量
+        """
+        count = 0
+        for doc in documents:
+            content = doc.get('content', '') or doc.get('abstract', '') or ''
+            if self._cache_key(doc, content) not in self.signature_cache:
+                self.get_signature(doc)
+                count += 1
+        return count
+
+    def load_cache(self, path):
+        """
+        从文件加载签名缓存
+
+        Args:
+            path (str): 缓存文件路径
+        """
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            with _shared_cache_lock:
+                for key, signature in data.items():
+                    self.signature_cache[key] = tuple(signature)
+        except Exception:
+            # 缓存文件损坏时忽略，签名会在使用时重新计算
+            pass
+
+    def save_cache(self, path=None):
+        """
+        保存签名缓存到文件
+
+        Args:
+            path (str, optional): 缓存文件路径，默认使用配置中的路径
+        """
+        path = path or self.cache_path
+        if not path:
+            return
+        with _shared_cache_lock:
+            data = {key: list(signature) for key, signature in self.signature_cache.items()}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+
+def iter_index_documents(index, page_size=1000):
+    """
+    分页读取索引中用于计算签名的字段
+
+    Args:
+        index: Meilisearch 索引对象
+        page_size (int): 每页文档数量
+
+    Yields:
+        dict: 文档字典
+    """
+    offset = 0
+    fields = ["_sha256", "file_sha256", "content", "abstract"]
+    while True:
+        page = index.get_documents({"offset": offset, "limit": page_size, "fields": fields})
+        for doc in page.results:
+            yield dict(doc)
+        offset += len(page.results)
+        if not page.results or offset >= page.total:
+            return
+
+
+def main():
+    """命令行入口：为索引中的全部文档预计算签名并保存缓存文件"""
+    from config_manager import ConfigManager
+    from search_service import SearchService
+
+    parser = argparse.ArgumentParser(description="预计算搜索结果去重使用的 MinHash 签名")
+    parser.add_argument("--index", help="知识库名称，默认使用配置中的默认知识库")
+    parser.add_argument("--config", default="config.json", help="配置文件路径")
+    parser.add_argument("--output", help="签名缓存文件路径，默认使用配置中的 dedup.signature_cache_path")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    config_manager = ConfigManager(args.config)
+    dedup_config = config_manager.get_dedup_config()
+    output = args.output or dedup_config.get("signature_cache_path")
+    if not output:
+        parser.error("需要指定 --output 或在配置中设置 dedup.signature_cache_path")
+    # 签名缓存条目数不受页面缓存上限约束
+    deduplicator = ResultDeduplicator(dict(dedup_config, max_cache_entries=float("inf"), signature_cache_path=output),
+                                      signature_cache={})
+    knowledge_base = args.index or config_manager.get_search_config().get("default_knowledge_base")
+    index = SearchService(config_manager).meili_client.index(knowledge_base)
+    count = deduplicator.precompute_signatures(iter_index_documents(index))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    deduplicator.save_cache(output)
+    logging.info(f"新计算 {count} 个签名，共 {len(deduplicator.signature_cache)} 个，已保存到 {output}")
+
+
+if __name__ == "__main__":
+    main()
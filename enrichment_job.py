@@ -0,0 +1,214 @@
+"""
+离线增强任务模块
+遍历 Meilisearch 索引，为缺少摘要/关键词的文档批量生成并写回 ai_summary、ai_keywords 字段
+
+运行命令: python enrichment_job.py --index broker_reports --concurrency 8
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_service import AIService
+from config_manager import ConfigManager
+from search_service import SearchService
+
+
+# 写回索引的增强字段名，搜索页面优先展示这些字段
+SUMMARY_FIELD = "ai_summary"
+KEYWORDS_FIELD = "ai_keywords"
+
+
+class EnrichmentJob:
+    """离线增强任务类"""
+
+    def __init__(self, config_manager, index_name=None, checkpoint_path=None):
+        """
+        初始化离线增强任务
+
+        Args:
+            config_manager: 配置管理器实例
+            index_name (str, optional): 目标索引名称，默认使用默认知识库
+            checkpoint_path (str, optional): 进度文件路径
+        """
+        self.config_manager = config_manager
+        self.logger = logging.getLogger(__name__)
+        self.search_service = SearchService(config_manager)
+        self.ai_service = AIService(config_manager)
+
+        enrichment_config = config_manager.get_enrichment_config()
+        self.index_name = index_name or config_manager.get_search_config().get("default_knowledge_base")
+        self.index = self.search_service.meili_client.index(self.index_name)
+        self.batch_size = enrichment_config.get("batch_size", 50)
+        self.concurrency = enrichment_config.get("concurrency", 8)
+        self.max_content_chars = enrichment_config.get("max_content_chars", 4000)
+        self.max_tokens = enrichment_config.get("max_tokens", 128)
+        self.task_timeout_ms = enrichment_config.get("task_timeout_ms", 600000)
+        self.checkpoint_path = (
+            checkpoint_path
+            or enrichment_config.get("checkpoint_path")
+            or f".enrichment_checkpoint_{self.index_name}.json"
+        )
+        self.primary_key = self._get_primary_key()
+        self.progress = self._load_progress()
+
+    def _get_primary_key(self):
+        """获取索引主键，获取失败时使用导入配置中的主键"""
+        try:
+            primary_key = self.index.get_primary_key()
+            if primary_key:
+                return primary_key
+        except Exception as e:
+            self.logger.warning(f"获取索引主键失败: {str(e)}")
+        return self.config_manager.get_ingest_config().get("primary_key", "_sha256")
+
+    def _load_progress(self):
+        """加载进度文件"""
+        if os.path.exists(self.checkpoint_path):
+            try:
+                with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                self.logger.warning(f"进度文件损坏，将从头开始: {str(e)}")
+        return {"offset": 0, "enriched": 0, "failed": 0}
+
+    def _save_progress(self):
+        """原子写入进度文件"""
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.progress, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _wait_task(self, task_uid):
+        """
+        等待 Meilisearch 写回任务完成
+
+        Args:
+            task_uid (int): 任务ID
+
+        Returns:
+            bool: 任务是否成功
+        """
+        try:
+            task = self.search_service.meili_client.wait_for_task(
+                task_uid, timeout_in_ms=self.task_timeout_ms, interval_in_ms=500
+            )
+            if task.status == "succeeded":
+                return True
+            self.logger.error(f"任务 {task_uid} 执行失败: {task.error}")
+        except Exception as e:
+            self.logger.error(f"等待任务 {task_uid} 失败: {str(e)}")
+        return False
+
+    @staticmethod
+    def needs_enrichment(doc):
+        """
+        判断文档是否缺少增强字段
+
+        Args:
+            doc (dict): 文档
+
+        Returns:
+            bool: 是否需要生成摘要和关键词
+        """
+        return not doc.get(SUMMARY_FIELD) or not doc.get(KEYWORDS_FIELD)
+
+    def _enrich_document(self, doc):
+        """
+        为单个文档生成摘要和关键词
+
+        Args:
+            doc (dict): 文档
+
+        Returns:
+            dict or None: 部分更新文档，失败时返回None
+        """
+        content = (doc.get('content', '') or doc.get('abstract', ''))[:self.max_content_chars]
+        if not content:
+            return None
+        try:
+            summary, keywords = self.ai_service.generate_enrichment(content, self.max_tokens)
+        except Exception as e:
+            self.logger.error(f"文档 {doc.get(self.primary_key)} 增强失败: {str(e)}")
+            return None
+        return {
+            self.primary_key: doc[self.primary_key],
+            SUMMARY_FIELD: summary,
+            KEYWORDS_FIELD: keywords,
+            "ai_enriched_at": int(time.time()),
+        }
+
+    def run(self, limit=None):
+        """
+        执行增强任务：分页遍历索引，并发调用AI服务，并以部分更新方式写回
+
+        Args:
+            limit (int, optional): 本次最多处理的文档数量
+
+        Returns:
+            dict: 任务进度统计
+        """
+        fields = [self.primary_key, "content", "abstract", SUMMARY_FIELD, KEYWORDS_FIELD]
+        processed = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while limit is None or processed < limit:
+                page = self.index.get_documents({
+                    "offset": self.progress["offset"],
+                    "limit": self.batch_size,
+                    "fields": fields,
+                })
+                docs = [dict(doc) for doc in page.results]
+                if not docs:
+                    break
+
+                pending = [doc for doc in docs if self.needs_enrichment(doc)]
+                updates = [update for update in executor.map(self._enrich_document, pending) if update]
+                if updates:
+                    # 部分更新只写增强字段，不影响已有内容和向量
+                    task = self.index.update_documents(updates, primary_key=self.primary_key)
+                    # 写回成功后才推进断点，失败时保留进度，下次从本批重新开始
+                    if not self._wait_task(task.task_uid):
+                        self.logger.error(f"写回失败，进度停留在 {self.progress['offset']}")
+                        break
+
+                self.progress["offset"] += len(docs)
+                self.progress["enriched"] += len(updates)
+                self.progress["failed"] += len(pending) - len(updates)
+                self._save_progress()
+                processed += len(docs)
+                self.logger.info(
+                    f"进度: {self.progress['offset']}/{page.total}，本批增强 {len(updates)}/{len(pending)}"
+                )
+
+                if self.progress["offset"] >= page.total:
+                    break
+
+        return dict(self.progress)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="为索引中的文档离线生成摘要和关键词")
+    parser.add_argument("--index", help="目标索引名称，默认使用配置中的默认知识库")
+    parser.add_argument("--config", default="config.json", help="配置文件路径")
+    parser.add_argument("--checkpoint", help="进度文件路径")
+    parser.add_argument("--limit", type=int, help="本次最多处理的文档数量")
+    parser.add_argument("--concurrency", type=int, help="并发调用AI服务的线程数，默认使用配置中的 enrichment.concurrency")
+    parser.add_argument("--restart", action="store_true", help="忽略已有进度，从头开始")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    job = EnrichmentJob(ConfigManager(args.config), args.index, args.checkpoint)
+    if args.concurrency:
+        job.concurrency = args.concurrency
+    if args.restart:
+        job.progress = {"offset": 0, "enriched": 0, "failed": 0}
+    print(json.dumps(job.run(args.limit), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""
+检索效果评估模块
+读取标注好的"查询 -> 相关文档SHA256"文件，对索引遍历 semanticRatio、top_k 和结果去重开关的组合，
+统计每种配置的 recall@k、MRR 和检索延迟分位数，用于选择满足质量目标的最快配置。
+查询向量只计算一次并保存在本地文件中，重复评估时无需再次调用向量服务
+
+运行命令: python evaluate_retrieval.py labels.jsonl --ratios 0 0.3 0.5 0.7 1 --top-k 5 10 20 --min-recall 0.8
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+from bench_utils import git_revision, percentile
+from config_manager import ConfigManager
+from dedup_service import ResultDeduplicator
+from search_service import SearchService
+from tracing import tracer
+
+
+# 标注文件中查询和相关文档列可使用的字段名
+QUERY_FIELDS = ("query", "question", "q", "问题")
+RELEVANT_FIELDS = ("relevant", "relevant_sha256", "sha256", "相关文档")
+
+# 每次请求向量服务的最大查询数
+EMBEDDING_BATCH_SIZE = 32
+
+
+def load_labels(path):
+    """
+    读取标注文件
+
+    JSONL 每行形如 {"query": "...", "relevant": ["sha256", ...]}；
+    CSV 需包含 query 列和 relevant 列（多个SHA256以分号、逗号或空格分隔）
+
+    Args:
+        path (str): 标注文件路径（.jsonl / .csv）
+
+    Returns:
+        list: [{"query": str, "relevant": set}]，忽略没有相关文档的查询
+
+    Raises:
+        ValueError: 格式不支持或缺少必要字段时抛出
+    """
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        text = f.read()
+    if path.lower().endswith(".csv"):
+        items = list(csv.DictReader(io.StringIO(text)))
+    elif path.lower().endswith((".jsonl", ".json")):
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        raise ValueError("标注文件仅支持 .jsonl 和 .csv")
+
+    labels = []
+    for line_number, item in enumerate(items, 1):
+        query = next((item[field] for field in QUERY_FIELDS if item.get(field)), None)
+        relevant = next((item[field] for field in RELEVANT_FIELDS if item.get(field)), None)
+        if not query:
+            raise ValueError(f"第 {line_number} 条标注缺少查询字段")
+        if isinstance(relevant, str):
+            relevant = relevant.replace(";", " ").replace(",", " ").split()
+        if relevant:
+            labels.append({"query": query.strip(), "relevant": {str(sha).strip().lower() for sha in relevant}})
+    return labels
+
+
+def hit_sha256(hit):
+    """搜索结果的文档SHA256（与搜索页面展示的字段一致）"""
+    return str(hit.get('_sha256', hit.get('file_sha256', ''))).lower()
+
+
+def _format_ms(value):
+    return "-" if value is None else f"{value:.1f}ms"
+
+
+def score_ranking(ranking, relevant, k):
+    """
+    计算单个查询的 recall@k 和倒数排名
+
+    Args:
+        ranking (list): 按顺序排列的结果，每项为该位置代表的SHA256集合（去重后一个位置可包含多个来源）
+        relevant (set): 相关文档SHA256集合
+        k (int): 截断位置
+
+    Returns:
+        tuple: (recall@k, 倒数排名)
+    """
+    found = set()
+    reciprocal_rank = 0.0
+    for position, shas in enumerate(ranking[:k], 1):
+        matched = shas & relevant
+        if matched and not reciprocal_rank:
+            reciprocal_rank = 1.0 / position
+        found |= matched
+    return len(found) / len(relevant), reciprocal_rank
+
+
+class RetrievalEvaluator:
+    """检索效果评估类"""
+
+    def __init__(self, config_manager, knowledge_base=None, embedding_cache_path=None):
+        """
+        初始化评估器
+
+        Args:
+            config_manager: 配置管理器实例
+            knowledge_base (str, optional): 评估的知识库，默认使用配置中的默认知识库
+            embedding_cache_path (str, optional): 查询向量缓存文件路径，为空时不落盘
+        """
+        self.logger = logging.getLogger(__name__)
+        self.search_service = SearchService(config_manager)
+        self.deduplicator = ResultDeduplicator(config_manager.get_dedup_config())
+        self.knowledge_base = knowledge_base or config_manager.get_search_config().get("default_knowledge_base")
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_model = self.search_service.embedding_config["model"]
+
+    def load_embeddings(self, queries):
+        """
+        获取所有查询的向量：先读缓存文件，缺失的按批请求向量服务后写回缓存文件
+
+        Args:
+            queries (list): 查询文本列表
+
+        Returns:
+            dict: 查询 -> 向量
+        """
+        cache = {}
+        if self.embedding_cache_path and os.path.exists(self.embedding_cache_path):
+            with open(self.embedding_cache_path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        # 不同嵌入模型的向量不能混用
+        vectors = cache.setdefault(self.embedding_model, {})
+        missing = [query for query in dict.fromkeys(queries) if query not in vectors]
+        for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+            batch = missing[start:start + EMBEDDING_BATCH_SIZE]
+            vectors.update(zip(batch, self.search_service.get_embeddings(batch)))
+        if missing and self.embedding_cache_path:
+            directory = os.path.dirname(os.path.abspath(self.embedding_cache_path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.embedding_cache_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.embedding_cache_path)
+        self.logger.info(f"查询向量: 共 {len(vectors)} 条，本次新计算 {len(missing)} 条")
+        return vectors
+
+    def evaluate(self, labels, semantic_ratios, top_ks, dedup_options=(False, True), repeat=1, dedup_fetch_factor=3):
+        """
+        遍历所有参数组合并评估
+
+        Args:
+            labels (list): load_labels 返回的标注列表
+            semantic_ratios (list): 待评估的语义权重
+            top_ks (list): 待评估的返回结果数
+            dedup_options (tuple): 是否对结果去重（去重后重复来源折叠到同一位置，与搜索页面一致）
+            repeat (int): 每个查询的重复次数（用于稳定延迟统计，质量指标按最后一次成功返回的结果计算）
+            dedup_fetch_factor (int): 去重时多取的结果倍数，取 top_k × 倍数条结果去重后截取前 top_k 个聚类，
+                否则去重只会合并前 top_k 条结果，recall@k 不可能高于不去重
+
+        Returns:
+            list: 每种配置的评估结果
+        """
+        embeddings = self.load_embeddings([label["query"] for label in labels])
+        results = []
+        for semantic_ratio in semantic_ratios:
+            for top_k in top_ks:
+                for dedup in dedup_options:
+                    row = self._evaluate_config(labels, embeddings, semantic_ratio, top_k, dedup, repeat,
+                                                dedup_fetch_factor)
+                    results.append(row)
+                    print(f"ratio={semantic_ratio:<4} top_k={top_k:<4} dedup={'on ' if dedup else 'off'} "
+                          f"recall@k={row['recall']:.3f} MRR={row['mrr']:.3f} "
+                          f"p50={_format_ms(row['p50_ms'])} p95={_format_ms(row['p95_ms'])} errors={row['errors']}")
+        return results
+
+    def _evaluate_config(self, labels, embeddings, semantic_ratio, top_k, dedup, repeat, dedup_fetch_factor=3):
+        """评估单个配置"""
+        limit = top_k * max(1, dedup_fetch_factor) if dedup else top_k
+        latencies = []
+        recalls, reciprocal_ranks = [], []
+        errors = 0
+        with tracer.span("evaluation.config", provider=self.knowledge_base, top_k=top_k,
+                         semantic_ratio=semantic_ratio, dedup=dedup):
+            for label in labels:
+                ranking = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    try:
+                        results = self.search_service.search_with_vector(
+                            label["query"], self.knowledge_base, embeddings[label["query"]], limit, semantic_ratio
+                        )
+                        hits = results.get("hits", [])
+                        if dedup:
+                            ranking = [
+                                {hit_sha256(cluster["primary"])} | {hit_sha256(dup) for dup in cluster["duplicates"]}
+                                for cluster in self.deduplicator.deduplicate(hits)[:top_k]
+                            ]
+                        else:
+                            ranking = [{hit_sha256(hit)} for hit in hits]
+                    except Exception as e:
+                        errors += 1
+                        self.logger.warning(f"查询失败: {label['query'][:50]} - {e}")
+                        continue
+                    latencies.append((time.perf_counter() - start) * 1000)
+                # 失败的查询按未召回计入质量指标
+                recall, reciprocal_rank = score_ranking(ranking or [], label["relevant"], top_k)
+                recalls.append(recall)
+                reciprocal_ranks.append(reciprocal_rank)
+
+        latencies.sort()
+        return {
+            "semantic_ratio": semantic_ratio,
+            "top_k": top_k,
+            "dedup": dedup,
+            "fetched": limit,
+            "queries": len(labels),
+            "errors": errors,
+            "recall": round(sum(recalls) / len(recalls), 4) if recalls else 0.0,
+            "mrr": round(sum(reciprocal_ranks) / len(reciprocal_ranks), 4) if reciprocal_ranks else 0.0,
+            "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+            "p50_ms": percentile(latencies, 0.5),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+        }
+
+
+def recommend(results, min_recall=0.0, min_mrr=0.0):
+    """
+    选出满足质量目标且 p95 延迟最低的配置
+
+    Args:
+        results (list): 评估结果
+        min_recall (float): recall@k 下限
+        min_mrr (float): MRR 下限
+
+    Returns:
+        dict or None: 推荐配置，没有配置满足目标时返回None
+    """
+    candidates = [
+        row for row in results
+        if row["recall"] >= min_recall and row["mrr"] >= min_mrr and row["p95_ms"] is not None
+    ]
+    # 延迟相同时优先选择质量更高的配置
+    return min(candidates, key=lambda row: (row["p95_ms"], -row["recall"], -row["mrr"]), default=None)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="评估不同检索参数下的召回质量与延迟")
+    parser.add_argument("labels", help="标注文件（.jsonl / .csv），每条包含查询和相关文档SHA256")
+    parser.add_argument("--config", default="config.json", help="配置文件路径")
+    parser.add_argument("--index", help="评估的知识库，默认使用配置中的默认知识库")
+    parser.add_argument("--ratios", type=float, nargs="+", default=[0.0, 0.25, 0.5, 0.75, 1.0],
+                        help="待评估的语义权重（应用配置 search.default_semantic_ratio 的取值，"
+                             "发送给 Meilisearch 的 semanticRatio 为 1 - 该值）")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[5, 10, 20], help="待评估的返回结果数")
+    parser.add_argument("--dedup", choices=["off", "on", "both"], default="both", help="是否评估结果去重")
+    parser.add_argument("--repeat", type=int, default=1, help="每个查询的重复次数（用于稳定延迟统计）")
+    parser.add_argument("--dedup-fetch-factor", type=int, default=3,
+                        help="去重时多取的结果倍数（取 top_k × 倍数条结果去重后截取前 top_k 个聚类）")
+    parser.add_argument("--min-recall", type=float, default=0.0, help="推荐配置需满足的 recall@k 下限")
+    parser.add_argument("--min-mrr", type=float, default=0.0, help="推荐配置需满足的 MRR 下限")
+    parser.add_argument("--embedding-cache", default="benchmark_results/eval_embeddings.json",
+                        help="查询向量缓存文件，传空字符串表示不落盘")
+    parser.add_argument("--output-dir", default="benchmark_results", help="结果保存目录")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    labels = load_labels(args.labels)
+    if not labels:
+        print("标注文件中没有包含相关文档的查询")
+        sys.exit(1)
+
+    evaluator = RetrievalEvaluator(ConfigManager(args.config), args.index, args.embedding_cache or None)
+    dedup_options = {"off": (False,), "on": (True,), "both": (False, True)}[args.dedup]
+    results = evaluator.evaluate(labels, args.ratios, args.top_k, dedup_options, args.repeat,
+                                 args.dedup_fetch_factor)
+
+    # 没有质量目标时"最快的配置"没有意义，只输出各配置的结果
+    has_target = args.min_recall > 0 or args.min_mrr > 0
+    best = recommend(results, args.min_recall, args.min_mrr) if has_target else None
+    if not has_target:
+        print("未设置质量目标（--min-recall / --min-mrr），不推荐配置，请根据上表选择")
+    elif best:
+        print(f"推荐配置: default_semantic_ratio={best['semantic_ratio']}"
+              f"（Meilisearch semanticRatio={1 - best['semantic_ratio']:g}） top_k={best['top_k']} "
+              f"dedup={'on' if best['dedup'] else 'off'}（recall@k={best['recall']:.3f} "
+              f"MRR={best['mrr']:.3f} p95={best['p95_ms']:.1f}ms）")
+    else:
+        print("没有配置满足质量目标")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "knowledge_base": evaluator.knowledge_base,
+            "embedding_model": evaluator.embedding_model,
+            "embedder": evaluator.search_service.embedder_name,
+            "queries": len(labels),
+            "repeat": args.repeat,
+            "dedup_fetch_factor": args.dedup_fetch_factor,
+            "targets": {"min_recall": args.min_recall, "min_mrr": args.min_mrr},
+        },
+        "results": results,
+        "recommended": best,
+    }
+    os.makedirs(args.output_dir, exist_ok=True)
+    output_path = os.path.join(args.output_dir, f"eval_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
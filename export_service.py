@@ -0,0 +1,257 @@
+"""
+搜索结果导出模块
+按 offset/limit 逐页遍历一个查询的全部命中结果，边获取边写出 CSV/JSONL，
+所有分页复用同一个查询向量，内存占用只与单页大小有关
+
+运行命令: python export_service.py "新能源 汽车" --index broker_reports --format csv --output result.csv
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+
+from tracing import tracer
+
+
+# 导出的基本字段
+EXPORT_FIELDS = ["rank", "title", "author", "organization", "industry", "publish_time", "source",
+                 "sha256", "pdf_link", "score"]
+
+# 启用增强列时追加的字段
+ENRICHMENT_FIELDS = ["ai_summary", "ai_keywords"]
+
+# 增强列模式：none 不导出；cached 只使用索引中已有字段或缓存中的结果；generate 缺失时调用模型生成
+ENRICHMENT_MODES = ("none", "cached", "generate")
+
+
+def encode_rows(rows, fields, output_format, header=False):
+    """
+    把一批结果行编码为文本
+
+    Args:
+        rows (list): 结果行列表
+        fields (list): 字段列表
+        output_format (str): 输出格式 csv / jsonl
+        header (bool): CSV 是否输出表头
+
+    Returns:
+        str: 编码后的文本
+    """
+    if output_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
+        return buffer.getvalue()
+    return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+class SearchExporter:
+    """搜索结果导出类"""
+
+    def __init__(self, search_service, ai_service=None, export_config=None):
+        """
+        初始化导出器
+
+        Args:
+            search_service: 搜索服务实例
+            ai_service: AI服务实例，导出增强列时使用
+            export_config (dict, optional): 导出配置
+        """
+        export_config = export_config or {}
+        self.logger = logging.getLogger(__name__)
+        self.search_service = search_service
+        self.ai_service = ai_service
+        self.page_size = export_config.get("page_size", 200)
+        # Meilisearch 的 pagination.maxTotalHits（默认1000）同样限制 offset + limit
+        self.max_results = export_config.get("max_results", 1000)
+        self.output_dir = export_config.get("output_dir", "exports")
+
+    def fields(self, enrichment="none"):
+        """
+        获取导出字段
+
+        Args:
+            enrichment (str): 增强列模式
+
+        Returns:
+            list: 字段列表
+        """
+        return EXPORT_FIELDS + (ENRICHMENT_FIELDS if enrichment != "none" else [])
+
+    def iter_pages(self, query, knowledge_base, semantic_ratio, enrichment="none", max_results=None,
+                   filter_expression=None):
+        """
+        逐页获取结果行（混合搜索按相关度排序，无法用过滤条件做游标，因此使用 offset/limit 翻页）
+
+        Args:
+            query (str): 搜索查询
+            knowledge_base (str): 知识库名称
+            semantic_ratio (float): 语义搜索权重
+            enrichment (str): 增强列模式 none / cached / generate
+            max_results (int, optional): 最多导出的结果数，默认使用配置
+            filter_expression (str, optional): Meilisearch 过滤表达式
+
+        Yields:
+            list: 一页结果行
+        """
+        if enrichment not in ENRICHMENT_MODES:
+            raise ValueError(f"不支持的增强列模式: {enrichment}")
+        max_results = min(max_results or self.max_results, self.max_results)
+        # 只计算一次查询向量，所有分页复用；无法获取时导出关键词搜索结果
+        embedding = self.search_service.try_query_embedding(query)
+        options = {"showRankingScore": True}
+        if filter_expression:
+            options["filter"] = filter_expression
+        offset = 0
+        while offset < max_results:
+            limit = min(self.page_size, max_results - offset)
+            results = self.search_service.search_with_vector(
+                query, knowledge_base, embedding, limit, semantic_ratio, offset, **options
+            )
+            hits = results.get("hits", [])
+            if not hits:
+                break
+            yield [self._to_row(hit, offset + i, enrichment) for i, hit in enumerate(hits, 1)]
+            offset += len(hits)
+            if len(hits) < limit:
+                break
+
+    def _to_row(self, hit, rank, enrichment):
+        """把单条搜索结果转换为导出行"""
+        row = {
+            "rank": rank,
+            "title": hit.get('title', ''),
+            "author": hit.get('author', ''),
+            "organization": hit.get('organization', ''),
+            "industry": hit.get('industry', ''),
+            "publish_time": hit.get('publish_time', ''),
+            "source": hit.get('source', ''),
+            "sha256": hit.get('_sha256', hit.get('file_sha256', '')),
+            "pdf_link": hit.get('pdf_link', ''),
+            "score": hit.get('_rankingScore', ''),
+        }
+        if enrichment != "none":
+            row["ai_summary"], row["ai_keywords"] = self._enrichment(hit, enrichment)
+        return row
+
+    def _enrichment(self, hit, enrichment):
+        """
+        获取单条结果的摘要和关键词（与搜索页面使用相同的缓存键，页面上看过的结果可直接复用）
+
+        Returns:
+            tuple: (摘要, 关键词)，无法获取时为空字符串
+        """
+        summary, keywords = hit.get('ai_summary'), hit.get('ai_keywords')
+        if summary and keywords:
+            return summary, keywords
+        content = hit.get('content', '') or hit.get('abstract', '')
+        if not content or self.ai_service is None:
+            return "", ""
+        if enrichment == "generate":
+            try:
+                return self.ai_service.generate_enrichment(content)
+            except Exception as e:
+                self.logger.warning(f"生成摘要和关键词失败: {e}")
+                return "", ""
+        return self.ai_service.get_cached_enrichment(content) or ("", "")
+
+    def write(self, output, query, knowledge_base, semantic_ratio, output_format="csv",
+              enrichment="none", max_results=None, filter_expression=None):
+        """
+        把全部结果逐页写入文本流
+
+        Args:
+            output: 可写的文本流
+            query (str): 搜索查询
+            knowledge_base (str): 知识库名称
+            semantic_ratio (float): 语义搜索权重
+            output_format (str): 输出格式 csv / jsonl
+            enrichment (str): 增强列模式
+            max_results (int, optional): 最多导出的结果数
+            filter_expression (str, optional): Meilisearch 过滤表达式
+
+        Returns:
+            int: 导出的结果数
+        """
+        fields = self.fields(enrichment)
+        count = 0
+        with tracer.span("export", provider=knowledge_base, query=query[:100]) as span:
+            if output_format == "csv":
+                output.write(encode_rows([], fields, output_format, header=True))
+            for rows in self.iter_pages(query, knowledge_base, semantic_ratio, enrichment, max_results,
+                                        filter_expression):
+                output.write(encode_rows(rows, fields, output_format))
+                output.flush()
+                count += len(rows)
+            span.set(rows=count)
+        return count
+
+    def export_to_file(self, query, knowledge_base, semantic_ratio, output_format="csv",
+                       enrichment="none", max_results=None, filter_expression=None):
+        """
+        导出到输出目录中的新文件
+
+        Returns:
+            tuple: (文件路径, 导出的结果数)
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        filename = time.strftime("%Y%m%d_%H%M%S_") + uuid.uuid4().hex[:6] + f".{output_format}"
+        path = os.path.join(self.output_dir, filename)
+        with open(path, 'w', encoding='utf-8-sig' if output_format == "csv" else 'utf-8', newline='') as output:
+            count = self.write(output, query, knowledge_base, semantic_ratio, output_format, enrichment, max_results,
+                               filter_expression)
+        return path, count
+
+
+def main():
+    """命令行入口"""
+    from ai_service import AIService
+    from config_manager import ConfigManager
+    from search_service import SearchService
+
+    parser = argparse.ArgumentParser(description="导出查询的全部搜索结果")
+    parser.add_argument("query", help="搜索查询")
+    parser.add_argument("--index", help="知识库名称，默认使用配置中的默认知识库")
+    parser.add_argument("--config", default="config.json", help="配置文件路径")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv", help="输出格式")
+    parser.add_argument("--output", help="输出文件路径，默认写到标准输出")
+    parser.add_argument("--semantic-ratio", type=float, help="语义搜索权重，默认使用配置")
+    parser.add_argument("--enrichment", choices=ENRICHMENT_MODES, help="增强列模式，默认使用配置")
+    parser.add_argument("--max-results", type=int, help="最多导出的结果数")
+    parser.add_argument("--filter", help="Meilisearch 过滤表达式，如 'industry IN [\"计算机\"]'")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    config_manager = ConfigManager(args.config)
+    search_config = config_manager.get_search_config()
+    export_config = config_manager.get_export_config()
+    enrichment = args.enrichment or export_config.get("enrichment", "cached")
+    exporter = SearchExporter(
+        SearchService(config_manager),
+        AIService(config_manager) if enrichment != "none" else None,
+        export_config
+    )
+    knowledge_base = args.index or search_config.get("default_knowledge_base")
+    semantic_ratio = (args.semantic_ratio if args.semantic_ratio is not None
+                      else search_config.get("default_semantic_ratio", 0.5))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8-sig' if args.format == "csv" else 'utf-8', newline='') as output:
+            count = exporter.write(output, args.query, knowledge_base, semantic_ratio, args.format,
+                                   enrichment, args.max_results, args.filter)
+    else:
+        count = exporter.write(sys.stdout, args.query, knowledge_base, semantic_ratio, args.format,
+                               enrichment, args.max_results, args.filter)
+    logging.info(f"共导出 {count} 条结果")
+
+
+if __name__ == "__main__":
+    main()
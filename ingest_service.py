@@ -0,0 +1,495 @@
+"""
+文档导入模块
+负责将本地目录中的文档批量向量化并导入 Meilisearch，支持断点续传
+
+运行命令: python ingest_service.py <文档目录> --index broker_reports
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from config_manager import ConfigManager
+from search_service import SearchService
+
+
+# 支持的文档类型：JSONL 为每行一个文档，其余为整篇文本（PDF 需安装 pypdf）
+SUPPORTED_EXTENSIONS = (".jsonl", ".txt", ".md", ".pdf")
+
+# 流水线中用于标记文件读取完成的哨兵
+_FILE_END = "file_end"
+_STOP = object()
+
+
+def compute_sha256(data):
+    """
+    计算SHA256摘要
+
+    Args:
+        data (bytes or str): 输入数据
+
+    Returns:
+        str: 十六进制摘要
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def compute_file_sha256(path, block_size=1 << 20):
+    """
+    流式计算文件SHA256，避免一次性读入大文件
+
+    Args:
+        path (str): 文件路径
+        block_size (int): 每次读取的字节数
+
+    Returns:
+        str: 十六进制摘要
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_source_files(source_dir):
+    """
+    按固定顺序遍历目录中支持的文档文件
+
+    Args:
+        source_dir (str): 文档目录
+
+    Yields:
+        str: 文件路径
+    """
+    for root, dirs, files in os.walk(source_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def read_text_file(path):
+    """
+    读取文本或PDF文件的正文
+
+    Args:
+        path (str): 文件路径
+
+    Returns:
+        str: 文本内容，无法解析时返回空字符串
+    """
+    if path.lower().endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            logging.getLogger(__name__).warning(f"未安装 pypdf，跳过PDF文件: {path}")
+            return ""
+        reader = PdfReader(path)
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read()
+
+
+def split_chunks(text, chunk_size, chunk_overlap=0):
+    """
+    按字符数切分文本
+
+    Args:
+        text (str): 文本内容
+        chunk_size (int): 每块字符数，0 表示不切分
+        chunk_overlap (int): 相邻块重叠字符数
+
+    Returns:
+        list: 文本块列表
+    """
+    if not chunk_size or len(text) <= chunk_size:
+        return [text]
+    step = max(1, chunk_size - chunk_overlap)
+    return [text[i:i + chunk_size] for i in range(0, len(text), step) if text[i:i + chunk_size].strip()]
+
+
+class DocumentIngestor:
+    """文档导入器类"""
+
+    def __init__(self, config_manager, index_name=None, checkpoint_path=None):
+        """
+        初始化文档导入器
+
+        Args:
+            config_manager: 配置管理器实例
+            index_name (str, optional): 目标索引名称，默认使用默认知识库
+            checkpoint_path (str, optional): 断点文件路径
+        """
+        self.config_manager = config_manager
+        self.logger = logging.getLogger(__name__)
+        self.search_service = SearchService(config_manager)
+
+        ingest_config = config_manager.get_ingest_config()
+        self.index_name = index_name or config_manager.get_search_config().get("default_knowledge_base")
+        self.index = self.search_service.meili_client.index(self.index_name)
+        self.primary_key = ingest_config.get("primary_key", "_sha256")
+        self.embedding_batch_size = ingest_config.get("embedding_batch_size", 32)
+        self.upload_batch_size = ingest_config.get("upload_batch_size", 1000)
+        self.max_embedding_chars = ingest_config.get("max_embedding_chars", 2000)
+        self.chunk_size = ingest_config.get("chunk_size", 0)
+        self.chunk_overlap = ingest_config.get("chunk_overlap", 0)
+        self.task_timeout_ms = ingest_config.get("task_timeout_ms", 600000)
+        self.queue_size = ingest_config.get("queue_size", 8)
+        self.checkpoint_path = (
+            checkpoint_path
+            or ingest_config.get("checkpoint_path")
+            or f".ingest_checkpoint_{self.index_name}.json"
+        )
+
+        self.checkpoint = self._load_checkpoint()
+        self._checkpoint_lock = threading.Lock()
+        self._existence_check_enabled = True
+        # 统计在读取、上传和任务跟踪线程中都会更新
+        self._stats_lock = threading.Lock()
+        self.stats = {"files": 0, "skipped_files": 0, "documents": 0, "skipped_documents": 0,
+                      "uploaded": 0, "tasks": 0, "failed_tasks": 0, "failed_files": 0}
+
+    def _load_checkpoint(self):
+        """加载断点文件"""
+        if os.path.exists(self.checkpoint_path):
+            try:
+                with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                self.logger.warning(f"断点文件损坏，将重新开始: {str(e)}")
+        return {"done_files": {}, "pending_tasks": [], "failed_files": []}
+
+    def _count(self, key, value=1):
+        """线程安全地累加统计"""
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _save_checkpoint(self):
+        """原子写入断点文件"""
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.checkpoint, f, ensure_ascii=False)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def ensure_index_settings(self):
+        """确保主键字段可过滤（以便批量判断文档是否已导入），并确保分面筛选字段可过滤"""
+        try:
+            filterable = self.index.get_filterable_attributes() or []
+            required = [self.primary_key, "file_sha256", "source_path"] + self.search_service.facet_fields
+            missing = [attr for attr in required if attr not in filterable]
+            if missing:
+                task = self.index.update_filterable_attributes(list(filterable) + missing)
+                self.search_service.meili_client.wait_for_task(task.task_uid, timeout_in_ms=self.task_timeout_ms)
+        except Exception as e:
+            self.logger.warning(f"更新索引过滤字段失败，将跳过已导入检查: {str(e)}")
+            self._existence_check_enabled = False
+
+    def _resume_pending_tasks(self):
+        """等待上次运行遗留的任务完成，并将成功任务对应的文件标记为已完成（有批次失败的文件除外）"""
+        failed_files = set(self.checkpoint.get("failed_files", []))
+        for pending in self.checkpoint.get("pending_tasks", []):
+            if self.wait_task(pending["task_uid"]):
+                for path, file_key in pending.get("files", {}).items():
+                    if path not in failed_files:
+                        self.checkpoint["done_files"][path] = file_key
+        # 未完成的文件本次会重新导入，失败记录随之清空
+        self.checkpoint["pending_tasks"] = []
+        self.checkpoint["failed_files"] = []
+        self._save_checkpoint()
+
+    def wait_task(self, task_uid):
+        """
+        等待 Meilisearch 任务完成
+
+        Args:
+            task_uid (int): 任务ID
+
+        Returns:
+            bool: 任务是否成功
+        """
+        try:
+            task = self.search_service.meili_client.wait_for_task(
+                task_uid, timeout_in_ms=self.task_timeout_ms, interval_in_ms=500
+            )
+            if task.status == "succeeded":
+                return True
+            self.logger.error(f"任务 {task_uid} 执行失败: {task.error}")
+        except Exception as e:
+            self.logger.error(f"等待任务 {task_uid} 失败: {str(e)}")
+        return False
+
+    @staticmethod
+    def _file_key(path):
+        """文件的轻量标识（修改时间+大小），用于断点续传时跳过已完成文件"""
+        stat = os.stat(path)
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def build_documents(self, path):
+        """
+        将单个文件解析为待导入文档
+
+        Args:
+            path (str): 文件路径
+
+        Yields:
+            dict: 文档字典（未包含向量）
+        """
+        if path.lower().endswith(".jsonl"):
+            source_mtime = int(os.path.getmtime(path))
+            source_sha256 = compute_file_sha256(path)
+            with open(path, 'r', encoding='utf-8') as f:
+                for line_no, line in enumerate(f, start=1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        doc = json.loads(line)
+                    except json.JSONDecodeError:
+                        self.logger.warning(f"跳过无法解析的行: {path}:{line_no}")
+                        continue
+                    content = doc.get("content", "") or doc.get("abstract", "")
+                    if not content:
+                        continue
+                    doc.setdefault("_sha256", doc.get("file_sha256") or compute_sha256(content))
+                    doc.setdefault("source_path", path)
+                    doc.setdefault("source_mtime", source_mtime)
+                    doc.setdefault("source_sha256", source_sha256)
+                    if self.primary_key not in doc:
+                        doc[self.primary_key] = doc["_sha256"]
+                    yield doc
+            return
+
+        text = read_text_file(path)
+        if not text.strip():
+            return
+        file_sha256 = compute_file_sha256(path)
+        source_mtime = int(os.path.getmtime(path))
+        title = os.path.splitext(os.path.basename(path))[0]
+        chunks = split_chunks(text, self.chunk_size, self.chunk_overlap)
+        for chunk_index, chunk in enumerate(chunks):
+            # 单块时沿用文件SHA256；多块时以来源路径+块内容计算ID，内容不变则ID不变
+            doc_sha256 = file_sha256 if len(chunks) == 1 else compute_sha256(f"{path}\n{chunk}")
+            doc = {
+                "_sha256": doc_sha256,
+                "file_sha256": file_sha256,
+                "title": title,
+                "content": chunk,
+                "source_path": path,
+                "source_mtime": source_mtime,
+                "source_sha256": file_sha256,
+                "chunk_index": chunk_index,
+                "chunk_count": len(chunks),
+            }
+            doc.setdefault(self.primary_key, doc_sha256)
+            yield doc
+
+    def _filter_existing(self, docs):
+        """
+        过滤索引中已存在的文档
+
+        Args:
+            docs (list): 文档列表
+
+        Returns:
+            list: 尚未导入的文档
+        """
+        if not self._existence_check_enabled or not docs:
+            return docs
+        ids = [doc[self.primary_key] for doc in docs]
+        try:
+            result = self.index.get_documents({
+                "filter": f"{self.primary_key} IN {json.dumps(ids)}",
+                "fields": [self.primary_key],
+                "limit": len(ids),
+            })
+            existing = {dict(doc).get(self.primary_key) for doc in result.results}
+        except Exception as e:
+            self.logger.warning(f"查询已导入文档失败，将跳过已导入检查: {str(e)}")
+            self._existence_check_enabled = False
+            return docs
+        return [doc for doc in docs if doc[self.primary_key] not in existing]
+
+    def _embedding_text(self, doc):
+        """拼接用于向量化的文本"""
+        title = doc.get("title", "")
+        content = doc.get("content", "") or doc.get("abstract", "")
+        return f"{title}\n{content}"[:self.max_embedding_chars]
+
+    def embed_documents(self, docs):
+        """
+        批量向量化并写入 _vectors 字段
+
+        Args:
+            docs (list): 文档列表
+
+        Returns:
+            list: 带向量的文档列表
+        """
+        if not docs:
+            return docs
+        embeddings = self.search_service.get_embeddings([self._embedding_text(doc) for doc in docs])
+        for doc, embedding in zip(docs, embeddings):
+            doc["_vectors"] = {self.search_service.embedder_name: embedding}
+        return docs
+
+    def _upload_worker(self, upload_queue, task_queue):
+        """上传线程：累积文档达到批量大小后调用 add_documents"""
+        buffer = []
+        buffer_paths = set()
+        finished_files = {}
+
+        def flush():
+            if not buffer and not finished_files:
+                return
+            task_uid = None
+            failed = False
+            if buffer:
+                try:
+                    task = self.index.add_documents(list(buffer), primary_key=self.primary_key)
+                    task_uid = task.task_uid
+                    self._count("uploaded", len(buffer))
+                    self._count("tasks")
+                except Exception as e:
+                    # 上传失败时批次内的文件都不会标记完成，下次运行会重新导入
+                    self.logger.error(f"上传文档失败: {str(e)}")
+                    self._count("failed_tasks")
+                    failed = True
+            task_queue.put((task_uid, dict(finished_files), set(buffer_paths), failed))
+            buffer.clear()
+            buffer_paths.clear()
+            finished_files.clear()
+
+        while True:
+            item = upload_queue.get()
+            if item is _STOP:
+                flush()
+                task_queue.put(_STOP)
+                return
+            kind, payload = item
+            if kind == _FILE_END:
+                path, file_key = payload
+                finished_files[path] = file_key
+            else:
+                path, docs = payload
+                buffer.extend(docs)
+                buffer_paths.add(path)
+            if len(buffer) >= self.upload_batch_size:
+                flush()
+
+    def _task_worker(self, task_queue):
+        """
+        任务跟踪线程：按提交顺序等待索引任务完成并更新断点
+
+        一个文件的文档可能分布在多个批次中，任一批次失败的文件都记入 failed_files，
+        只有所有批次都成功的文件才在其结束标记所在批次完成后标记为已完成
+        """
+        while True:
+            item = task_queue.get()
+            if item is _STOP:
+                return
+            task_uid, files, paths, failed = item
+            if task_uid is not None:
+                with self._checkpoint_lock:
+                    self.checkpoint["pending_tasks"].append({"task_uid": task_uid, "files": files})
+                    self._save_checkpoint()
+                if not self.wait_task(task_uid):
+                    self._count("failed_tasks")
+                    failed = True
+            with self._checkpoint_lock:
+                self.checkpoint["pending_tasks"] = [
+                    pending for pending in self.checkpoint["pending_tasks"] if pending["task_uid"] != task_uid
+                ]
+                failed_files = self.checkpoint.setdefault("failed_files", [])
+                if failed:
+                    failed_files.extend(path for path in paths | set(files) if path not in failed_files)
+                for path, file_key in files.items():
+                    if path in failed_files:
+                        self._count("failed_files")
+                    else:
+                        self.checkpoint["done_files"][path] = file_key
+                self._save_checkpoint()
+
+    def run(self, source_dir):
+        """
+        执行导入：读取+向量化（主线程）与上传、任务跟踪（后台线程）并行进行
+
+        Args:
+            source_dir (str): 文档目录
+
+        Returns:
+            dict: 导入统计
+        """
+        self.ensure_index_settings()
+        self._resume_pending_tasks()
+
+        upload_queue = queue.Queue(maxsize=self.queue_size)
+        task_queue = queue.Queue()
+        upload_thread = threading.Thread(target=self._upload_worker, args=(upload_queue, task_queue), daemon=True)
+        task_thread = threading.Thread(target=self._task_worker, args=(task_queue,), daemon=True)
+        upload_thread.start()
+        task_thread.start()
+
+        start_time = time.monotonic()
+        try:
+            batch = []
+            for path in iter_source_files(source_dir):
+                file_key = self._file_key(path)
+                if self.checkpoint["done_files"].get(path) == file_key:
+                    self._count("skipped_files")
+                    continue
+
+                self._count("files")
+                for doc in self.build_documents(path):
+                    batch.append(doc)
+                    if len(batch) >= self.embedding_batch_size:
+                        self._process_batch(path, batch, upload_queue)
+                        batch = []
+                # 文件结束前先提交剩余文档，保证完成标记在其所有文档之后
+                if batch:
+                    self._process_batch(path, batch, upload_queue)
+                    batch = []
+                upload_queue.put((_FILE_END, (path, file_key)))
+                self.logger.info(f"已处理文件: {path}")
+        finally:
+            upload_queue.put(_STOP)
+            upload_thread.join()
+            task_thread.join()
+
+        self.stats["elapsed_seconds"] = round(time.monotonic() - start_time, 2)
+        return self.stats
+
+    def _process_batch(self, path, batch, upload_queue):
+        """过滤已导入文档、向量化后交给上传线程（一个批次只包含同一文件的文档）"""
+        self._count("documents", len(batch))
+        pending = self._filter_existing(batch)
+        self._count("skipped_documents", len(batch) - len(pending))
+        if pending:
+            upload_queue.put(("documents", (path, self.embed_documents(pending))))
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="批量导入文档到 Meilisearch")
+    parser.add_argument("source_dir", help="文档目录（支持 jsonl/txt/md/pdf）")
+    parser.add_argument("--index", help="目标索引名称，默认使用配置中的默认知识库")
+    parser.add_argument("--config", default="config.json", help="配置文件路径")
+    parser.add_argument("--checkpoint", help="断点文件路径")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    ingestor = DocumentIngestor(ConfigManager(args.config), args.index, args.checkpoint)
+    stats = ingestor.run(args.source_dir)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,52 @@
 整合所有模块，提供完整的搜索功能和AI聊天功能
 """
 
+import copy
+import importlib
+import os
+import sys
+import time
+import uuid
 import streamlit as st
 from datetime import datetime
-from openai import OpenAI
+from chat_models import (
+    ChatMessage, ChatSessions, DEFAULT_SESSION, MAX_HISTORY_MESSAGES, ROLE_ASSISTANT, ROLE_USER, memory_report
+)
+from chat_pipeline import get_chat_pipeline
+from circuit_breaker import circuit_breaker_states
 from config_manager import ConfigManager
-from search_service import SearchService
-from ai_service import AIService
+from memory_governor import SessionObjects, get_memory_governor
 from ui_components import UIComponents
-from web_search_service import WebSearchService
+from tracing import tracer
+
+
+# 侧边栏中的功能页面
+PAGE_OPTIONS = ["AI问答", "知识库搜索", "批量问答", "设置", "性能监控"]
+
+# 各服务所在模块和类名；模块依赖 openai、meilisearch、requests 等较重的包，
+# 只在页面第一次用到该服务时才导入并创建实例
+SERVICE_FACTORIES = {
+    "search": ("search_service", "SearchService"),
+    "ai": ("ai_service", "AIService"),
+    "web_search": ("web_search_service", "WebSearchService"),
+}
+
+
+def lazy_import(module_name):
+    """
+    按需导入模块，首次导入的耗时记录到追踪器（性能监控页面中的 import 阶段）
+    
+    Args:
+        module_name (str): 模块名称
+        
+    Returns:
+        module: 已导入的模块
+    """
+    module = sys.modules.get(module_name)
+    if module is None:
+        with tracer.span("import", provider=module_name):
+            module = importlib.import_module(module_name)
+    return module
 
 
 class KnowledgeSearchApp:
@@ -20,30 +58,84 @@ class KnowledgeSearchApp:
         """初始化应用"""
         # 初始化各模块
         self.config_manager = ConfigManager()
-        self.search_service = SearchService(self.config_manager)
-        self.ai_service = AIService(self.config_manager)
-        self.ui_components = UIComponents(self.config_manager, self.ai_service)
-        self.web_search_service = WebSearchService(self.config_manager)
+        tracer.configure(self.config_manager.get_tracing_config())
+        self.memory_governor = get_memory_governor(self.config_manager.get_memory_config())
+        self.ui_components = UIComponents(self.config_manager)
         
         # 初始化会话状态
         self._init_session_state()
     
+    def _get_service(self, name):
+        """
+        获取会话内复用的服务实例，首次使用时才创建（配置文件变化时由服务自行按需重建客户端）
+        
+        Args:
+            name (str): 服务名称（SERVICE_FACTORIES 中的键）
+            
+        Returns:
+            object: 服务实例
+        """
+        services = st.session_state.services
+        if name not in services:
+            module_name, class_name = SERVICE_FACTORIES[name]
+            service_class = getattr(lazy_import(module_name), class_name)
+            with tracer.span("service.init", provider=name):
+                services[name] = service_class(self.config_manager)
+        return services[name]
+    
+    @property
+    def search_service(self):
+        """搜索服务"""
+        return self._get_service("search")
+    
+    @property
+    def ai_service(self):
+        """AI服务"""
+        return self._get_service("ai")
+    
+    @property
+    def web_search_service(self):
+        """网络搜索服务"""
+        return self._get_service("web_search")
+    
     def _init_session_state(self):
         """初始化会话状态"""
         if 'current_page' not in st.session_state:
             st.session_state.current_page = "AI问答"
-        if 'chat_history' not in st.session_state:
-            st.session_state.chat_history = []
         if 'use_web_search' not in st.session_state:
             st.session_state.use_web_search = False
-        # 初始化复制状态字典
-        if 'copy_states' not in st.session_state:
-            st.session_state.copy_states = {}
-        # 初始化对话会话管理
+        # 展开了"可复制内容"的消息（对话名称, 消息序号）
+        if 'open_copy_keys' not in st.session_state:
+            st.session_state.open_copy_keys = set()
+        # 初始化对话会话管理（内存中的对话数和消息数有上限，超出部分转存到磁盘）
+        if 'session_id' not in st.session_state:
+            st.session_state.session_id = uuid.uuid4().hex
         if 'chat_sessions' not in st.session_state:
-            st.session_state.chat_sessions = {"默认对话": []}
+            st.session_state.chat_sessions = ChatSessions(st.session_state.session_id, self.config_manager.get_chat_config())
         if 'current_chat_session' not in st.session_state:
-            st.session_state.current_chat_session = "默认对话"
+            st.session_state.current_chat_session = DEFAULT_SESSION
+        # 后台生成的对话标题（对话名称 -> 标题），以及等待标题生成的问答句柄
+        if 'chat_titles' not in st.session_state:
+            st.session_state.chat_titles = {}
+        if 'pending_titles' not in st.session_state:
+            st.session_state.pending_titles = {}
+        # 初始化搜索框内容
+        if 'search_query_input' not in st.session_state:
+            st.session_state.search_query_input = "AI"
+        if 'run_suggested_search' not in st.session_state:
+            st.session_state.run_suggested_search = False
+        # 当前会话的批量问答任务
+        if 'batch_job' not in st.session_state:
+            st.session_state.batch_job = None
+        # 当前搜索条件和页码（结果本身保存在共享缓存中）
+        if 'search_state' not in st.session_state:
+            st.session_state.search_state = None
+        # 当前搜索条件最近一次导出的文件
+        if 'search_export' not in st.session_state:
+            st.session_state.search_export = None
+        # 会话内复用的服务实例（按需创建，会话空闲时可能被内存管理器清空）
+        if 'services' not in st.session_state:
+            st.session_state.services = SessionObjects()
     
     def run(self):
         """运行应用主程序"""
@@ -63,8 +155,34 @@ class KnowledgeSearchApp:
             self._render_search_page()
         elif st.session_state.current_page == "AI问答":
             self._render_chat_page()
+        elif st.session_state.current_page == "批量问答":
+            self._render_batch_page()
         elif st.session_state.current_page == "设置":
             self._render_settings_page()
+        elif st.session_state.current_page == "性能监控":
+            self._render_dashboard_page()
+        
+        # 有外部依赖熔断时在侧边栏提示降级状态
+        with st.sidebar:
+            self.ui_components.render_service_status(circuit_breaker_states())
+        
+        # 页面渲染完成后登记本会话的大对象，并按需检查进程内存
+        self._track_memory()
+    
+    def _track_memory(self):
+        """向内存管理器登记本会话的大对象并标记会话活跃"""
+        session_id = st.session_state.session_id
+        # 对话历史空闲时整体转存到磁盘，切换回对话时自动加载
+        self.memory_governor.register(
+            session_id, "chat", st.session_state.chat_sessions,
+            ChatSessions.offload, size=ChatSessions.memory_bytes
+        )
+        # 服务实例主要引用进程级共享的缓存和配置，只计字典本身；空闲时清空，下次使用时重新创建
+        self.memory_governor.register(
+            session_id, "services", st.session_state.services,
+            SessionObjects.clear, size=sys.getsizeof
+        )
+        self.memory_governor.touch(session_id)
     
     def _render_navigation(self):
         """渲染页面导航"""
@@ -107,7 +225,7 @@ class KnowledgeSearchApp:
         with st.sidebar:
             # 页面模式选择
             st.markdown("### 🔍 功能选择")
-            page_options = ["AI问答", "知识库搜索", "设置"]
+            page_options = PAGE_OPTIONS
             selected_page = st.radio(
                 "选择功能",
                 page_options,
@@ -124,8 +242,10 @@ class KnowledgeSearchApp:
         
         # 渲染侧边栏
         knowledge_base, semantic_ratio, top_k, search_time_placeholder, result_count_placeholder = (
-            self.ui_components.render_sidebar()
+            self.ui_components.render_sidebar(self.ai_service)
         )
+        # 分面筛选控件在搜索完成后填充（需要当前查询的分面统计）
+        facet_container = st.sidebar.container()
         
         # 创建搜索结果容器
         results_container = st.container()
@@ -151,22 +271,69 @@ class KnowledgeSearchApp:
         with col1:
             search_query = st.text_input(
                 "请输入搜索关键词", 
-                value="AI", 
+                key="search_query_input",
                 help="支持关键词、短语搜索，系统会自动进行语义理解",
                 label_visibility="collapsed"
             )
         with col2:
             search_btn = st.button("搜索", type="primary", use_container_width=True)
         
+        # 搜索建议（点击建议词直接搜索，减少反复修改查询的次数）
+        suggestion_index = lazy_import("suggestion_service").get_suggestion_index(
+            knowledge_base, self.config_manager.get_suggestion_config()
+        )
+        suggestions = suggestion_index.suggest(search_query, search_service=self.search_service)
+        self.ui_components.render_search_suggestions(suggestions)
+        
         # 处理搜索逻辑并在结果容器中显示
+        if st.session_state.run_suggested_search:
+            st.session_state.run_suggested_search = False
+            search_btn = True
+        
         if search_btn:
-            # 清空容器并显示搜索结果
+            suggestion_index.record_query(search_query)
+            # 新查询的分面取值不同，清除上一次的筛选条件
+            self.ui_components.reset_facet_filters()
+            st.session_state.search_state = {
+                "query": search_query,
+                "knowledge_base": knowledge_base,
+                "top_k": top_k,
+                "semantic_ratio": semantic_ratio,
+                "page": 0,
+                "filter": None,
+            }
+            st.session_state.search_export = None
+        
+        search_state = st.session_state.search_state
+        if search_state:
+            # 筛选条件转换为 Meilisearch 过滤表达式，由服务端过滤；条件变化时回到第一页
+            filter_expression = lazy_import("search_service").build_filter_expression(
+                **self.ui_components.get_facet_selection()
+            )
+            if filter_expression != search_state.get("filter"):
+                search_state["filter"] = filter_expression
+                search_state["page"] = 0
+                st.session_state.search_export = None
+            
+            # 清空容器并显示搜索结果（翻页时按保存的搜索条件重新获取，通常命中缓存或预取结果）
             results_container.empty()
             with results_container:
-                self._handle_search(
-                    search_query, knowledge_base, top_k, semantic_ratio,
-                    search_time_placeholder, result_count_placeholder
+                self._handle_search(search_state, search_time_placeholder, result_count_placeholder)
+            self._render_export_panel(search_state)
+            with facet_container:
+                self.ui_components.render_facet_filters(
+                    self.search_service.get_facet_distribution(search_state["query"], search_state["knowledge_base"])
                 )
+            
+            # 用户浏览当前页时，在后台预取下一页并为搜索建议计算向量
+            prefetcher = lazy_import("prefetch_service").get_prefetcher(
+                self.config_manager.get_prefetch_config(), self.config_manager.get_dedup_config()
+            )
+            prefetcher.prefetch_next_page(
+                self.search_service, self.ai_service, search_state["query"], search_state["knowledge_base"], search_state["top_k"],
+                search_state["semantic_ratio"], search_state["page"], search_state.get("filter")
+            )
+            prefetcher.prefetch_queries(self.search_service, suggestions)
     
     def _render_chat_page(self):
         """渲染AI问答页面"""
@@ -180,16 +347,18 @@ class KnowledgeSearchApp:
         self._render_chat_sidebar()
         
         # 获取当前对话历史
+        chat_sessions = st.session_state.chat_sessions
         current_session = st.session_state.current_chat_session
-        current_history = st.session_state.chat_sessions.get(current_session, [])
+        current_history = chat_sessions.messages(current_session)
+        archived_count = chat_sessions.archived_count(current_session)
         
         # 创建对话历史容器
         chat_container = st.container()
         
         # 显示对话历史
-        with chat_container:
+        with chat_container, tracer.span("render.chat_history"):
             # 如果没有对话历史，显示欢迎信息
-            if not current_history:
+            if not current_history and not archived_count:
                 st.markdown("""
                 <div style='text-align: center; padding: 3rem; color: #666; background-color: #f8f9fa; 
                             border-radius: 10px; margin: 2rem 0;'>
@@ -200,15 +369,22 @@ class KnowledgeSearchApp:
                 </div>
                 """, unsafe_allow_html=True)
             
+            # 较早的消息已转存到磁盘，按需加载显示
+            if archived_count:
+                if st.toggle(f"🗄️ 显示已归档的 {archived_count} 条较早消息", key=f"show_archived_{current_session}"):
+                    for message in chat_sessions.load_archived(current_session):
+                        with st.chat_message(message.role):
+                            st.write(message.content)
+            
             # 显示对话消息
             for i, message in enumerate(current_history):
-                if message["role"] == "user":
+                if message.role == ROLE_USER:
                     with st.chat_message("user"):
-                        st.write(message["content"])
+                        st.write(message.content)
                 else:
                     with st.chat_message("assistant"):
                         # 显示AI回答
-                        st.write(message["content"])
+                        st.write(message.content)
                         
                         # 创建操作按钮行
                         button_col1, button_col2, button_col3, button_col4 = st.columns([1, 1, 1, 5])
@@ -217,44 +393,50 @@ class KnowledgeSearchApp:
                             # 重新回答按钮
                             if st.button("🔄 重新回答", key=f"regenerate_{current_session}_{i}", help="重新生成这个回答"):
                                 # 找到对应的用户问题
-                                if i > 0 and current_history[i-1]["role"] == "user":
-                                    user_question = current_history[i-1]["content"]
+                                if i > 0 and current_history[i-1].role == ROLE_USER:
+                                    user_question = current_history[i-1].content
                                     
-                                    # 重新生成回答
-                                    with st.spinner("正在重新生成回答..."):
-                                        response_data = self._generate_ai_response(user_question, st.session_state.use_web_search)
+                                    # 重新生成回答（只使用该问题之前的对话历史，不读取问答结果缓存）
+                                    with st.spinner("正在重新生成回答..."), tracer.span("chat.turn", regenerate=True):
+                                        turn = self._start_chat_turn(
+                                            current_session, user_question, current_history[:i-1], use_cache=False
+                                        )
+                                        response_data = turn.result()
                                     
                                     # 更新历史记录中的回答
-                                    st.session_state.chat_sessions[current_session][i] = {
-                                        "role": "assistant",
-                                        "content": response_data["response"],
-                                        "timestamp": datetime.now(),
-                                        "search_info": response_data.get("search_info")
-                                    }
+                                    chat_sessions.replace(current_session, i, ChatMessage.create(
+                                        ROLE_ASSISTANT, response_data["response"], response_data.get("search_info"),
+                                        response_data.get("ttft_ms")
+                                    ))
                                     
                                     st.rerun()
                         
                         with button_col2:
                             # 复制按钮
-                            copy_key = f"show_copy_{current_session}_{i}"
+                            copy_key = (current_session, i)
                             if st.button("📋 复制", key=f"copy_{current_session}_{i}", help="点击显示可复制的文本"):
-                                st.session_state[copy_key] = not st.session_state.get(copy_key, False)
+                                st.session_state.open_copy_keys ^= {copy_key}
                         
                         with button_col3:
                             # 显示时间戳
-                            if message.get("timestamp"):
-                                timestamp = message["timestamp"].strftime("%H:%M:%S")
+                            if message.timestamp:
+                                timestamp = datetime.fromtimestamp(message.timestamp).strftime("%H:%M:%S")
                                 st.caption(f"⏰ {timestamp}")
                         
+                        with button_col4:
+                            # 显示首字延迟
+                            if message.ttft_ms:
+                                st.caption(f"⚡ 首字 {message.ttft_ms} ms")
+                        
                         # 如果用户点击了复制按钮，显示可复制的文本区域
-                        if st.session_state.get(copy_key, False):
+                        if copy_key in st.session_state.open_copy_keys:
                             with st.expander("📋 可复制内容", expanded=True):
-                                st.code(message["content"], language="text")
+                                st.code(message.content, language="text")
                                 st.caption("💡 提示：点击代码框右上角的复制按钮，或选中文本使用 Ctrl+C 复制")
                         
                         # 显示搜索信息
-                        if message.get("search_info"):
-                            search_info = message["search_info"]
+                        search_info = message.search_info
+                        if search_info:
                             if search_info.get("used_search"):
                                 st.caption(f"🌐 已使用网络搜索: {search_info.get('query', '')}")
                             elif search_info.get("search_failed"):
@@ -265,25 +447,33 @@ class KnowledgeSearchApp:
         user_input = st.chat_input("请输入您的问题...")
         
         if user_input:
+            # 本轮之前的对话历史，在添加用户消息前复制
+            history = chat_sessions.recent(current_session, MAX_HISTORY_MESSAGES)
+            
             # 添加用户消息到当前会话
-            st.session_state.chat_sessions[current_session].append({
-                "role": "user",
-                "content": user_input,
-                "timestamp": datetime.now()
-            })
+            chat_sessions.append(current_session, ChatMessage.create(ROLE_USER, user_input))
             
             # 在对话容器中显示用户消息
             with chat_container:
                 with st.chat_message("user"):
                     st.write(user_input)
                 
-                # 生成AI回答
+                # 后台流水线生成AI回答，页面只消费文本流
                 with st.chat_message("assistant"):
-                    with st.spinner("AI正在思考中..."):
-                        response_data = self._generate_ai_response(user_input, st.session_state.use_web_search)
+                    with tracer.span("chat.turn", query=user_input[:100]):
+                        turn = self._start_chat_turn(current_session, user_input, history)
+                        with st.spinner("AI正在思考中..."):
+                            turn.wait_first_chunk()
+                        answer_placeholder = st.empty()
+                        streamed = ""
+                        for delta in turn.stream():
+                            streamed += delta
+                            answer_placeholder.markdown(streamed + "▌")
+                        answer_placeholder.markdown(streamed)
+                        response_data = turn.result()
                     
-                    # 显示AI回答
-                    st.write(response_data["response"])
+                    if response_data.get("ttft_ms") is not None:
+                        st.caption(f"⚡ 首字 {response_data['ttft_ms']} ms · 总耗时 {response_data['total_ms']} ms")
                     
                     # 显示搜索信息
                     if response_data.get("search_info"):
@@ -294,12 +484,10 @@ class KnowledgeSearchApp:
                             st.caption("⚠️ 网络搜索失败，使用AI基础知识回答")
             
             # 添加AI回答到当前会话
-            st.session_state.chat_sessions[current_session].append({
-                "role": "assistant",
-                "content": response_data["response"],
-                "timestamp": datetime.now(),
-                "search_info": response_data.get("search_info")
-            })
+            chat_sessions.append(current_session, ChatMessage.create(
+                ROLE_ASSISTANT, response_data["response"], response_data.get("search_info"),
+                response_data.get("ttft_ms")
+            ))
             
             # 刷新页面显示新消息
             st.rerun()
@@ -309,7 +497,7 @@ class KnowledgeSearchApp:
         with st.sidebar:
             # 页面模式选择
             st.markdown("### 🔍 功能选择")
-            page_options = ["AI问答", "知识库搜索", "设置"]
+            page_options = PAGE_OPTIONS
             selected_page = st.radio(
                 "选择功能",
                 page_options,
@@ -327,40 +515,45 @@ class KnowledgeSearchApp:
             # 对话管理
             st.markdown("### 💬 对话管理")
             
+            chat_sessions = st.session_state.chat_sessions
+            
             # 新建对话按钮
             col1, col2 = st.columns([3, 1])
             with col1:
                 new_chat_name = st.text_input("新对话名称", placeholder="输入对话名称...", label_visibility="collapsed")
             with col2:
                 if st.button("➕", help="新建对话", use_container_width=True):
-                    if new_chat_name and new_chat_name not in st.session_state.chat_sessions:
-                        st.session_state.chat_sessions[new_chat_name] = []
+                    if new_chat_name and new_chat_name not in chat_sessions:
+                        chat_sessions.create(new_chat_name)
                         st.session_state.current_chat_session = new_chat_name
                         st.rerun()
-                    elif new_chat_name in st.session_state.chat_sessions:
+                    elif new_chat_name in chat_sessions:
                         st.error("对话名称已存在！")
                     else:
                         # 自动生成对话名称
-                        session_count = len(st.session_state.chat_sessions)
+                        session_count = len(chat_sessions)
                         auto_name = f"对话 {session_count + 1}"
-                        while auto_name in st.session_state.chat_sessions:
+                        while auto_name in chat_sessions:
                             session_count += 1
                             auto_name = f"对话 {session_count + 1}"
-                        st.session_state.chat_sessions[auto_name] = []
+                        chat_sessions.create(auto_name)
                         st.session_state.current_chat_session = auto_name
                         st.rerun()
             
             # 对话会话列表
             st.markdown("### 📋 对话列表")
-            for session_name in st.session_state.chat_sessions.keys():
+            self._collect_chat_titles()
+            for session_name in chat_sessions.names():
                 col1, col2 = st.columns([4, 1])
                 with col1:
-                    # 显示会话名称和消息数量
-                    message_count = len(st.session_state.chat_sessions[session_name])
+                    # 显示会话名称（有生成的标题时一并显示）和消息数量
+                    message_count = chat_sessions.message_count(session_name)
                     is_current = session_name == st.session_state.current_chat_session
+                    title = st.session_state.chat_titles.get(session_name)
+                    label = f"{session_name} · {title}" if title else session_name
                     
                     if st.button(
-                        f"{'🔸' if is_current else '🔹'} {session_name} ({message_count})",
+                        f"{'🔸' if is_current else '🔹'} {label} ({message_count})",
                         key=f"session_{session_name}",
                         help=f"切换到 {session_name}",
                         use_container_width=True,
@@ -371,11 +564,12 @@ class KnowledgeSearchApp:
                 
                 with col2:
                     # 删除对话按钮
-                    if session_name != "默认对话":  # 保护默认对话不被删除
+                    if session_name != DEFAULT_SESSION:  # 保护默认对话不被删除
                         if st.button("🗑️", key=f"delete_{session_name}", help=f"删除 {session_name}"):
-                            del st.session_state.chat_sessions[session_name]
+                            chat_sessions.delete(session_name)
+                            self._reset_session_views(session_name)
                             if st.session_state.current_chat_session == session_name:
-                                st.session_state.current_chat_session = "默认对话"
+                                st.session_state.current_chat_session = DEFAULT_SESSION
                             st.rerun()
             
             st.divider()
@@ -412,13 +606,8 @@ class KnowledgeSearchApp:
                 st.info(f"当前使用: {selected_provider} - {model_name}")
                 
                 # 更新AI服务配置
-                if hasattr(self, 'ai_service') and selected_provider != self.ai_service.default_provider:
-                    self.ai_service.default_provider = selected_provider
-                    self.ai_service.current_provider_config = config.get(selected_provider, {})
-                    self.ai_service.client = OpenAI(
-                        base_url=self.ai_service.current_provider_config.get("base_url", "https://api.openai.com/v1"),
-                        api_key=self.ai_service.current_provider_config.get("api_key", ""),
-                    )
+                if selected_provider != self.ai_service.default_provider:
+                    self.ai_service.set_provider(selected_provider)
                     st.success(f"✅ 已切换到 {selected_provider}")
             else:
                 st.warning("⚠️ 未配置任何AI服务商，请前往设置页面进行配置")
@@ -440,138 +629,279 @@ class KnowledgeSearchApp:
             # 清空当前对话按钮
             current_session = st.session_state.current_chat_session
             if st.button("🗑️ 清空当前对话", help=f"清空 {current_session} 的所有消息", use_container_width=True):
-                st.session_state.chat_sessions[current_session] = []
+                chat_sessions.clear(current_session)
+                self._reset_session_views(current_session)
                 st.rerun()
     
-    def _handle_search(self, search_query, knowledge_base, top_k, semantic_ratio,
-                      search_time_placeholder, result_count_placeholder):
+    def _reset_session_views(self, session_name):
+        """清除指定对话的页面状态（已展开的可复制内容、生成的标题）"""
+        st.session_state.open_copy_keys = {
+            key for key in st.session_state.open_copy_keys if key[0] != session_name
+        }
+        st.session_state.chat_titles.pop(session_name, None)
+        st.session_state.pending_titles.pop(session_name, None)
+    
+    def _handle_search(self, search_state, search_time_placeholder, result_count_placeholder):
         """
         处理搜索请求
         
         Args:
-            search_query (str): 搜索查询
-            knowledge_base (str): 知识库名称
-            top_k (int): 返回结果数量
-            semantic_ratio (float): 语义搜索权重
+            search_state (dict): 搜索条件（查询、知识库、每页数量、语义权重、页码、过滤表达式）
             search_time_placeholder: 搜索时间占位符
             result_count_placeholder: 结果数量占位符
         """
-        # 执行搜索并测量耗时
-        (results, success), duration_ms = self.ui_components.measure_search_time(
-            self.search_service.search_hybrid,
-            search_query, knowledge_base, top_k, semantic_ratio
-        )
-        
-        # 更新搜索状态显示
-        self.ui_components.update_search_status(
-            search_time_placeholder, result_count_placeholder,
-            duration_ms, len(results)
-        )
+        search_query = search_state["query"]
+        knowledge_base = search_state["knowledge_base"]
+        top_k = search_state["top_k"]
+        page = search_state["page"]
+        with tracer.span("search.request", query=search_query[:100], knowledge_base=knowledge_base, page=page):
+            # 执行搜索并测量耗时
+            (results, success), duration_ms = self.ui_components.measure_search_time(
+                self.search_service.search_hybrid,
+                search_query, knowledge_base, top_k, search_state["semantic_ratio"], page * top_k,
+                search_state.get("filter")
+            )
+            
+            # 更新搜索状态显示
+            self.ui_components.update_search_status(
+                search_time_placeholder, result_count_placeholder,
+                duration_ms, len(results)
+            )
+            
+            # 渲染搜索结果和翻页按钮
+            self.ui_components.render_search_results(results, success, self.ai_service, page * top_k + 1)
+            if success and (results or page > 0):
+                self.ui_components.render_pagination(page, len(results) >= top_k)
+    
+    def _render_export_panel(self, search_state):
+        """
+        渲染导出面板：按当前搜索条件（含筛选条件）逐页导出全部结果（不受每页数量上限限制）
         
-        # 渲染搜索结果
-        self.ui_components.render_search_results(results, success, self.ai_service)
+        Args:
+            search_state (dict): 搜索条件
+        """
+        export_config = self.config_manager.get_export_config()
+        enrichment = export_config.get("enrichment", "cached")
+        max_results = export_config.get("max_results", 1000)
+        with st.expander("📤 导出全部结果", expanded=False):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                output_format = st.selectbox("导出格式", ["csv", "jsonl"], key="export_format")
+            with col2:
+                include_enrichment = st.checkbox(
+                    "包含摘要和关键词", value=enrichment != "none", key="export_enrichment",
+                    help="默认只导出索引中或缓存中已有的摘要和关键词；enrichment 配置为 generate 时会为缺失的结果调用模型生成"
+                )
+            with col3:
+                limit = st.number_input("最多导出条数", min_value=1, max_value=max_results,
+                                        value=max_results, step=100, key="export_limit")
+            
+            if st.button("开始导出", key="export_button"):
+                exporter = lazy_import("export_service").SearchExporter(
+                    self.search_service, self.ai_service, export_config
+                )
+                mode = "none"
+                if include_enrichment:
+                    mode = enrichment if enrichment != "none" else "cached"
+                try:
+                    with st.spinner("正在导出..."):
+                        path, count = exporter.export_to_file(
+                            search_state["query"], search_state["knowledge_base"], search_state["semantic_ratio"],
+                            output_format, mode, int(limit), search_state.get("filter")
+                        )
+                    st.session_state.search_export = {"path": path, "count": count, "format": output_format}
+                except Exception as e:
+                    st.error(lazy_import("search_service").describe_filter_error(e) or f"导出失败：{str(e)}")
+            
+            export = st.session_state.search_export
+            if export and os.path.exists(export["path"]):
+                st.caption(f"已导出 {export['count']} 条结果")
+                with open(export["path"], 'rb') as f:
+                    st.download_button(
+                        "⬇️ 下载导出文件",
+                        data=f.read(),
+                        file_name=os.path.basename(export["path"]),
+                        mime="text/csv" if export["format"] == "csv" else "application/jsonl",
+                    )
     
-    def _generate_ai_response(self, user_message: str, use_web_search: bool = False) -> dict:
+    def _start_chat_turn(self, session_name, user_message, history, use_cache=True):
         """
-        生成AI回答
+        把一轮问答提交到后台流水线（联网搜索、知识库检索并发执行，回答流式返回）
         
         Args:
+            session_name (str): 对话名称
             user_message (str): 用户消息
-            use_web_search (bool): 是否使用网络搜索
+            history (list): 本轮之前的对话历史（ChatMessage 列表）
+            use_cache (bool): 是否读取问答结果缓存（重新回答时为False）
             
         Returns:
-            dict: 包含回答和搜索信息的字典
+            ChatTurn: 问答句柄
         """
-        search_info = {"used_search": False, "search_failed": False}
-        search_context = None
-        
-        # 如果启用网络搜索
-        if use_web_search:
-            try:
-                search_result = self.web_search_service.search_web(user_message)
-                if search_result.get("success", False):
-                    search_context = self.web_search_service.format_search_results(search_result)
-                    search_info = {
-                        "used_search": True,
-                        "search_failed": False,
-                        "query": user_message
-                    }
-                else:
-                    search_info = {
-                        "used_search": False,
-                        "search_failed": True,
-                        "query": user_message,
-                        "error": search_result.get("error", "搜索失败")
-                    }
-            except Exception as e:
-                search_info = {
-                    "used_search": False,
-                    "search_failed": True,
-                    "query": user_message,
-                    "error": f"搜索异常: {str(e)}"
-                }
-        
-        # 生成AI回答
-        try:
-            if search_context:
-                # 有搜索上下文时的提示词
-                prompt = f"""基于以下网络搜索结果和用户问题，请提供准确、有用的回答。
-
-搜索结果：
-{search_context}
-
-用户问题：{user_message}
-
-请根据搜索结果回答用户问题，如果搜索结果不足以回答问题，请结合你的知识给出最佳回答。回答要准确、简洁、有用。"""
-            else:
-                # 无搜索上下文时直接回答
-                prompt = user_message
-            
-            # 构建消息历史
-            messages = [
-                {
-                    "role": "system",
-                    "content": "你是一个有用的AI助手。请用中文回答用户的问题，提供准确、有用的信息。"
-                }
-            ]
-            
-            # 添加最近的对话历史（最多10轮）
-            current_session = st.session_state.current_chat_session
-            current_history = st.session_state.chat_sessions.get(current_session, [])
-            recent_history = current_history[-20:] if len(current_history) > 20 else current_history
-            for msg in recent_history:
-                if msg["role"] in ["user", "assistant"]:
-                    messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
-            
-            # 添加当前用户消息
-            messages.append({"role": "user", "content": prompt})
-            
-            # 调用AI服务生成回答
-            response = self.ai_service.client.chat.completions.create(
-                model=self.ai_service.current_provider_config.get("model", "gpt-3.5-turbo"),
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1500
+        pipeline = get_chat_pipeline(self.config_manager.get_chat_pipeline_config())
+        history = [{"role": msg.role, "content": msg.content} for msg in history[-MAX_HISTORY_MESSAGES:]]
+        turn = pipeline.start_turn(
+            user_message,
+            history,
+            self.ai_service,
+            self.web_search_service if st.session_state.use_web_search else None,
+            self.search_service if pipeline.knowledge_base else None,
+            use_cache,
+        )
+        # 对话首轮的回答结束后，流水线在后台生成对话标题
+        if not history:
+            st.session_state.pending_titles[session_name] = turn
+        return turn
+    
+    def _collect_chat_titles(self):
+        """收集后台已生成的对话标题"""
+        pending = st.session_state.pending_titles
+        for session_name, turn in list(pending.items()):
+            if turn.post_processed.is_set():
+                del pending[session_name]
+                if turn.title and session_name in st.session_state.chat_sessions:
+                    st.session_state.chat_titles[session_name] = turn.title
+    
+    def _render_batch_page(self):
+        """渲染批量问答页面"""
+        batch_qa = lazy_import("batch_qa")
+        
+        # 添加页面标题
+        st.markdown(
+            "<h2 style='text-align: center; color: #2e8b57; margin-bottom: 1.5rem;'>📑 批量问答</h2>", 
+            unsafe_allow_html=True
+        )
+        
+        # 在侧边栏添加页面选择
+        with st.sidebar:
+            # 页面模式选择
+            st.markdown("### 🔍 功能选择")
+            page_options = PAGE_OPTIONS
+            selected_page = st.radio(
+                "选择功能",
+                page_options,
+                index=page_options.index(st.session_state.current_page),
+                key="batch_sidebar_page_selector"
             )
             
-            ai_response = response.choices[0].message.content.strip()
+            # 更新当前页面状态
+            if selected_page != st.session_state.current_page:
+                st.session_state.current_page = selected_page
+                st.rerun()
+        
+        batch_config = self.config_manager.get_batch_qa_config()
+        search_config = self.config_manager.get_search_config()
+        job = st.session_state.batch_job
+        
+        if job is None or not job.running:
+            uploaded = st.file_uploader(
+                "上传问题文件（CSV 需包含 question/问题 列或以第一列为问题；JSONL 每行一个字符串或含 question 字段的对象）",
+                type=["csv", "jsonl"]
+            )
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                use_knowledge_base = st.checkbox("检索知识库", value=True, help="回答前先在知识库中检索相关文档作为参考")
+            with col2:
+                knowledge_base = st.text_input("知识库", value=search_config.get("default_knowledge_base", ""))
+            with col3:
+                output_format = st.selectbox("输出格式", ["jsonl", "csv"])
             
-            return {
-                "response": ai_response,
-                "search_info": search_info,
-                "success": True
-            }
+            if st.button("🚀 开始批量问答", type="primary", disabled=uploaded is None):
+                try:
+                    questions = batch_qa.load_questions(uploaded.name, uploaded.getvalue())
+                except ValueError as e:
+                    st.error(f"读取问题文件失败：{str(e)}")
+                    questions = []
+                if questions:
+                    # 任务使用独立的AI服务实例，页面切换服务商不影响运行中的任务
+                    ai_service = lazy_import("ai_service").AIService(self.config_manager)
+                    ai_service.set_provider(self.ai_service.default_provider)
+                    st.session_state.batch_job = batch_qa.BatchQAJob(
+                        questions, ai_service,
+                        self.search_service if use_knowledge_base else None,
+                        knowledge_base, batch_config, output_format
+                    ).start()
+                    st.rerun()
+                elif uploaded is not None:
+                    st.warning("文件中没有问题")
         
-        except Exception as e:
-            return {
-                "response": f"抱歉，生成回答时发生错误: {str(e)}",
-                "search_info": search_info,
-                "success": False
-            }
-
+        if job is not None:
+            self._render_batch_progress(job)
+    
+    def _render_batch_progress(self, job):
+        """
+        渲染批量问答任务进度，运行中时每秒刷新
+        
+        Args:
+            job: 批量问答任务
+        """
+        st.markdown("---")
+        done = job.answered + job.failed
+        st.progress(job.progress, text=f"已完成 {done} / {job.unique_total} 个问题")
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("问题总数", job.total, help="上传文件中的问题数（含重复）")
+        col2.metric("去重后", job.unique_total)
+        col3.metric("成功 / 失败", f"{job.answered} / {job.failed}")
+        rate = done / job.elapsed * 60 if job.elapsed else 0
+        col4.metric("速度", f"{rate:.1f} 个/分钟", help=f"服务商 {job.provider}")
+        
+        if job.recent:
+            with st.expander("最近完成的问题", expanded=True):
+                for item in list(job.recent):
+                    status = "✅" if item["success"] else "❌"
+                    st.markdown(f"{status} **{item['question']}**  \n{(item['answer'] or item['error'])[:200]}")
+        
+        st.download_button(
+            "⬇️ 下载结果" + ("（运行中，已完成部分）" if job.running else ""),
+            data=job.read_output(),
+            file_name=os.path.basename(job.output_path),
+            mime="text/csv" if job.output_format == "csv" else "application/jsonl",
+        )
+        
+        if job.running:
+            if st.button("⏹️ 取消任务"):
+                job.cancel()
+            time.sleep(1)
+            st.rerun()
+        else:
+            st.success(f"任务完成，耗时 {job.elapsed:.1f} 秒")
+    
+    def _render_dashboard_page(self):
+        """渲染性能监控页面"""
+        # 添加页面标题
+        st.markdown(
+            "<h2 style='text-align: center; color: #2e8b57; margin-bottom: 1.5rem;'>📈 性能监控</h2>", 
+            unsafe_allow_html=True
+        )
+        
+        # 在侧边栏添加页面选择
+        with st.sidebar:
+            # 页面模式选择
+            st.markdown("### 🔍 功能选择")
+            page_options = PAGE_OPTIONS
+            selected_page = st.radio(
+                "选择功能",
+                page_options,
+                index=page_options.index(st.session_state.current_page),
+                key="dashboard_sidebar_page_selector"
+            )
+            
+            # 更新当前页面状态
+            if selected_page != st.session_state.current_page:
+                st.session_state.current_page = selected_page
+                st.rerun()
+            
+            st.divider()
+            
+            st.markdown("### ⚙️ 监控设置")
+            token_minutes = st.slider("Token统计时间范围（分钟）", min_value=5, max_value=120, value=30, step=5)
+            slow_limit = st.number_input("慢请求显示条数", min_value=5, max_value=100, value=10, step=5)
+            st.button("🔄 刷新", use_container_width=True)
+        
+        self.ui_components.render_performance_dashboard(tracer, token_minutes, slow_limit)
+        self.ui_components.render_service_status(circuit_breaker_states(), show_healthy=True)
+        self.ui_components.render_memory_governor(self.memory_governor.report(), st.session_state.session_id[:8])
+        self.ui_components.render_memory_report(memory_report(), st.session_state.session_id[:8])
+    
     def _render_settings_page(self):
         """渲染设置页面"""
         # 添加页面标题
@@ -584,7 +914,7 @@ class KnowledgeSearchApp:
         with st.sidebar:
             # 页面模式选择
             st.markdown("### 🔍 功能选择")
-            page_options = ["AI问答", "知识库搜索", "设置"]
+            page_options = PAGE_OPTIONS
             selected_page = st.radio(
                 "选择功能",
                 page_options,
@@ -604,6 +934,9 @@ class KnowledgeSearchApp:
         
         # 获取当前配置
         config = self.config_manager.config
+        # 表单展示时的配置版本，提交时用于检测其他会话是否已修改配置
+        loaded_version = st.session_state.get("settings_config_version", self.config_manager.version)
+        st.session_state.settings_config_version = self.config_manager.version
         
         # 创建表单用于配置AI服务商
         with st.form("ai_provider_config"):
@@ -665,7 +998,7 @@ class KnowledgeSearchApp:
             
             if submit_button:
                 # 更新配置
-                updated_config = config.copy()
+                updated_config = copy.deepcopy(config)
                 
                 # 更新OpenAI配置
                 if "openai" not in updated_config:
@@ -689,12 +1022,12 @@ class KnowledgeSearchApp:
                 
                 # 保存配置
                 try:
-                    self.config_manager.save_config(updated_config)
-                    st.success("✅ 配置保存成功！")
-                    
-                    # 重新初始化AI服务以应用新配置
-                    self.ai_service = AIService(self.config_manager)
-                    st.info("🔄 AI服务已重新初始化，新配置已生效")
+                    if self.config_manager.save_config(updated_config, loaded_version):
+                        st.session_state.settings_config_version = self.config_manager.version
+                        st.success("✅ 配置保存成功！")
+                        
+                        # 保存后各会话的AI服务会收到配置变更通知并重建客户端
+                        st.info("🔄 AI服务已重新初始化，新配置已生效")
                     
                 except Exception as e:
                     st.error(f"❌ 保存配置时发生错误: {str(e)}")
@@ -734,12 +1067,12 @@ class KnowledgeSearchApp:
                         # 删除按钮
                         if provider_key != "openai":  # 保护OpenAI配置不被删除
                             if st.button(f"🗑️ 删除 {provider_key}", key=f"delete_{provider_key}"):
-                                updated_config = config.copy()
+                                updated_config = copy.deepcopy(config)
                                 del updated_config[provider_key]
                                 try:
-                                    self.config_manager.save_config(updated_config)
-                                    st.success(f"✅ 已删除 {provider_key} 配置")
-                                    st.rerun()
+                                    if self.config_manager.save_config(updated_config, loaded_version):
+                                        st.success(f"✅ 已删除 {provider_key} 配置")
+                                        st.rerun()
                                 except Exception as e:
                                     st.error(f"❌ 删除配置时发生错误: {str(e)}")
         
@@ -0,0 +1,237 @@
+"""
+负载测试模块
+使用 Streamlit 测试接口（streamlit.testing.v1.AppTest）无界面地回放脚本化用户会话，
+多个会话在独立进程中并行执行，统计每次交互的延迟以及每个会话的CPU和内存占用
+
+运行命令: python loadtest.py --sessions 32 --parallel 8
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from bench_stubs import StubServer
+from bench_utils import percentile
+
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_SCRIPT = os.path.join(APP_DIR, "ai.py")
+
+# 默认会话脚本：搜索、翻页、普通问答、联网问答、重新回答
+DEFAULT_SCRIPT = ["open", "search", "next_page", "chat", "chat_web", "regenerate"]
+
+SEARCH_QUERIES = ["人工智能", "算力芯片", "新能源汽车", "半导体设备"]
+CHAT_QUESTIONS = ["今年人工智能行业的主要投资机会是什么？", "算力需求增长会带动哪些环节？"]
+
+
+def _current_rss_mb():
+    """读取当前进程常驻内存（MB）"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        # 非 Linux 平台退化为峰值内存
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _find_button(app, label_prefix=None, key_prefix=None):
+    """按标签或key前缀查找按钮"""
+    for button in app.button:
+        if label_prefix and str(button.label).startswith(label_prefix):
+            return button
+        if key_prefix and str(button.key or "").startswith(key_prefix):
+            return button
+    return None
+
+
+def _switch_page(app, page):
+    """通过侧边栏单选框切换页面"""
+    if app.session_state["current_page"] != page:
+        app.radio[0].set_value(page).run()
+        # 页面切换会触发一次额外重跑
+        app.run()
+
+
+def _step(app, step, session_id):
+    """
+    执行一个脚本步骤
+
+    Args:
+        app: AppTest 实例
+        step (str): 步骤名称
+        session_id (int): 会话编号（用于选择查询文本）
+    """
+    if step == "open":
+        app.run()
+    elif step == "search":
+        _switch_page(app, "知识库搜索")
+        app.text_input(key="search_query_input").input(SEARCH_QUERIES[session_id % len(SEARCH_QUERIES)])
+        _find_button(app, label_prefix="搜索").click().run()
+    elif step == "next_page":
+        # 存在翻页按钮时点击翻页，否则增大返回数量重新搜索
+        next_button = _find_button(app, label_prefix="下一页")
+        if next_button is not None:
+            next_button.click().run()
+        else:
+            app.number_input[0].set_value(app.number_input[0].value + 10)
+            _find_button(app, label_prefix="搜索").click().run()
+    elif step in ("chat", "chat_web"):
+        _switch_page(app, "AI问答")
+        web_checkbox = app.checkbox[0]
+        if web_checkbox.value != (step == "chat_web"):
+            web_checkbox.set_value(step == "chat_web").run()
+        app.chat_input[0].set_value(CHAT_QUESTIONS[session_id % len(CHAT_QUESTIONS)]).run()
+    elif step == "regenerate":
+        _switch_page(app, "AI问答")
+        regenerate_button = _find_button(app, key_prefix="regenerate_")
+        if regenerate_button is not None:
+            regenerate_button.click().run()
+    else:
+        raise ValueError(f"未知的步骤: {step}")
+
+
+def run_session(args):
+    """
+    在当前进程中执行一个完整的会话脚本
+
+    Args:
+        args (tuple): (会话编号, 步骤列表, 工作目录, 单步超时秒数)
+
+    Returns:
+        dict: 会话结果（每步延迟、CPU时间、内存）
+    """
+    session_id, script, work_dir, timeout = args
+    from streamlit.testing.v1 import AppTest
+
+    # 应用从当前目录读取 config.json，并从应用目录导入模块
+    os.chdir(work_dir)
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+
+    baseline_rss = _current_rss_mb()
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    app = AppTest.from_file(APP_SCRIPT, default_timeout=timeout)
+
+    interactions = []
+    for step in script:
+        start = time.perf_counter()
+        error = None
+        try:
+            _step(app, step, session_id)
+            if app.exception:
+                error = str(app.exception[0].value)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        interactions.append({
+            "step": step,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+            "error": error,
+        })
+
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "session": session_id,
+        "pid": os.getpid(),
+        "interactions": interactions,
+        "cpu_seconds": round((usage_end.ru_utime - usage_start.ru_utime)
+                             + (usage_end.ru_stime - usage_start.ru_stime), 3),
+        "rss_mb": round(_current_rss_mb() - baseline_rss, 2),
+        "peak_rss_mb": round(usage_end.ru_maxrss / 1024, 2),
+    }
+
+
+def summarize(sessions, wall_seconds):
+    """
+    汇总负载测试结果
+
+    Args:
+        sessions (list): 各会话结果
+        wall_seconds (float): 总耗时
+
+    Returns:
+        dict: 汇总报告
+    """
+    per_step = {}
+    for session in sessions:
+        for interaction in session["interactions"]:
+            stats = per_step.setdefault(interaction["step"], {"latencies": [], "errors": 0})
+            stats["latencies"].append(interaction["latency_ms"])
+            stats["errors"] += 1 if interaction["error"] else 0
+    for stats in per_step.values():
+        stats["latencies"].sort()
+
+    cpu = [session["cpu_seconds"] for session in sessions]
+    rss = [session["rss_mb"] for session in sessions]
+    return {
+        "sessions": len(sessions),
+        "wall_seconds": round(wall_seconds, 2),
+        "interactions": {
+            step: {
+                "count": len(stats["latencies"]),
+                "errors": stats["errors"],
+                "p50_ms": percentile(stats["latencies"], 0.5),
+                "p95_ms": percentile(stats["latencies"], 0.95),
+                "p99_ms": percentile(stats["latencies"], 0.99),
+            }
+            for step, stats in per_step.items()
+        },
+        "cpu_seconds_per_session": {"mean": round(sum(cpu) / len(cpu), 3) if cpu else None, "max": max(cpu, default=None)},
+        "rss_mb_per_session": {"mean": round(sum(rss) / len(rss), 2) if rss else None, "max": max(rss, default=None)},
+    }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="无界面并发会话负载测试")
+    parser.add_argument("--sessions", type=int, default=16, help="会话总数")
+    parser.add_argument("--parallel", type=int, default=4, help="并行进程数")
+    parser.add_argument("--script", nargs="+", default=DEFAULT_SCRIPT, help="会话步骤列表")
+    parser.add_argument("--timeout", type=float, default=120, help="单步超时秒数")
+    parser.add_argument("--config", help="使用真实服务配置文件而不启动桩服务")
+    parser.add_argument("--profile", help="桩服务延迟/错误配置文件（JSON）")
+    parser.add_argument("--output", default="benchmark_results/loadtest.json", help="结果保存路径")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="loadtest_")
+    stub = None
+    if args.config:
+        shutil.copy(args.config, os.path.join(work_dir, "config.json"))
+    else:
+        profile = {}
+        if args.profile:
+            with open(args.profile, 'r', encoding='utf-8') as f:
+                profile = json.load(f)
+        stub = StubServer(profile).start()
+        with open(os.path.join(work_dir, "config.json"), 'w', encoding='utf-8') as f:
+            json.dump(stub.build_config(), f, ensure_ascii=False)
+
+    try:
+        tasks = [(i, args.script, work_dir, args.timeout) for i in range(args.sessions)]
+        wall_start = time.perf_counter()
+        # 每个进程只执行一个会话，便于单独统计CPU和内存
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(processes=args.parallel, maxtasksperchild=1) as pool:
+            sessions = pool.map(run_session, tasks)
+        wall_seconds = time.perf_counter() - wall_start
+    finally:
+        if stub:
+            stub.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"summary": summarize(sessions, wall_seconds), "sessions": sessions}
+    print(json.dumps(report["summary"], ensure_ascii=False, indent=2))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+本地向量嵌入模块
+在进程内用 CPU 运行小型句向量模型（ONNX 或 sentence-transformers），
+作为远程嵌入服务的备用方案，或直接用于短查询以降低延迟。
+模型在首次使用时加载，按批次推理；所需依赖均为可选，仅在启用时导入。
+
+注意：本地模型必须与建立索引时使用的嵌入模型一致（如 bge-m3 的 ONNX 导出版本），
+否则生成的向量与索引中的向量不在同一空间，无法用于语义检索
+"""
+
+import json
+import logging
+import os
+import threading
+
+from tracing import tracer
+
+
+# 本地推理后端
+LOCAL_EMBEDDING_BACKENDS = ("onnx", "sentence_transformers")
+
+# 进程级本地嵌入实例，按配置复用（模型只加载一次）
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+
+class LocalEmbedder:
+    """本地向量嵌入类"""
+
+    def __init__(self, local_config=None):
+        """
+        初始化本地嵌入器（不加载模型）
+
+        Args:
+            local_config (dict, optional): 本地嵌入配置
+        """
+        local_config = local_config or {}
+        self.logger = logging.getLogger(__name__)
+        self.backend = local_config.get("backend", "onnx")
+        if self.backend not in LOCAL_EMBEDDING_BACKENDS:
+            raise ValueError(f"未知的本地嵌入后端: {self.backend}")
+        self.model_path = local_config.get("model_path", "models/bge-m3-onnx")
+        # 缓存键使用的模型名称，默认与模型路径相同
+        self.model_name = local_config.get("model_name") or self.model_path
+        self.onnx_file = local_config.get("onnx_file", "model.onnx")
+        self.pooling = local_config.get("pooling", "cls")
+        self.normalize = local_config.get("normalize", True)
+        self.max_length = local_config.get("max_length", 128)
+        self.batch_size = max(1, local_config.get("batch_size", 16))
+        self.threads = local_config.get("threads", 2)
+        self._encode_batch = None
+        self._load_lock = threading.Lock()
+        # 推理占满 CPU 线程，多个请求排队执行，避免相互争抢
+        self._inference_lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        """模型是否已加载"""
+        return self._encode_batch is not None
+
+    def load(self):
+        """
+        加载模型（只加载一次，失败时抛出异常，下次调用会重试）
+
+        Raises:
+            ImportError: 未安装所选后端的依赖
+        """
+        if self._encode_batch is not None:
+            return
+        with self._load_lock:
+            if self._encode_batch is not None:
+                return
+            with tracer.span("embedding.local.load", provider=self.model_name, backend=self.backend):
+                if self.backend == "onnx":
+                    self._encode_batch = self._load_onnx()
+                else:
+                    self._encode_batch = self._load_sentence_transformers()
+            self.logger.info(f"本地嵌入模型已加载: {self.model_path} ({self.backend})")
+
+    def _load_onnx(self):
+        """加载 ONNX 模型和分词器，返回批量推理函数"""
+        # onnxruntime / tokenizers / numpy 为可选依赖，仅在使用该后端时导入
+        import numpy as np
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        session = onnxruntime.InferenceSession(
+            os.path.join(self.model_path, self.onnx_file), options, providers=["CPUExecutionProvider"]
+        )
+        input_names = {item.name for item in session.get_inputs()}
+        tokenizer = Tokenizer.from_file(os.path.join(self.model_path, "tokenizer.json"))
+        tokenizer.enable_truncation(max_length=self.max_length)
+        tokenizer.enable_padding()
+
+        def encode_batch(texts):
+            encodings = tokenizer.encode_batch(texts)
+            input_ids = np.array([item.ids for item in encodings], dtype=np.int64)
+            attention_mask = np.array([item.attention_mask for item in encodings], dtype=np.int64)
+            inputs = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in input_names:
+                inputs["token_type_ids"] = np.zeros_like(input_ids)
+            hidden = session.run(None, inputs)[0]
+            if self.pooling == "mean":
+                mask = attention_mask[:, :, None].astype(hidden.dtype)
+                vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            else:
+                vectors = hidden[:, 0]
+            if self.normalize:
+                vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+            return vectors.tolist()
+
+        return encode_batch
+
+    def _load_sentence_transformers(self):
+        """加载 sentence-transformers 模型，返回批量推理函数"""
+        # sentence-transformers 为可选依赖，仅在使用该后端时导入
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(self.model_path, device="cpu")
+        model.max_seq_length = self.max_length
+
+        def encode_batch(texts):
+            return model.encode(
+                texts, batch_size=len(texts), normalize_embeddings=self.normalize, show_progress_bar=False
+            ).tolist()
+
+        return encode_batch
+
+    def encode(self, texts):
+        """
+        批量计算文本的向量嵌入（按 batch_size 分批推理）
+
+        Args:
+            texts (list): 文本列表
+
+        Returns:
+            list: 与输入顺序一致的向量嵌入列表
+        """
+        self.load()
+        texts = list(texts)
+        vectors = []
+        with tracer.span("embedding.local", provider=self.model_name, texts=len(texts)):
+            with self._inference_lock:
+                for start in range(0, len(texts), self.batch_size):
+                    vectors.extend(self._encode_batch(texts[start:start + self.batch_size]))
+        return vectors
+
+
+def get_local_embedder(local_config=None):
+    """
+    获取进程级共享的本地嵌入实例（相同配置返回同一实例）
+
+    Args:
+        local_config (dict, optional): 本地嵌入配置
+
+    Returns:
+        LocalEmbedder: 本地嵌入实例（模型在首次使用时加载）
+    """
+    local_config = local_config or {}
+    config_key = json.dumps(local_config, sort_keys=True)
+    with _embedders_lock:
+        embedder = _embedders.get(config_key)
+        if embedder is None:
+            embedder = LocalEmbedder(local_config)
+            _embedders[config_key] = embedder
+        return embedder
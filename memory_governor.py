@@ -0,0 +1,320 @@
+"""
+内存管理模块
+估算每个浏览器会话在服务端占用的内存（对话历史、会话内服务实例等），
+进程总占用超过阈值时，先把空闲会话的大对象转存到磁盘或丢弃（可重建），
+仍超出时再裁剪进程内共享缓存，避免容器在长时间运行后因内存不足被终止
+"""
+
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from tracing import tracer
+
+
+# 进程级内存管理器，所有会话共享
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def estimate_size(obj, seen=None):
+    """
+    估算对象及其引用对象占用的内存（字节）
+
+    Args:
+        obj: 任意对象
+        seen (set, optional): 已统计过的对象ID
+
+    Returns:
+        int: 字节数
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, OrderedDict)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(estimate_size(getattr(obj, name), seen)
+                    for name in obj.__slots__ if hasattr(obj, name))
+    elif hasattr(obj, "__dict__"):
+        size += estimate_size(vars(obj), seen)
+    return size
+
+
+def process_rss_bytes():
+    """
+    获取当前进程的常驻内存（字节），仅支持 Linux，其他平台返回 None
+    """
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SessionObjects(dict):
+    """会话内可重建对象的字典（如服务实例），支持弱引用，会话空闲时可被整体清空"""
+
+
+class _SessionRecord:
+    """单个会话的跟踪记录"""
+
+    __slots__ = ("last_active", "objects", "size", "dirty", "evicted")
+
+    def __init__(self):
+        self.last_active = time.time()
+        # 名称 -> (对象弱引用, 估算大小函数, 回收函数)
+        self.objects = {}
+        self.size = 0
+        self.dirty = True
+        self.evicted = False
+
+
+class MemoryGovernor:
+    """内存管理器类"""
+
+    def __init__(self, memory_config=None):
+        """
+        初始化内存管理器
+
+        Args:
+            memory_config (dict, optional): 内存管理配置
+        """
+        self.logger = logging.getLogger(__name__)
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_check = 0.0
+        # RSS 超限且已回收后的估算字节数；RSS 未回落时只回收此后新增的部分
+        self._rss_floor = None
+        self.evictions = 0
+        self.cache_trims = 0
+        self.configure(memory_config)
+
+    def configure(self, memory_config=None):
+        """
+        应用内存管理配置（可重复调用，配置文件变化后自动生效）
+
+        Args:
+            memory_config (dict, optional): 内存管理配置
+        """
+        memory_config = memory_config or {}
+        self.enabled = memory_config.get("enabled", True)
+        self.max_tracked_bytes = int(memory_config.get("max_tracked_mb", 512) * 1024 * 1024)
+        self.max_rss_bytes = int((memory_config.get("max_rss_mb") or 0) * 1024 * 1024)
+        self.idle_seconds = memory_config.get("idle_seconds", 900)
+        self.check_interval = memory_config.get("check_interval", 30)
+        self.target_ratio = memory_config.get("target_ratio", 0.8)
+
+    def register(self, session_id, name, obj, evict, size=estimate_size):
+        """
+        登记会话中的大对象（重复登记同名对象时替换）
+
+        Args:
+            session_id (str): 会话标识
+            name (str): 对象名称
+            obj: 对象（需支持弱引用，会话结束被回收后自动移除）
+            evict (callable): 回收函数，参数为对象，负责转存到磁盘或清空可重建的内容
+            size (callable): 估算对象占用字节数的函数
+        """
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                record = self._sessions[session_id] = _SessionRecord()
+            record.objects[name] = (weakref.ref(obj), size, evict)
+            record.dirty = True
+
+    def touch(self, session_id):
+        """
+        标记会话活跃（每次页面运行时调用），必要时执行一次内存检查
+
+        Args:
+            session_id (str): 会话标识
+        """
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is not None:
+                record.last_active = time.time()
+                record.dirty = True
+                record.evicted = False
+        self.maybe_enforce()
+
+    def maybe_enforce(self):
+        """距离上次检查超过 check_interval 时执行内存检查"""
+        if not self.enabled or time.time() - self._last_check < self.check_interval:
+            return None
+        return self.enforce()
+
+    def _measure(self):
+        """
+        重新估算有变化的会话的大小，并移除已结束的会话
+
+        Returns:
+            int: 所有会话的估算总字节数
+        """
+        total = 0
+        with self._lock:
+            for session_id, record in list(self._sessions.items()):
+                alive = {name: item for name, item in record.objects.items() if item[0]() is not None}
+                if not alive:
+                    del self._sessions[session_id]
+                    continue
+                record.objects = alive
+                if record.dirty:
+                    record.size = sum(size(ref()) for ref, size, _ in alive.values()
+                                      if ref() is not None)
+                    record.dirty = False
+                total += record.size
+        return total
+
+    def _over_limit(self, tracked_bytes, rss_bytes):
+        if self.max_tracked_bytes and tracked_bytes > self.max_tracked_bytes:
+            return True
+        return bool(self.max_rss_bytes and rss_bytes and rss_bytes > self.max_rss_bytes)
+
+    def enforce(self):
+        """
+        检查内存占用，超过阈值时回收空闲会话的大对象，仍超出时裁剪进程内共享缓存
+
+        Returns:
+            dict: 本次检查的结果
+        """
+        # 共享缓存在此处按需导入，避免与缓存模块循环依赖
+        from cache_backend import memory_cache_bytes, trim_memory_caches
+
+        self._last_check = time.time()
+        with tracer.span("memory.enforce") as span:
+            tracked = self._measure() + memory_cache_bytes()
+            rss = process_rss_bytes()
+            result = {"tracked_bytes": tracked, "rss_bytes": rss, "evicted_sessions": 0, "cache_freed_bytes": 0}
+            rss_over = bool(self.max_rss_bytes and rss and rss > self.max_rss_bytes)
+            if not rss_over:
+                self._rss_floor = None
+            tracked_over = self._over_limit(tracked, None)
+            if not (tracked_over or rss_over) or (
+                    not tracked_over and self._rss_floor is not None and tracked <= self._rss_floor):
+                span.set(tracked_bytes=tracked)
+                return result
+
+            # RSS 只作为触发条件：CPython 很少把释放的内存还给操作系统，回收进度按估算字节数衡量，
+            # RSS 超限时只回收超出的部分（且不低于上次回收后的水平），避免每次检查都清空所有缓存
+            target = int(self.max_tracked_bytes * self.target_ratio) if self.max_tracked_bytes else tracked
+            if rss_over:
+                rss_target = max(0, tracked - (rss - int(self.max_rss_bytes * self.target_ratio)))
+                if self._rss_floor is not None:
+                    rss_target = max(rss_target, self._rss_floor)
+                target = min(target, rss_target)
+            now = time.time()
+            with self._lock:
+                idle = sorted(
+                    ((session_id, record) for session_id, record in self._sessions.items()
+                     if not record.evicted and now - record.last_active >= self.idle_seconds),
+                    key=lambda item: item[1].last_active
+                )
+            # 1. 从最久未活跃的会话开始，回收其大对象
+            for session_id, record in idle:
+                if tracked <= target:
+                    break
+                before = record.size
+                self._evict_session(session_id, record)
+                tracked -= before - record.size
+                result["evicted_sessions"] += 1
+
+            if result["evicted_sessions"]:
+                gc.collect()
+                rss = process_rss_bytes()
+                result["rss_bytes"] = rss
+
+            # 2. 仍超出时按差额裁剪进程内共享缓存（可重新计算）
+            if tracked > target and self._over_limit(tracked, rss):
+                freed = trim_memory_caches(tracked - target)
+                tracked -= freed
+                result["cache_freed_bytes"] = freed
+                if freed:
+                    self.cache_trims += 1
+                    tracer.increment("memory_cache_trims")
+
+            if self.max_rss_bytes and rss and rss > self.max_rss_bytes:
+                self._rss_floor = tracked
+            if self._over_limit(tracked, None):
+                self.logger.warning(f"活跃会话内存占用仍超过上限: 约 {tracked / 1024 / 1024:.1f} MB")
+            result["tracked_bytes"] = tracked
+            span.set(tracked_bytes=tracked, evicted_sessions=result["evicted_sessions"],
+                     cache_freed_bytes=result["cache_freed_bytes"])
+            return result
+
+    def _evict_session(self, session_id, record):
+        """回收单个空闲会话的所有已登记对象"""
+        for name, (ref, size, evict) in list(record.objects.items()):
+            obj = ref()
+            if obj is None:
+                continue
+            try:
+                evict(obj)
+            except Exception as e:
+                self.logger.warning(f"回收会话 {session_id[:8]} 的 {name} 失败: {e}")
+        with self._lock:
+            record.evicted = True
+            record.size = sum(size(ref()) for ref, size, _ in record.objects.values() if ref() is not None)
+            record.dirty = False
+        self.evictions += 1
+        tracer.increment("memory_session_evictions")
+        self.logger.info(f"已回收空闲会话 {session_id[:8]} 的内存")
+
+    def report(self):
+        """
+        生成内存报告
+
+        Returns:
+            dict: 包含各会话估算大小、空闲时间、共享缓存大小、进程常驻内存等
+        """
+        from cache_backend import memory_cache_bytes
+
+        sessions_bytes = self._measure()
+        now = time.time()
+        with self._lock:
+            sessions = [
+                {
+                    "session": session_id[:8],
+                    "idle_seconds": int(now - record.last_active),
+                    "bytes": record.size,
+                    "evicted": record.evicted,
+                }
+                for session_id, record in self._sessions.items()
+            ]
+        return {
+            "sessions": sorted(sessions, key=lambda row: row["bytes"], reverse=True),
+            "sessions_bytes": sessions_bytes,
+            "cache_bytes": memory_cache_bytes(),
+            "rss_bytes": process_rss_bytes(),
+            "limit_bytes": self.max_tracked_bytes,
+            "evictions": self.evictions,
+            "cache_trims": self.cache_trims,
+        }
+
+
+def get_memory_governor(memory_config=None):
+    """
+    获取进程级内存管理器，传入配置时同时更新其配置
+
+    Args:
+        memory_config (dict, optional): 内存管理配置
+
+    Returns:
+        MemoryGovernor: 内存管理器实例
+    """
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = MemoryGovernor(memory_config)
+        elif memory_config is not None:
+            _governor.configure(memory_config)
+        return _governor
@@ -0,0 +1,143 @@
+"""
+预取服务模块
+用户浏览当前页搜索结果时，在后台预先获取下一页结果并生成摘要/关键词，
+同时为可能的后续查询（搜索建议）计算向量，结果写入共享缓存，下一次交互可直接命中
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from dedup_service import ResultDeduplicator
+from tracing import tracer
+
+
+# 进程级预取器，所有会话共享同一个线程池和任务预算
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+class Prefetcher:
+    """后台预取器类（线程池和任务预算进程级共享，搜索/AI服务由每次调用传入，跟随发起会话的服务商和模型）"""
+
+    def __init__(self, prefetch_config=None, dedup_config=None):
+        """
+        初始化预取器
+
+        Args:
+            prefetch_config (dict, optional): 预取配置
+            dedup_config (dict, optional): 去重配置（与页面保持一致，只为每个聚类生成一次摘要）
+        """
+        prefetch_config = prefetch_config or {}
+        self.logger = logging.getLogger(__name__)
+        self.enabled = prefetch_config.get("enabled", True)
+        self.enrich_limit = prefetch_config.get("enrich_limit", 10)
+        self.suggestion_limit = prefetch_config.get("suggestion_limit", 3)
+        self.max_pending = prefetch_config.get("max_pending", 20)
+        self.deduplicator = ResultDeduplicator(dedup_config)
+        self.executor = ThreadPoolExecutor(
+            max_workers=prefetch_config.get("max_workers", 2), thread_name_prefix="prefetch"
+        )
+        # 排队或执行中的任务键，避免重复提交
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _submit(self, task_key, func, *args):
+        """
+        提交预取任务，超出预算或已在执行时丢弃
+
+        Returns:
+            bool: 是否提交成功
+        """
+        if not self.enabled:
+            return False
+        with self._lock:
+            if task_key in self._pending or len(self._pending) >= self.max_pending:
+                tracer.increment("prefetch_skipped", label=task_key[0])
+                return False
+            self._pending.add(task_key)
+
+        def run():
+            try:
+                func(*args)
+            except Exception as e:
+                # 预取失败不影响用户操作，真正访问时会重新请求
+                self.logger.warning(f"预取失败 {task_key[0]}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(task_key)
+
+        self.executor.submit(run)
+        return True
+
+    def prefetch_next_page(self, search_service, ai_service, query, knowledge_base, top_k, semantic_ratio, page,
+                           filter_expression=None):
+        """
+        预取下一页搜索结果及其摘要/关键词
+
+        Args:
+            search_service: 发起会话的搜索服务实例
+            ai_service: 发起会话的AI服务实例（摘要按其服务商和模型生成并缓存）
+            query (str): 搜索查询
+            knowledge_base (str): 知识库名称
+            top_k (int): 每页结果数量
+            semantic_ratio (float): 语义搜索权重
+            page (int): 当前页码（从0开始）
+            filter_expression (str, optional): Meilisearch 过滤表达式
+        """
+        offset = (page + 1) * top_k
+        # 不同服务商/模型生成的摘要缓存键不同，分别预取
+        model = ai_service.current_provider_config.get("model")
+        self._submit(
+            ("next_page", ai_service.default_provider, model, knowledge_base, query, top_k, semantic_ratio, offset,
+             filter_expression),
+            self._prefetch_page, search_service, ai_service, query, knowledge_base, top_k, semantic_ratio, offset,
+            filter_expression
+        )
+
+    def _prefetch_page(self, search_service, ai_service, query, knowledge_base, top_k, semantic_ratio, offset,
+                       filter_expression=None):
+        with tracer.span("prefetch.next_page", knowledge_base=knowledge_base, offset=offset) as span:
+            hits = search_service.search_page(query, knowledge_base, top_k, semantic_ratio, offset,
+                                                   filter_expression)
+            enriched = 0
+            for cluster in self.deduplicator.deduplicate(hits)[:self.enrich_limit]:
+                hit = cluster["primary"]
+                # 与页面渲染逻辑一致：已有离线生成字段的文档无需预取
+                if hit.get('ai_summary') and hit.get('ai_keywords'):
+                    continue
+                content = hit.get('content', '') or hit.get('abstract', '')
+                # AI服务熔断期间跳过预取摘要
+                if content and ai_service.available:
+                    ai_service.generate_enrichment(content)
+                    enriched += 1
+            span.set(hits=len(hits), enriched=enriched)
+
+    def prefetch_queries(self, search_service, queries):
+        """
+        为可能的后续查询（如搜索建议）预先计算向量
+
+        Args:
+            search_service: 发起会话的搜索服务实例
+            queries (list): 查询文本列表
+        """
+        for query in queries[:self.suggestion_limit]:
+            self._submit(("query_embedding", query), search_service.get_query_embedding, query)
+
+
+def get_prefetcher(prefetch_config=None, dedup_config=None):
+    """
+    获取进程级共享预取器
+
+    Args:
+        prefetch_config (dict, optional): 预取配置
+        dedup_config (dict, optional): 去重配置
+
+    Returns:
+        Prefetcher: 预取器实例
+    """
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher(prefetch_config, dedup_config)
+        return _prefetcher
@@ -3,9 +3,77 @@
 负责处理文档搜索和向量嵌入相关功能
 """
 
+import logging
+import threading
+from datetime import datetime, time as dt_time, timedelta
+
 import requests
 import streamlit as st
 from meilisearch import Client
+from meilisearch.errors import MeilisearchApiError
+from cache_backend import get_cache_backend, make_cache_key
+from circuit_breaker import get_circuit_breaker
+from local_embedding import get_local_embedder
+from tracing import tracer
+
+
+def _quote_filter_value(value):
+    """转义 Meilisearch 过滤表达式中的字符串值"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _is_meilisearch_failure(error):
+    """请求参数错误（4xx）说明服务本身可用，不计入熔断"""
+    return not isinstance(error, MeilisearchApiError) or error.status_code >= 500
+
+
+def describe_filter_error(error):
+    """
+    把 Meilisearch 过滤表达式错误转换为可读的提示
+
+    Args:
+        error (Exception): 搜索时抛出的异常
+
+    Returns:
+        str or None: 提示信息，不是过滤表达式错误时返回None
+    """
+    if not isinstance(error, MeilisearchApiError) or error.code != "invalid_search_filter":
+        return None
+    return (f"筛选条件无效：{error.message}。请确认筛选字段已设置为可过滤属性；"
+            f"日期按字符串比较需要 Meilisearch 1.15 及以上版本，较早版本请以时间戳存储日期并将 facets.date_format 设为 timestamp")
+
+
+def build_filter_expression(values=None, date_field=None, date_from=None, date_to=None, date_format="string"):
+    """
+    把筛选条件转换为 Meilisearch filter 表达式
+    
+    Args:
+        values (dict, optional): 字段 -> 选中的取值列表（同一字段内为"或"，不同字段间为"且"）
+        date_field (str, optional): 日期字段名
+        date_from (datetime.date, optional): 开始日期（含）
+        date_to (datetime.date, optional): 结束日期（含）
+        date_format (str): 日期字段的存储格式，string 为 "YYYY-MM-DD" 开头的字符串（字符串范围比较需要
+            Meilisearch 1.15 及以上版本），timestamp 为秒级时间戳
+        
+    Returns:
+        str or None: 过滤表达式，没有筛选条件时返回None
+    """
+    clauses = [
+        f"{field} IN [{', '.join(_quote_filter_value(value) for value in selected)}]"
+        for field, selected in (values or {}).items() if selected
+    ]
+    if date_field:
+        def encode(day):
+            if date_format == "timestamp":
+                return str(int(datetime.combine(day, dt_time.min).timestamp()))
+            return _quote_filter_value(day.isoformat())
+        
+        if date_from:
+            clauses.append(f"{date_field} >= {encode(date_from)}")
+        if date_to:
+            # 使用次日零点作为上界，包含结束日期当天带时间的记录
+            clauses.append(f"{date_field} < {encode(date_to + timedelta(days=1))}")
+    return " AND ".join(clauses) or None
 
 
 class SearchService:
@@ -19,18 +87,92 @@ class SearchService:
             config_manager: 配置管理器实例
         """
         self.config_manager = config_manager
-        self.embedding_config = config_manager.get_embedding_config()
-        self.meilisearch_config = config_manager.get_meilisearch_config()
+        self.logger = logging.getLogger(__name__)
+        self._apply_config()
+        # 只有相关配置节变化时才重建客户端
+        config_manager.subscribe(self._on_config_change, ("embedding", "meilisearch", "cache", "facets", "local_embedding",
+                                                         "circuit_breaker"))
+    
+    def _apply_config(self):
+        """根据当前配置初始化客户端"""
+        self.embedding_config = self.config_manager.get_embedding_config()
+        self.meilisearch_config = self.config_manager.get_meilisearch_config()
+        # Meilisearch 中配置的嵌入器名称
+        self.embedder_name = self.embedding_config.get("embedder", "bge_m3")
+        # 外部依赖的熔断器（进程级共享），依赖不可用时快速失败并降级
+        breaker_config = self.config_manager.get_circuit_breaker_config()
+        self.embedding_breaker = get_circuit_breaker("embedding", breaker_config)
+        self.meilisearch_breaker = get_circuit_breaker("meilisearch", breaker_config)
+        # 进程级共享缓存（查询向量、搜索结果和分面统计）
+        self.cache = get_cache_backend(self.config_manager.get_cache_config())
+        self.facet_config = self.config_manager.get_facet_config()
+        # 分面字段未设置为可过滤的知识库，不再请求分面统计
+        self._facets_unsupported = set()
+        
+        # 本地嵌入模型（可选）：fallback 仅在远程嵌入服务失败时使用，primary 直接用于短查询
+        self.local_embedding_config = self.config_manager.get_local_embedding_config()
+        self.local_embedder = None
+        if self.local_embedding_config.get("enabled", False):
+            self.local_embedder = get_local_embedder(self.local_embedding_config)
+            if self.local_embedding_config.get("preload", False) and not self.local_embedder.loaded:
+                threading.Thread(target=self._preload_local_embedder, daemon=True).start()
         
         # 初始化 Meilisearch 客户端
         self.meili_client = Client(
             self.meilisearch_config["url"],
-            self.meilisearch_config["api_key"]
+            self.meilisearch_config["api_key"],
+            timeout=self.meilisearch_config.get("timeout", 10)
         )
     
+    def _on_config_change(self, old_config, new_config):
+        """配置变更回调"""
+        self._apply_config()
+    
+    def _preload_local_embedder(self):
+        """在后台加载本地嵌入模型，避免首个查询等待"""
+        try:
+            self.local_embedder.load()
+        except Exception as e:
+            self.logger.warning(f"预加载本地嵌入模型失败: {e}")
+    
     def get_embedding(self, query):
         """
-        获取文本的向量嵌入表示
+        获取文本的向量嵌入表示（失败时在页面提示，搜索将退回关键词模式）
+        
+        Args:
+            query (str): 查询文本
+            
+        Returns:
+            list: 向量嵌入，无法获取时返回None
+        """
+        try:
+            return self.get_query_embedding(query)
+        except Exception as e:
+            st.warning(f"获取向量嵌入失败，已改用关键词搜索：{str(e)}")
+            return None
+    
+    def try_query_embedding(self, query):
+        """
+        获取查询文本的向量嵌入，失败时返回None（可在后台线程中调用）
+        
+        Args:
+            query (str): 查询文本
+            
+        Returns:
+            list or None: 向量嵌入
+        """
+        try:
+            return self.get_query_embedding(query)
+        except Exception as e:
+            self.logger.warning(f"获取向量嵌入失败，使用关键词搜索: {e}")
+            return None
+    
+    def get_query_embedding(self, query):
+        """
+        获取查询文本的向量嵌入（带缓存，失败时抛出异常，可在后台线程中调用）
+        
+        启用本地嵌入时，primary 模式下不超过 primary_max_chars 的短查询直接在本地计算；
+        远程嵌入服务失败时改用本地模型计算
         
         Args:
             query (str): 查询文本
@@ -38,26 +180,71 @@ class SearchService:
         Returns:
             list: 向量嵌入
         """
+        local = self.local_embedder
+        if (local is not None and self.local_embedding_config.get("mode", "fallback") == "primary"
+                and len(query) <= self.local_embedding_config.get("primary_max_chars", 32)):
+            return self._get_local_query_embedding(query)
+        try:
+            return self.cache.get_or_compute(
+                "embedding",
+                make_cache_key(self.embedding_config["model"], query),
+                lambda: self.get_embeddings([query])[0]
+            )
+        except Exception as e:
+            if local is None:
+                raise
+            self.logger.warning(f"远程嵌入服务失败，改用本地嵌入模型: {e}")
+            return self._get_local_query_embedding(query)
+    
+    def _get_local_query_embedding(self, query):
+        """使用本地模型计算查询向量（按本地模型名称单独缓存）"""
+        return self.cache.get_or_compute(
+            "embedding",
+            make_cache_key(self.local_embedder.model_name, query),
+            lambda: self.local_embedder.encode([query])[0]
+        )
+    
+    def get_embeddings(self, texts):
+        """
+        批量获取文本的向量嵌入（一次请求通过 texts 数组提交多条文本）
+        
+        Args:
+            texts (list): 文本列表
+            
+        Returns:
+            list: 与输入顺序一致的向量嵌入列表
+            
+        Raises:
+            CircuitOpenError: 嵌入服务已熔断时抛出
+            Exception: 请求失败、超时或返回数量不一致时抛出
+        """
         url = self.embedding_config["url"]
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.embedding_config['api_key']}"
         }
         payload = {
-            "texts": [query],
+            "texts": list(texts),
             "model": self.embedding_config["model"]
         }
         
-        try:
-            response = requests.post(url, headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            return data["data"][0]["embedding"]
-        except Exception as e:
-            st.error(f"获取向量嵌入失败：{str(e)}")
-            return None
+        # 单条查询使用较短的超时，批量请求（导入、评估）允许更长时间
+        timeout = (self.embedding_config.get("timeout", 10) if len(payload["texts"]) <= 1
+                   else self.embedding_config.get("batch_timeout", 120))
+        
+        with tracer.span("embedding", provider=self.embedding_config["model"], texts=len(payload["texts"])):
+            with self.embedding_breaker.protect():
+                response = requests.post(url, headers=headers, json=payload, timeout=timeout)
+                response.raise_for_status()
+                data = response.json()["data"]
+        if len(data) != len(payload["texts"]):
+            raise ValueError(f"向量嵌入数量不一致：请求 {len(payload['texts'])} 条，返回 {len(data)} 条")
+        # 服务端若返回 index 字段则按其排序，保证与输入顺序一致
+        if all("index" in item for item in data):
+            data = sorted(data, key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
     
-    def search_hybrid(self, query, knowledge_base, top_k, semantic_ratio):
+    def search_hybrid(self, query, knowledge_base, top_k, semantic_ratio, offset=0, filter_expression=None):
         """
         使用混合搜索（关键词+语义）在 Meilisearch 中搜索文档
         
@@ -66,36 +253,175 @@ class SearchService:
             knowledge_base (str): 知识库名称
             top_k (int): 返回结果数量
             semantic_ratio (float): 语义搜索权重
+            offset (int): 跳过的结果数量（用于翻页）
+            filter_expression (str, optional): Meilisearch 过滤表达式
             
         Returns:
             tuple: (搜索结果列表, 是否成功)
         """
+        # 获取查询文本的向量嵌入（失败时在页面提示，并退回关键词搜索）
+        embedding = self.get_embedding(query)
+        
         try:
-            # 获取指定知识库的索引
-            index = self.meili_client.index(knowledge_base)
+            return self.search_page(query, knowledge_base, top_k, semantic_ratio, offset, filter_expression,
+                                    embedding=embedding, keyword_only=embedding is None), True
             
-            # 获取查询文本的向量嵌入
-            embedding = self.get_embedding(query)
-            if embedding is None:
-                return [], False
+        except Exception as e:
+            st.error(describe_filter_error(e) or f"连接 Meilisearch 失败：{str(e)}")
+            return [], False
+    
+    def search_page(self, query, knowledge_base, top_k, semantic_ratio, offset=0, filter_expression=None,
+                    embedding=None, keyword_only=False):
+        """
+        获取一页混合搜索结果（带缓存，失败时抛出异常，可在后台线程中调用）
+        
+        无法获取查询向量时退回关键词搜索，结果按关键词模式单独缓存
+        
+        Args:
+            query (str): 搜索查询
+            knowledge_base (str): 知识库名称
+            top_k (int): 每页结果数量
+            semantic_ratio (float): 语义搜索权重
+            offset (int): 跳过的结果数量
+            filter_expression (str, optional): Meilisearch 过滤表达式
+            embedding (list, optional): 已计算好的查询向量，为空时在此获取
+            keyword_only (bool): 已确认无法获取查询向量，直接使用关键词搜索
             
-            # 执行混合搜索
-            results = index.search(
-                query,
-                {
-                    "vector": embedding,
-                    "hybrid": {
-                        "semanticRatio": 1 - semantic_ratio,  # 语义搜索权重
-                        "embedder": "bge_m3"  # 嵌入模型名称
-                    },
-                    "limit": top_k  # 返回结果数量限制
-                }
-            )
-            return results.get("hits", []), True
+        Returns:
+            list: 搜索结果列表
+        """
+        if embedding is None and not keyword_only:
+            embedding = self.try_query_embedding(query)
+        mode = self.embedder_name if embedding is not None else "keyword"
+        return self.cache.get_or_compute(
+            "search",
+            make_cache_key(knowledge_base, query, top_k, semantic_ratio, offset, mode, filter_expression),
+            lambda: self._search_hybrid(query, knowledge_base, top_k, semantic_ratio, offset, filter_expression,
+                                        embedding)
+        )
+    
+    def _search_hybrid(self, query, knowledge_base, top_k, semantic_ratio, offset, filter_expression=None,
+                       embedding=None):
+        """执行混合搜索（embedding 为空时只做关键词搜索），失败时抛出异常"""
+        if filter_expression:
+            results = self.search_with_vector(query, knowledge_base, embedding, top_k, semantic_ratio, offset,
+                                              filter=filter_expression)
+            return results.get("hits", [])
+        
+        # 未筛选的首页请求顺带返回分面统计，写入缓存供侧边栏使用，无需额外请求
+        facet_fields = self.facet_fields
+        if not facet_fields or offset:
+            results = self.search_with_vector(query, knowledge_base, embedding, top_k, semantic_ratio, offset)
+            return results.get("hits", [])
+        results = self._search_with_facets(query, knowledge_base, embedding, top_k, semantic_ratio, facet_fields)
+        self.cache.set(
+            f"facets:{self._facet_cache_key(query, knowledge_base)}",
+            self._facet_summary(results), self.cache.ttl_for("facets")
+        )
+        return results.get("hits", [])
+    
+    @property
+    def facet_fields(self):
+        """参与分面统计的字段（需在索引中设置为 filterableAttributes）"""
+        if not self.facet_config.get("enabled", True):
+            return []
+        fields = list(self.facet_config.get("fields", ["industry", "organization"]))
+        date_field = self.facet_config.get("date_field", "publish_time")
+        if date_field and date_field not in fields:
+            fields.append(date_field)
+        return fields
+    
+    def _facet_cache_key(self, query, knowledge_base):
+        return make_cache_key(knowledge_base, query, self.facet_fields)
+    
+    @staticmethod
+    def _facet_summary(results):
+        """从搜索结果中提取分面统计"""
+        return {
+            "distribution": results.get("facetDistribution", {}),
+            "stats": results.get("facetStats", {}),
+        }
+    
+    def _search_with_facets(self, query, knowledge_base, embedding, limit, semantic_ratio, facet_fields):
+        """请求分面统计的搜索；字段未设置为可过滤时退回普通搜索，返回空统计"""
+        if knowledge_base in self._facets_unsupported:
+            return self.search_with_vector(query, knowledge_base, embedding, limit, semantic_ratio)
+        try:
+            return self.search_with_vector(query, knowledge_base, embedding, limit, semantic_ratio,
+                                           facets=facet_fields)
+        except MeilisearchApiError as e:
+            if e.code != "invalid_search_facets":
+                raise
+            self.logger.warning(f"知识库 {knowledge_base} 不支持分面统计: {e.message}")
+            self._facets_unsupported.add(knowledge_base)
+            return self.search_with_vector(query, knowledge_base, embedding, limit, semantic_ratio)
+    
+    def get_facet_distribution(self, query, knowledge_base):
+        """
+        获取查询在知识库中的分面统计（按知识库和查询缓存，失败时返回空统计）
+        
+        Args:
+            query (str): 搜索查询
+            knowledge_base (str): 知识库名称
             
+        Returns:
+            dict: {"distribution": {字段: {取值: 数量}}, "stats": {数值字段: {"min", "max"}}}
+        """
+        facet_fields = self.facet_fields
+        if not facet_fields:
+            return {"distribution": {}, "stats": {}}
+        
+        def fetch():
+            embedding = self.try_query_embedding(query)
+            semantic_ratio = self.config_manager.get_search_config().get("default_semantic_ratio", 0.5)
+            return self._facet_summary(
+                self._search_with_facets(query, knowledge_base, embedding, 1, semantic_ratio, facet_fields)
+            )
+        
+        try:
+            return self.cache.get_or_compute("facets", self._facet_cache_key(query, knowledge_base), fetch)
         except Exception as e:
-            st.error(f"连接 Meilisearch 失败：{str(e)}")
-            return [], False
+            self.logger.warning(f"获取分面统计失败: {e}")
+            return {"distribution": {}, "stats": {}}
+    
+    def search_with_vector(self, query, knowledge_base, embedding, limit, semantic_ratio, offset=0, **options):
+        """
+        使用已计算好的查询向量执行一次混合搜索（不经过缓存，失败时抛出异常）
+        
+        Args:
+            query (str): 搜索查询
+            knowledge_base (str): 知识库名称
+            embedding (list): 查询文本的向量嵌入，为None时只做关键词搜索
+            limit (int): 返回结果数量
+            semantic_ratio (float): 语义搜索权重
+            offset (int): 跳过的结果数量
+            **options: 其他 Meilisearch 搜索参数（如 showRankingScore）
+            
+        Returns:
+            dict: Meilisearch 原始返回结果
+        """
+        # 获取指定知识库的索引
+        index = self.meili_client.index(knowledge_base)
+        
+        params = {
+            "limit": limit,  # 返回结果数量限制
+            "offset": offset,  # 翻页偏移量
+            **options
+        }
+        if embedding is not None:
+            params["vector"] = embedding
+            params["hybrid"] = {
+                "semanticRatio": 1 - semantic_ratio,  # 语义搜索权重
+                "embedder": self.embedder_name  # 嵌入模型名称
+            }
+        
+        # 执行混合搜索（没有查询向量时只做关键词搜索）
+        with tracer.span("meilisearch.search", provider=knowledge_base, top_k=limit, offset=offset,
+                         mode="hybrid" if embedding is not None else "keyword") as span:
+            with self.meilisearch_breaker.protect(_is_meilisearch_failure):
+                results = index.search(query, params)
+            span.set(hits=len(results.get("hits", [])), engine_ms=results.get("processingTimeMs"))
+        return results
     
     def get_available_indexes(self):
         """
@@ -105,7 +431,8 @@ class SearchService:
             list: 索引名称列表
         """
         try:
-            indexes = self.meili_client.get_indexes()
+            with self.meilisearch_breaker.protect(_is_meilisearch_failure):
+                indexes = self.meili_client.get_indexes()
             return [index.uid for index in indexes['results']]
         except Exception as e:
             st.error(f"获取索引列表失败：{str(e)}")
@@ -0,0 +1,169 @@
+"""
+启动耗时报告模块
+在全新的子进程中使用 python -X importtime 统计各模块的导入耗时，
+并可选地使用 Streamlit 测试接口统计每个页面冷启动后首次渲染的耗时
+
+运行命令: python startup_report.py --pages
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 应用入口模块
+ENTRY_MODULE = "knowledge_search_app"
+
+# 页面按需加载的模块
+LAZY_MODULES = ["ai_service", "search_service", "web_search_service", "suggestion_service", "prefetch_service"]
+
+
+def measure_imports(statement):
+    """
+    在全新子进程中执行导入语句并解析 -X importtime 输出
+
+    Args:
+        statement (str): 要执行的导入语句
+
+    Returns:
+        dict: 模块名 -> 累计导入耗时（毫秒），只包含本次新导入的模块
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=APP_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"执行失败: {statement}\n{result.stderr[-2000:]}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        # 格式: import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        timings[parts[2].strip()] = int(parts[1].strip()) / 1000
+    return timings
+
+
+def import_report(top=15):
+    """
+    统计入口模块冷启动导入耗时，以及各按需模块在入口模块已加载后的增量导入耗时
+
+    Args:
+        top (int): 显示耗时最多的顶层包数量
+
+    Returns:
+        dict: 导入耗时报告
+    """
+    # 解释器启动时导入的模块（如 site）不计入
+    baseline = measure_imports("pass")
+    entry = measure_imports(f"import {ENTRY_MODULE}")
+    # 顶层包（不含子模块）的累计耗时
+    packages = sorted(
+        ((name, ms) for name, ms in entry.items()
+         if "." not in name and name != ENTRY_MODULE and name not in baseline),
+        key=lambda item: item[1], reverse=True
+    )
+    lazy = {}
+    for module in LAZY_MODULES:
+        timings = measure_imports(f"import {ENTRY_MODULE}; import {module}")
+        lazy[module] = round(timings.get(module, 0.0), 2)
+    return {
+        "entry_module": ENTRY_MODULE,
+        "entry_ms": round(entry.get(ENTRY_MODULE, 0.0), 2),
+        "top_packages": [{"module": name, "cumulative_ms": round(ms, 2)} for name, ms in packages[:top]],
+        "lazy_modules_ms": lazy,
+    }
+
+
+def _first_render(args):
+    """在当前（全新）进程中首次渲染指定页面并计时"""
+    page, work_dir = args
+    from streamlit.testing.v1 import AppTest
+
+    os.chdir(work_dir)
+    if APP_DIR not in sys.path:
+        sys.path.insert(0, APP_DIR)
+    start = time.perf_counter()
+    app = AppTest.from_file(os.path.join(APP_DIR, "ai.py"), default_timeout=120)
+    app.session_state["current_page"] = page
+    app.run()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    loaded = [module for module in LAZY_MODULES if module in sys.modules]
+    return {
+        "page": page,
+        "first_render_ms": round(elapsed_ms, 2),
+        "loaded_modules": loaded,
+        "error": str(app.exception[0].value) if app.exception else None,
+    }
+
+
+def page_report(pages):
+    """
+    统计每个页面冷启动后首次渲染的耗时（使用本地桩服务）
+
+    Args:
+        pages (list): 页面名称列表
+
+    Returns:
+        list: 每个页面的耗时和已加载的按需模块
+    """
+    from bench_stubs import StubServer
+
+    work_dir = tempfile.mkdtemp(prefix="startup_")
+    try:
+        with StubServer() as stub:
+            with open(os.path.join(work_dir, "config.json"), 'w', encoding='utf-8') as f:
+                json.dump(stub.build_config(), f, ensure_ascii=False)
+            # 每个页面在独立进程中渲染，保证模块均未导入
+            context = multiprocessing.get_context("spawn")
+            with context.Pool(processes=1, maxtasksperchild=1) as pool:
+                return pool.map(_first_render, [(page, work_dir) for page in pages])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="启动耗时报告")
+    parser.add_argument("--top", type=int, default=15, help="显示耗时最多的顶层包数量")
+    parser.add_argument("--pages", action="store_true", help="同时统计各页面冷启动首次渲染耗时")
+    parser.add_argument("--output", help="报告保存路径（JSON）")
+    args = parser.parse_args()
+
+    report = {"imports": import_report(args.top)}
+    imports = report["imports"]
+    print(f"导入 {imports['entry_module']}: {imports['entry_ms']:.1f} ms")
+    for row in imports["top_packages"]:
+        print(f"  {row['module']:<28} {row['cumulative_ms']:>9.1f} ms")
+    print("按需导入（入口模块已加载后的增量耗时）:")
+    for module, ms in imports["lazy_modules_ms"].items():
+        print(f"  {module:<28} {ms:>9.1f} ms")
+
+    if args.pages:
+        from knowledge_search_app import PAGE_OPTIONS
+        report["pages"] = page_report(PAGE_OPTIONS)
+        print("页面冷启动首次渲染:")
+        for row in report["pages"]:
+            flag = f"  错误: {row['error']}" if row["error"] else ""
+            print(f"  {row['page']:<10} {row['first_render_ms']:>9.1f} ms  已加载: {', '.join(row['loaded_modules']) or '无'}{flag}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+搜索建议模块
+基于历史查询和索引中的标题/行业构建前缀建议索引，为搜索框提供自动补全
+"""
+
+import atexit
+import bisect
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+
+
+# 进程级建议索引，按知识库名称共享，页面重跑时无需重建
+_suggestion_indexes = {}
+_suggestion_indexes_lock = threading.Lock()
+
+
+def normalize_term(text):
+    """
+    规范化建议词（去除首尾空白、统一小写）
+
+    Args:
+        text (str): 原始文本
+
+    Returns:
+        str: 规范化后的文本
+    """
+    return " ".join(str(text).split()).lower()
+
+
+class SuggestionIndex:
+    """前缀建议索引类（排序数组 + 二分查找）"""
+
+    def __init__(self, knowledge_base, suggestion_config=None):
+        """
+        初始化建议索引
+
+        Args:
+            knowledge_base (str): 知识库名称
+            suggestion_config (dict, optional): 建议配置
+        """
+        self.knowledge_base = knowledge_base
+        self.logger = logging.getLogger(__name__)
+        self.configure(suggestion_config)
+
+        self._query_counts = self._load_history()
+        self._index_terms = {}
+        self._keys = []
+        self._entries = []
+        self._last_refresh = 0
+        self._refreshing = False
+        self._flush_timer = None
+        # _lock 保护查询计数、索引词和排序数组；_rebuild_lock 保证重建按顺序完成，旧数据不会覆盖新数据
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._rebuild()
+        atexit.register(self.flush)
+
+    def configure(self, suggestion_config=None):
+        """
+        应用建议配置（可重复调用，配置文件变化后自动生效）
+
+        Args:
+            suggestion_config (dict, optional): 建议配置
+        """
+        suggestion_config = suggestion_config or {}
+        self.refresh_interval = suggestion_config.get("refresh_interval", 600)
+        self.max_index_terms = suggestion_config.get("max_index_terms", 20000)
+        self.max_scan = suggestion_config.get("max_scan", 200)
+        self.history_weight = suggestion_config.get("history_weight", 3.0)
+        self.index_fields = suggestion_config.get("index_fields", ["title", "industry", "organization"])
+        # 查询历史的写盘间隔（秒）和保留条数上限，超出时淘汰次数最少的查询
+        self.save_interval = suggestion_config.get("save_interval", 5)
+        self.max_history_terms = suggestion_config.get("max_history_terms", 5000)
+        history_dir = suggestion_config.get("history_dir", "")
+        self.history_path = (
+            os.path.join(history_dir, f"query_history_{self.knowledge_base}.json") if history_dir else ""
+        )
+
+    def _load_history(self):
+        """加载历史查询计数"""
+        if self.history_path and os.path.exists(self.history_path):
+            try:
+                with open(self.history_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                self.logger.warning(f"读取查询历史失败: {str(e)}")
+        return {}
+
+    def _save_history(self):
+        """保存历史查询计数（超出上限时先淘汰次数最少的查询）"""
+        with self._lock:
+            if len(self._query_counts) > self.max_history_terms:
+                self._query_counts = dict(heapq.nlargest(
+                    self.max_history_terms, self._query_counts.items(), key=lambda item: item[1]
+                ))
+            query_counts = dict(self._query_counts)
+        if not self.history_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.history_path) or ".", exist_ok=True)
+            tmp_path = f"{self.history_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(query_counts, f, ensure_ascii=False)
+            os.replace(tmp_path, self.history_path)
+        except Exception as e:
+            self.logger.warning(f"保存查询历史失败: {str(e)}")
+
+    def _load_index_terms(self, search_service):
+        """
+        从索引中读取标题、行业等字段作为建议词
+
+        Args:
+            search_service: 搜索服务实例
+
+        Returns:
+            dict: {建议词: 出现次数}
+        """
+        terms = {}
+        index = search_service.meili_client.index(self.knowledge_base)
+        offset = 0
+        while offset < self.max_index_terms:
+            page = index.get_documents({
+                "offset": offset,
+                "limit": min(1000, self.max_index_terms - offset),
+                "fields": self.index_fields,
+            })
+            for doc in page.results:
+                for field in self.index_fields:
+                    value = dict(doc).get(field)
+                    if isinstance(value, str) and value.strip():
+                        terms[value.strip()] = terms.get(value.strip(), 0) + 1
+            offset += len(page.results)
+            if not page.results or offset >= page.total:
+                break
+        return terms
+
+    def _rebuild(self):
+        """根据历史查询和索引词重建排序数组，构建完成后原子替换"""
+        with self._rebuild_lock:
+            with self._lock:
+                index_terms, query_counts = dict(self._index_terms), dict(self._query_counts)
+            weights = {}
+            for term, count in index_terms.items():
+                weights[term] = weights.get(term, 0) + count
+            for term, count in query_counts.items():
+                weights[term] = weights.get(term, 0) + count * self.history_weight
+
+            entries = sorted((normalize_term(term), term, weight) for term, weight in weights.items())
+            keys = [entry[0] for entry in entries]
+            with self._lock:
+                self._keys, self._entries = keys, entries
+
+    def _refresh(self, search_service):
+        """后台刷新索引词"""
+        try:
+            index_terms = self._load_index_terms(search_service)
+            with self._lock:
+                self._index_terms = index_terms
+            self._rebuild()
+        except Exception as e:
+            self.logger.warning(f"刷新搜索建议失败: {str(e)}")
+        finally:
+            self._last_refresh = time.monotonic()
+            self._refreshing = False
+
+    def refresh_if_stale(self, search_service):
+        """
+        建议数据过期时在后台线程刷新，不阻塞当前请求
+
+        Args:
+            search_service: 搜索服务实例（由调用方传入，使用当前会话的服务和配置读取索引）
+        """
+        if search_service is None or self._refreshing:
+            return
+        if self._last_refresh and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        self._refreshing = True
+        threading.Thread(target=self._refresh, args=(search_service,), daemon=True).start()
+
+    def suggest(self, prefix, limit=5, search_service=None):
+        """
+        获取前缀匹配的建议词
+
+        Args:
+            prefix (str): 用户已输入的前缀
+            limit (int): 返回数量
+            search_service: 搜索服务实例，传入时在建议数据过期后读取索引中的标题和行业
+
+        Returns:
+            list: 按权重排序的建议词列表
+        """
+        self.refresh_if_stale(search_service)
+        key = normalize_term(prefix)
+        if not key:
+            return []
+        with self._lock:
+            keys, entries = self._keys, self._entries
+        start = bisect.bisect_left(keys, key)
+        candidates = []
+        for position in range(start, min(start + self.max_scan, len(keys))):
+            if not keys[position].startswith(key):
+                break
+            if keys[position] != key:
+                candidates.append(entries[position])
+        return [entry[1] for entry in heapq.nlargest(limit, candidates, key=lambda entry: entry[2])]
+
+    def record_query(self, query):
+        """
+        记录一次实际提交的查询
+
+        Args:
+            query (str): 查询文本
+        """
+        query = " ".join(str(query).split())
+        if not query:
+            return
+        with self._lock:
+            self._query_counts[query] = self._query_counts.get(query, 0) + 1
+            # 合并一段时间内的查询后统一重建和写盘，避免每次搜索都在页面线程上排序和写文件
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(self.save_interval, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """立即重建建议数组并保存查询历史（定时触发，进程退出时也会调用）"""
+        with self._lock:
+            if self._flush_timer is None:
+                return
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        self._rebuild()
+        self._save_history()
+
+
+def get_suggestion_index(knowledge_base, suggestion_config=None):
+    """
+    获取进程级共享的建议索引，传入配置时同时更新其配置
+
+    Args:
+        knowledge_base (str): 知识库名称
+        suggestion_config (dict, optional): 建议配置
+
+    Returns:
+        SuggestionIndex: 建议索引实例
+    """
+    with _suggestion_indexes_lock:
+        index = _suggestion_indexes.get(knowledge_base)
+        if index is None:
+            index = _suggestion_indexes[knowledge_base] = SuggestionIndex(knowledge_base, suggestion_config)
+        elif suggestion_config is not None:
+            index.configure(suggestion_config)
+        return index
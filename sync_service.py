@@ -0,0 +1,286 @@
+"""
+索引增量同步模块
+对比本地文档目录（或清单文件）与索引中记录的 SHA256/修改时间，只同步新增、变更和删除的文档
+
+运行命令: python sync_service.py <文档目录> --index broker_reports
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+
+from config_manager import ConfigManager
+from ingest_service import DocumentIngestor, compute_file_sha256, iter_source_files
+
+
+def normalize_path(path):
+    """
+    统一路径写法（绝对路径、规范分隔符和大小写），目录模式与清单模式得到相同的键
+
+    Args:
+        path (str): 文件路径
+
+    Returns:
+        str: 规范化后的路径
+    """
+    return os.path.normcase(os.path.abspath(path))
+
+
+def is_under(path, root):
+    """
+    判断规范化路径是否位于目录之下
+
+    Args:
+        path (str): 规范化后的文件路径
+        root (str): 规范化后的目录
+
+    Returns:
+        bool: 是否位于目录之下
+    """
+    try:
+        return os.path.commonpath([path, root]) == root
+    except ValueError:
+        # 不同盘符等无法比较的路径
+        return False
+
+
+class IndexSynchronizer:
+    """索引增量同步器类"""
+
+    def __init__(self, config_manager, index_name=None, state_path=None):
+        """
+        初始化同步器
+
+        Args:
+            config_manager: 配置管理器实例
+            index_name (str, optional): 目标索引名称，默认使用默认知识库
+            state_path (str, optional): 同步状态文件路径（记录水位线和文件指纹）
+        """
+        self.logger = logging.getLogger(__name__)
+        self.ingestor = DocumentIngestor(config_manager, index_name)
+        self.index = self.ingestor.index
+        self.primary_key = self.ingestor.primary_key
+        self.state_path = state_path or f".sync_state_{self.ingestor.index_name}.json"
+        self.state = self._load_state()
+
+    def _load_state(self):
+        """加载同步状态"""
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except Exception as e:
+                self.logger.warning(f"同步状态文件损坏，将全量比对: {str(e)}")
+        return {"watermark": 0, "files": {}}
+
+    def _save_state(self):
+        """原子写入同步状态"""
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def scan_index(self, page_size=1000):
+        """
+        读取索引中每个来源文件对应的文档ID和SHA256（只取轻量字段）
+
+        Args:
+            page_size (int): 每页文档数量
+
+        Returns:
+            dict: {规范化来源路径: {"sha256": 来源文件SHA256, "ids": 文档ID集合}}
+        """
+        remote = {}
+        offset = 0
+        fields = [self.primary_key, "source_path", "source_sha256", "file_sha256"]
+        while True:
+            page = self.index.get_documents({"offset": offset, "limit": page_size, "fields": fields})
+            for doc in page.results:
+                doc = dict(doc)
+                path = doc.get("source_path")
+                if not path:
+                    continue
+                entry = remote.setdefault(normalize_path(path), {"sha256": None, "ids": set()})
+                entry["sha256"] = doc.get("source_sha256") or doc.get("file_sha256")
+                entry["ids"].add(doc[self.primary_key])
+            offset += len(page.results)
+            if not page.results or offset >= page.total:
+                return remote
+
+    def scan_local(self, source_dir=None, manifest_path=None):
+        """
+        计算本地文件指纹；修改时间和大小未变且早于水位线的文件直接复用上次的SHA256
+
+        Args:
+            source_dir (str, optional): 文档目录
+            manifest_path (str, optional): 清单文件路径，格式为 [{"path", "sha256", "mtime"}]
+
+        Returns:
+            dict: {规范化路径: {"mtime_ns", "size", "sha256"}}
+        """
+        manifest = {}
+        if manifest_path:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                base_dir = os.path.dirname(os.path.abspath(manifest_path))
+                for entry in json.load(f):
+                    path = entry["path"]
+                    if not os.path.isabs(path):
+                        path = os.path.join(base_dir, path)
+                    manifest[normalize_path(path)] = entry
+            paths = list(manifest)
+        else:
+            paths = [normalize_path(path) for path in iter_source_files(source_dir)]
+
+        watermark_ns = int(self.state.get("watermark", 0) * 1e9)
+        local = {}
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            stat = os.stat(path)
+            previous = self.state["files"].get(path)
+            if manifest.get(path, {}).get("sha256"):
+                sha256 = manifest[path]["sha256"]
+            elif (previous and previous["mtime_ns"] == stat.st_mtime_ns
+                  and previous["size"] == stat.st_size and stat.st_mtime_ns <= watermark_ns):
+                sha256 = previous["sha256"]
+            else:
+                sha256 = compute_file_sha256(path)
+            local[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": sha256}
+        return local
+
+    def plan(self, local, remote, root=None):
+        """
+        生成同步计划
+
+        Args:
+            local (dict): 本地文件指纹
+            remote (dict): 索引中的来源文件记录
+            root (str, optional): 本次扫描的根目录，只删除该目录下已不存在的文件；为空时不删除任何文件
+
+        Returns:
+            dict: {"added": [...], "changed": [...], "deleted": [...], "unchanged": 数量}
+        """
+        added, changed, unchanged = [], [], 0
+        for path, info in local.items():
+            if path not in remote:
+                added.append(path)
+            elif remote[path]["sha256"] != info["sha256"]:
+                changed.append(path)
+            else:
+                unchanged += 1
+        # 只有位于本次扫描范围内、但本地已不存在的文件才视为删除，避免同步子目录时删掉其余文档
+        root = normalize_path(root) if root else None
+        deleted = [path for path in remote if path not in local and root and is_under(path, root)]
+        return {"added": added, "changed": changed, "deleted": deleted, "unchanged": unchanged}
+
+    def run(self, source_dir=None, manifest_path=None, dry_run=False, root=None):
+        """
+        执行增量同步
+
+        Args:
+            source_dir (str, optional): 文档目录
+            manifest_path (str, optional): 清单文件路径
+            dry_run (bool): 只输出同步计划，不修改索引
+            root (str, optional): 删除范围的根目录，默认为文档目录（清单模式下为清单文件所在目录）
+
+        Returns:
+            dict: 同步统计
+        """
+        started_at = time.time()
+        self.ingestor.ensure_index_settings()
+        remote = self.scan_index()
+        local = self.scan_local(source_dir, manifest_path)
+        if root is None:
+            root = source_dir if source_dir else os.path.dirname(os.path.abspath(manifest_path))
+        plan = self.plan(local, remote, root)
+        stats = {
+            "added_files": len(plan["added"]),
+            "changed_files": len(plan["changed"]),
+            "deleted_files": len(plan["deleted"]),
+            "unchanged_files": plan["unchanged"],
+            "embedded_chunks": 0,
+            "reused_chunks": 0,
+            "deleted_chunks": 0,
+            "failed_tasks": 0,
+        }
+        if dry_run:
+            return {**stats, **{key: plan[key] for key in ("added", "changed", "deleted")}}
+
+        to_embed, to_touch, to_delete = [], [], []
+        for path in plan["added"] + plan["changed"]:
+            existing_ids = remote.get(path, {}).get("ids", set())
+            new_ids = set()
+            for doc in self.ingestor.build_documents(path):
+                doc_id = doc[self.primary_key]
+                new_ids.add(doc_id)
+                if doc_id in existing_ids:
+                    # 块内容未变，只更新来源指纹字段，不重新向量化
+                    to_touch.append({
+                        self.primary_key: doc_id,
+                        "source_sha256": doc.get("source_sha256"),
+                        "source_mtime": doc.get("source_mtime"),
+                    })
+                else:
+                    to_embed.append(doc)
+            to_delete.extend(existing_ids - new_ids)
+        for path in plan["deleted"]:
+            to_delete.extend(remote[path]["ids"])
+        # 移动或改名的文件沿用原ID（单块文档的ID即文件SHA256），本次写入的ID不能再被删除
+        written_ids = {doc[self.primary_key] for doc in to_embed} | {doc[self.primary_key] for doc in to_touch}
+        to_delete = sorted(set(to_delete) - written_ids)
+
+        task_uids = []
+        batch_size = self.ingestor.embedding_batch_size
+        upload_buffer = []
+        for start in range(0, len(to_embed), batch_size):
+            upload_buffer.extend(self.ingestor.embed_documents(to_embed[start:start + batch_size]))
+            if len(upload_buffer) >= self.ingestor.upload_batch_size:
+                task_uids.append(self.index.add_documents(upload_buffer, primary_key=self.primary_key).task_uid)
+                upload_buffer = []
+        if upload_buffer:
+            task_uids.append(self.index.add_documents(upload_buffer, primary_key=self.primary_key).task_uid)
+        if to_touch:
+            task_uids.append(self.index.update_documents(to_touch, primary_key=self.primary_key).task_uid)
+        if to_delete:
+            task_uids.append(self.index.delete_documents(list(to_delete)).task_uid)
+
+        for task_uid in task_uids:
+            if not self.ingestor.wait_task(task_uid):
+                stats["failed_tasks"] += 1
+
+        stats["embedded_chunks"] = len(to_embed)
+        stats["reused_chunks"] = len(to_touch)
+        stats["deleted_chunks"] = len(to_delete)
+
+        # 全部任务成功后才推进水位线，失败时下次同步会重新比对
+        if not stats["failed_tasks"]:
+            self.state = {"watermark": started_at, "files": local}
+            self._save_state()
+        stats["elapsed_seconds"] = round(time.time() - started_at, 2)
+        return stats
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="增量同步本地文档到 Meilisearch")
+    parser.add_argument("source_dir", nargs="?", help="文档目录（与 --manifest 二选一）")
+    parser.add_argument("--manifest", help="清单文件路径，JSON数组，元素为 {path, sha256, mtime}")
+    parser.add_argument("--index", help="目标索引名称，默认使用配置中的默认知识库")
+    parser.add_argument("--config", default="config.json", help="配置文件路径")
+    parser.add_argument("--state", help="同步状态文件路径")
+    parser.add_argument("--root", help="删除范围的根目录，默认为文档目录或清单文件所在目录")
+    parser.add_argument("--dry-run", action="store_true", help="只输出同步计划")
+    args = parser.parse_args()
+    if not args.source_dir and not args.manifest:
+        parser.error("需要指定文档目录或 --manifest")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    synchronizer = IndexSynchronizer(ConfigManager(args.config), args.index, args.state)
+    stats = synchronizer.run(args.source_dir, args.manifest, args.dry_run, args.root)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""MinHash 签名的向量化实现与逐个计算结果一致"""
+
+import random
+
+from dedup_service import _MAX_HASH, _MERSENNE_PRIME, ResultDeduplicator
+
+
+def reference_signature(deduplicator, text):
+    shingles = deduplicator._shingles(text)
+    permutations = zip(deduplicator._perm_a[:, 0].tolist(), deduplicator._perm_b[:, 0].tolist())
+    return tuple(min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in shingles) for a, b in permutations)
+
+
+def test_vectorized_signature_matches_reference():
+    deduplicator = ResultDeduplicator({}, signature_cache={})
+    rng = random.Random(0)
+    for length in (3, 10, 500, 3000):
+        text = "".join(chr(0x4e00 + rng.randrange(3000)) for _ in range(length))
+        assert deduplicator.compute_signature(text) == reference_signature(deduplicator, text)
+
+
+def test_near_duplicates_are_clustered():
+    deduplicator = ResultDeduplicator({}, signature_cache={})
+    text = "新能源汽车产业链深度研究报告，电池材料与整车制造的景气度持续提升。" * 20
+    hits = [
+        {"_sha256": "a", "content": text},
+        {"_sha256": "b", "content": text + "附录"},
+        {"_sha256": "c", "content": "半导体设备国产化进展跟踪。" * 20},
+    ]
+
+    clusters = deduplicator.deduplicate(hits)
+
+    assert [cluster["primary"]["_sha256"] for cluster in clusters] == ["a", "c"]
+    assert [hit["_sha256"] for hit in clusters[0]["duplicates"]] == ["b"]
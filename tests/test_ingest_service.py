@@ -0,0 +1,93 @@
+"""导入断点：文件的任一批次失败时不标记完成"""
+
+from types import SimpleNamespace
+
+import ingest_service
+from ingest_service import DocumentIngestor
+
+
+class FakeConfigManager:
+    """只提供导入所需配置的配置管理器"""
+
+    def __init__(self, ingest_config):
+        self.ingest_config = ingest_config
+
+    def get_ingest_config(self):
+        return self.ingest_config
+
+    def get_search_config(self):
+        return {"default_knowledge_base": "reports"}
+
+
+class FakeIndex:
+    """按顺序分配任务ID的内存索引"""
+
+    def __init__(self):
+        self.batches = []
+
+    def get_filterable_attributes(self):
+        return ["_sha256", "file_sha256", "source_path"]
+
+    def get_documents(self, params):
+        return SimpleNamespace(results=[], total=0)
+
+    def add_documents(self, docs, primary_key=None):
+        self.batches.append([doc[primary_key] for doc in docs])
+        return SimpleNamespace(task_uid=len(self.batches))
+
+
+class FakeMeiliClient:
+    """指定任务ID执行失败的 Meilisearch 客户端"""
+
+    def __init__(self, failed_task_uids):
+        self.failed_task_uids = failed_task_uids
+        self.indexes = {}
+
+    def index(self, name):
+        return self.indexes.setdefault(name, FakeIndex())
+
+    def wait_for_task(self, task_uid, timeout_in_ms=None, interval_in_ms=None):
+        if task_uid in self.failed_task_uids:
+            return SimpleNamespace(status="failed", error="fake failure")
+        return SimpleNamespace(status="succeeded", error=None)
+
+
+def make_ingestor(monkeypatch, tmp_path, failed_task_uids):
+    meili_client = FakeMeiliClient(failed_task_uids)
+
+    class FakeSearchService:
+        facet_fields = []
+        embedder_name = "default"
+
+        def __init__(self, config_manager):
+            self.meili_client = meili_client
+
+        def get_embeddings(self, texts):
+            return [[0.0] for _ in texts]
+
+    monkeypatch.setattr(ingest_service, "SearchService", FakeSearchService)
+    config_manager = FakeConfigManager({
+        "embedding_batch_size": 1,
+        "upload_batch_size": 2,
+        "queue_size": 4,
+        "checkpoint_path": str(tmp_path / "checkpoint.json"),
+    })
+    return DocumentIngestor(config_manager)
+
+
+def test_file_with_failed_earlier_batch_is_not_marked_done(monkeypatch, tmp_path):
+    source_dir = tmp_path / "docs"
+    source_dir.mkdir()
+    # a.jsonl 的3个文档分布在两个上传批次中，第一个批次失败
+    (source_dir / "a.jsonl").write_text('{"content": "a1"}\n{"content": "a2"}\n{"content": "a3"}\n',
+                                        encoding="utf-8")
+    (source_dir / "b.jsonl").write_text('{"content": "b1"}\n', encoding="utf-8")
+    ingestor = make_ingestor(monkeypatch, tmp_path, failed_task_uids={1})
+
+    stats = ingestor.run(str(source_dir))
+
+    assert len(ingestor.index.batches) == 2
+    assert stats["failed_tasks"] == 1
+    assert stats["failed_files"] == 1
+    assert list(ingestor.checkpoint["done_files"]) == [str(source_dir / "b.jsonl")]
+    assert ingestor.checkpoint["failed_files"] == [str(source_dir / "a.jsonl")]
@@ -0,0 +1,153 @@
+"""增量同步的删除范围与改名处理"""
+
+import os
+from types import SimpleNamespace
+
+import ingest_service
+from ingest_service import compute_file_sha256
+from sync_service import IndexSynchronizer, normalize_path
+
+
+class FakeConfigManager:
+    """只提供导入所需配置的配置管理器"""
+
+    def __init__(self, ingest_config):
+        self.ingest_config = ingest_config
+
+    def get_ingest_config(self):
+        return self.ingest_config
+
+    def get_search_config(self):
+        return {"default_knowledge_base": "reports"}
+
+
+class FakeIndex:
+    """记录写入和删除任务并立即生效的内存索引"""
+
+    def __init__(self):
+        self.docs = {}
+        self.tasks = []
+
+    def get_filterable_attributes(self):
+        return ["_sha256", "file_sha256", "source_path"]
+
+    def get_documents(self, params):
+        docs = list(self.docs.values())[params["offset"]:params["offset"] + params["limit"]]
+        return SimpleNamespace(results=docs, total=len(self.docs))
+
+    def _task(self, action, payload):
+        self.tasks.append((action, payload))
+        return SimpleNamespace(task_uid=len(self.tasks))
+
+    def add_documents(self, docs, primary_key=None):
+        for doc in docs:
+            self.docs[doc[primary_key]] = dict(doc)
+        return self._task("add", [doc[primary_key] for doc in docs])
+
+    def update_documents(self, docs, primary_key=None):
+        for doc in docs:
+            self.docs.setdefault(doc[primary_key], {}).update(doc)
+        return self._task("update", [doc[primary_key] for doc in docs])
+
+    def delete_documents(self, ids):
+        for doc_id in ids:
+            self.docs.pop(doc_id, None)
+        return self._task("delete", list(ids))
+
+
+class FakeMeiliClient:
+    """所有任务都成功的 Meilisearch 客户端"""
+
+    def __init__(self):
+        self.indexes = {}
+
+    def index(self, name):
+        return self.indexes.setdefault(name, FakeIndex())
+
+    def wait_for_task(self, task_uid, timeout_in_ms=None, interval_in_ms=None):
+        return SimpleNamespace(status="succeeded", error=None)
+
+
+def make_synchronizer(monkeypatch, tmp_path, docs):
+    meili_client = FakeMeiliClient()
+
+    class FakeSearchService:
+        facet_fields = []
+        embedder_name = "default"
+
+        def __init__(self, config_manager):
+            self.meili_client = meili_client
+
+        def get_embeddings(self, texts):
+            return [[0.0] for _ in texts]
+
+    monkeypatch.setattr(ingest_service, "SearchService", FakeSearchService)
+    config_manager = FakeConfigManager({"checkpoint_path": str(tmp_path / "checkpoint.json")})
+    synchronizer = IndexSynchronizer(config_manager, state_path=str(tmp_path / "state.json"))
+    for doc in docs:
+        synchronizer.index.docs[doc["_sha256"]] = dict(doc)
+    return synchronizer
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return path
+
+
+def indexed_doc(path):
+    sha256 = compute_file_sha256(path)
+    return {"_sha256": sha256, "source_path": str(path), "source_sha256": sha256}
+
+
+def test_sync_subdirectory_keeps_other_documents(monkeypatch, tmp_path):
+    docs_dir = tmp_path / "docs"
+    a = write(docs_dir / "a" / "one.txt", "一号文档")
+    b = write(docs_dir / "b" / "two.txt", "二号文档")
+    synchronizer = make_synchronizer(monkeypatch, tmp_path, [indexed_doc(a), indexed_doc(b)])
+
+    stats = synchronizer.run(str(docs_dir / "a"))
+
+    assert stats["deleted_files"] == 0
+    assert not [task for task in synchronizer.index.tasks if task[0] == "delete"]
+
+
+def test_sync_deletes_removed_file_under_root(monkeypatch, tmp_path):
+    docs_dir = tmp_path / "docs"
+    a = write(docs_dir / "a" / "one.txt", "一号文档")
+    removed = {"_sha256": "gone", "source_path": str(docs_dir / "a" / "gone.txt"), "source_sha256": "gone"}
+    outside = {"_sha256": "other", "source_path": str(tmp_path / "elsewhere.txt"), "source_sha256": "other"}
+    synchronizer = make_synchronizer(monkeypatch, tmp_path, [indexed_doc(a), removed, outside])
+
+    synchronizer.run(str(docs_dir))
+
+    deletes = [ids for action, ids in synchronizer.index.tasks if action == "delete"]
+    assert deletes == [["gone"]]
+
+
+def test_sync_renamed_file_is_not_deleted(monkeypatch, tmp_path):
+    docs_dir = tmp_path / "docs"
+    old = write(docs_dir / "old.txt", "同一篇文档")
+    synchronizer = make_synchronizer(monkeypatch, tmp_path, [indexed_doc(old)])
+    new = docs_dir / "new.txt"
+    os.rename(old, new)
+
+    stats = synchronizer.run(str(docs_dir))
+
+    sha256 = compute_file_sha256(new)
+    assert stats["deleted_chunks"] == 0
+    assert sha256 in synchronizer.index.docs
+    assert synchronizer.index.docs[sha256]["source_path"] == normalize_path(str(new))
+
+
+def test_directory_and_manifest_paths_match(monkeypatch, tmp_path):
+    docs_dir = tmp_path / "docs"
+    a = write(docs_dir / "one.txt", "一号文档")
+    synchronizer = make_synchronizer(monkeypatch, tmp_path, [indexed_doc(a)])
+    manifest = write(docs_dir / "manifest.json", '[{"path": "one.txt"}]')
+
+    stats = synchronizer.run(manifest_path=str(manifest))
+
+    assert stats["unchanged_files"] == 1
+    assert stats["deleted_files"] == 0
+    assert not synchronizer.index.tasks
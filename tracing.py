@@ -0,0 +1,431 @@
+"""
+链路追踪模块
+记录搜索和问答流程中各阶段的耗时与token消耗，汇总为滚动直方图，并支持导出 JSON Lines 和 Prometheus 指标
+"""
+
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Prometheus 直方图的桶边界（毫秒）
+DEFAULT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# 当前线程/协程中正在执行的span，用于建立父子关系
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """单个追踪片段类"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "attributes",
+                 "start_ns", "end_ns", "error", "_token")
+
+    def __init__(self, tracer, name, attributes):
+        """
+        初始化追踪片段
+
+        Args:
+            tracer: 所属追踪器
+            name (str): 阶段名称，如 embedding、meilisearch.search、llm.chat
+            attributes (dict): 附加属性（provider、model、token数等）
+        """
+        parent = _current_span.get()
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_ns = 0
+        self.end_ns = 0
+        self.error = None
+        self._token = None
+
+    def set(self, **attributes):
+        """设置附加属性"""
+        self.attributes.update(attributes)
+
+    def record_usage(self, response):
+        """
+        从 OpenAI 兼容接口的响应中记录token消耗
+
+        Args:
+            response: chat.completions 响应对象
+        """
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        self.attributes["prompt_tokens"] = getattr(usage, "prompt_tokens", 0) or 0
+        self.attributes["completion_tokens"] = getattr(usage, "completion_tokens", 0) or 0
+
+    @property
+    def duration_ms(self):
+        """耗时（毫秒）"""
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.perf_counter_ns()
+        _current_span.reset(self._token)
+        # 流式生成器被提前关闭不视为错误
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.tracer._finish(self)
+        return False
+
+    def to_dict(self):
+        """转换为可序列化字典"""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "timestamp": time.time(),
+            "error": self.error,
+            **self.attributes,
+        }
+
+
+class RollingHistogram:
+    """滚动直方图类：保留时间窗口内的样本用于计算分位数，同时维护累计桶计数（非线程安全，由 Tracer 的锁保护）"""
+
+    def __init__(self, window_seconds=600, max_samples=5000, buckets=DEFAULT_BUCKETS_MS):
+        """
+        初始化滚动直方图
+
+        Args:
+            window_seconds (int): 分位数统计的时间窗口（秒）
+            max_samples (int): 窗口内保留的最大样本数
+            buckets (tuple): 累计桶边界（毫秒）
+        """
+        self.window_seconds = window_seconds
+        self.samples = deque(maxlen=max_samples)
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value_ms, now=None):
+        """记录一个样本"""
+        self.samples.append((now or time.monotonic(), value_ms))
+        self.bucket_counts[bisect.bisect_left(self.buckets, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+
+    def _window_values(self, now=None):
+        """获取窗口内的样本值"""
+        cutoff = (now or time.monotonic()) - self.window_seconds
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return sorted(value for _, value in self.samples)
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99)):
+        """
+        计算窗口内的分位数
+
+        Args:
+            quantiles (tuple): 分位点
+
+        Returns:
+            dict: {"p50": ..., "p95": ..., "p99": ..., "count": 窗口样本数}
+        """
+        values = self._window_values()
+        result = {"count": len(values)}
+        for quantile in quantiles:
+            key = f"p{int(quantile * 100)}"
+            if not values:
+                result[key] = None
+            else:
+                result[key] = values[min(len(values) - 1, int(quantile * len(values)))]
+        return result
+
+
+class Tracer:
+    """追踪器类"""
+
+    def __init__(self, tracing_config=None):
+        """
+        初始化追踪器
+
+        Args:
+            tracing_config (dict, optional): 追踪配置
+        """
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.metrics_server = None
+        self.recent_spans = deque()
+        self.configure(tracing_config or {})
+
+    def configure(self, tracing_config):
+        """
+        应用追踪配置
+
+        Args:
+            tracing_config (dict): 追踪配置
+        """
+        self.enabled = tracing_config.get("enabled", True)
+        self.window_seconds = tracing_config.get("window_seconds", 600)
+        self.jsonl_path = tracing_config.get("jsonl_path", "")
+        max_spans = tracing_config.get("max_spans", 2000)
+        if self.recent_spans.maxlen != max_spans:
+            # 页面重跑时重复配置不会清空已有记录
+            self.recent_spans = deque(self.recent_spans, maxlen=max_spans)
+        metrics_port = tracing_config.get("metrics_port")
+        if metrics_port and self.metrics_server is None:
+            self.start_metrics_server(metrics_port, tracing_config.get("metrics_host", "127.0.0.1"))
+
+    def span(self, name, **attributes):
+        """
+        创建追踪片段（作为上下文管理器使用）
+
+        Args:
+            name (str): 阶段名称
+            **attributes: 附加属性
+
+        Returns:
+            Span: 追踪片段
+        """
+        return Span(self, name, attributes)
+
+    def _finish(self, span):
+        """记录完成的追踪片段"""
+        if not self.enabled:
+            return
+        record = span.to_dict()
+        provider = span.attributes.get("provider", "")
+        with self.lock:
+            self.recent_spans.append(record)
+            self._observe((span.name, provider), span.duration_ms)
+            self._increment(f"span_errors_total|{span.name}", 1 if span.error else 0)
+            for token_field in ("prompt_tokens", "completion_tokens"):
+                if span.attributes.get(token_field):
+                    self._increment(f"llm_{token_field}_total|{provider}", span.attributes[token_field])
+
+        if self.jsonl_path:
+            try:
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            except Exception as e:
+                self.logger.warning(f"写入追踪日志失败: {str(e)}")
+
+    def observe(self, name, value_ms, provider=""):
+        """
+        记录不对应单个追踪片段的耗时指标（如首字延迟），与各阶段延迟一起统计分位数
+
+        Args:
+            name (str): 指标名称
+            value_ms (float): 耗时（毫秒）
+            provider (str): 服务商
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self._observe((name, provider), value_ms)
+
+    def _observe(self, key, value_ms):
+        """写入直方图（调用方需持有锁）"""
+        if key not in self.histograms:
+            self.histograms[key] = RollingHistogram(self.window_seconds)
+        self.histograms[key].observe(value_ms)
+
+    def _increment(self, key, value):
+        """累加计数器（调用方需持有锁）"""
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def increment(self, name, value=1, label=""):
+        """
+        累加自定义计数器（如缓存命中/未命中）
+
+        Args:
+            name (str): 计数器名称
+            value (int): 增量
+            label (str): 标签值
+        """
+        with self.lock:
+            self._increment(f"{name}|{label}", value)
+
+    def stage_percentiles(self):
+        """
+        获取各阶段（按服务商区分）的延迟分位数
+
+        Returns:
+            list: [{"stage", "provider", "p50", "p95", "p99", "count"}]
+        """
+        # 计算分位数会裁剪样本队列，需与 observe 互斥
+        with self.lock:
+            return [
+                {"stage": stage, "provider": provider, **histogram.percentiles()}
+                for (stage, provider), histogram in sorted(self.histograms.items())
+            ]
+
+    def export_jsonl(self, path):
+        """
+        将最近的追踪片段导出为 JSON Lines 文件
+
+        Args:
+            path (str): 导出文件路径
+
+        Returns:
+            int: 导出的片段数量
+        """
+        with self.lock:
+            spans = list(self.recent_spans)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for record in spans:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        return len(spans)
+
+    def prometheus_text(self):
+        """
+        生成 Prometheus 文本格式的指标
+
+        Returns:
+            str: 指标文本
+        """
+        lines = [
+            "# HELP app_stage_duration_ms Stage latency in milliseconds",
+            "# TYPE app_stage_duration_ms histogram",
+        ]
+        # 在锁内复制桶计数，避免与 observe 并发时读到不一致的快照
+        with self.lock:
+            histograms = [
+                (key, histogram.buckets, list(histogram.bucket_counts), histogram.count, histogram.total)
+                for key, histogram in self.histograms.items()
+            ]
+            counters = dict(self.counters)
+        for (stage, provider), buckets, bucket_counts, count, total in sorted(histograms, key=lambda item: item[0]):
+            labels = f'stage="{stage}",provider="{provider}"'
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'app_stage_duration_ms_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'app_stage_duration_ms_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"app_stage_duration_ms_sum{{{labels}}} {total:.3f}")
+            lines.append(f"app_stage_duration_ms_count{{{labels}}} {count}")
+        for key, value in sorted(counters.items()):
+            name, label = key.split("|", 1)
+            lines.append(f'app_{name}{{label="{label}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def record_cache(self, cache_name, hit):
+        """
+        记录一次缓存访问
+
+        Args:
+            cache_name (str): 缓存名称
+            hit (bool): 是否命中
+        """
+        self.increment("cache_hits" if hit else "cache_misses", 1, cache_name)
+
+    def cache_hit_ratios(self):
+        """
+        获取各缓存的命中率
+
+        Returns:
+            list: [{"cache", "hits", "misses", "hit_ratio"}]
+        """
+        with self.lock:
+            counters = dict(self.counters)
+        caches = {}
+        for key, value in counters.items():
+            name, label = key.split("|", 1)
+            if name in ("cache_hits", "cache_misses"):
+                caches.setdefault(label, {"hits": 0, "misses": 0})[name[6:]] = value
+        return [
+            {"cache": label, **counts,
+             "hit_ratio": counts["hits"] / (counts["hits"] + counts["misses"]) if counts["hits"] + counts["misses"] else None}
+            for label, counts in sorted(caches.items())
+        ]
+
+    def token_usage_per_minute(self, minutes=30):
+        """
+        按分钟汇总最近的LLM token消耗
+
+        Args:
+            minutes (int): 统计最近多少分钟
+
+        Returns:
+            dict: {分钟时间戳: {服务商: token数}}
+        """
+        cutoff = time.time() - minutes * 60
+        with self.lock:
+            spans = list(self.recent_spans)
+        usage = {}
+        for record in spans:
+            tokens = record.get("prompt_tokens", 0) + record.get("completion_tokens", 0)
+            if not tokens or record["timestamp"] < cutoff:
+                continue
+            minute = int(record["timestamp"] // 60 * 60)
+            provider = record.get("provider", "")
+            usage.setdefault(minute, {})
+            usage[minute][provider] = usage[minute].get(provider, 0) + tokens
+        return dict(sorted(usage.items()))
+
+    def slowest_spans(self, names=("search.request", "chat.turn"), limit=10):
+        """
+        获取最近最慢的请求
+
+        Args:
+            names (tuple): 需要统计的根片段名称
+            limit (int): 返回数量
+
+        Returns:
+            list: 按耗时降序的追踪记录
+        """
+        with self.lock:
+            spans = [record for record in self.recent_spans if record["name"] in names]
+        return sorted(spans, key=lambda record: record["duration_ms"], reverse=True)[:limit]
+
+    def start_metrics_server(self, port, host="127.0.0.1"):
+        """
+        在后台线程启动本地 Prometheus 指标端点（/metrics）
+
+        Args:
+            port (int): 监听端口
+            host (str): 监听地址
+        """
+        tracer = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = tracer.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self.metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            # 多个进程共用端口时只有第一个能监听成功
+            self.logger.warning(f"指标端点启动失败: {str(e)}")
+            return
+        threading.Thread(target=self.metrics_server.serve_forever, daemon=True).start()
+
+
+# 进程级追踪器
+tracer = Tracer()
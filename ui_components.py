@@ -5,7 +5,32 @@ UI组件模块
 
 import streamlit as st
 import time
-from openai import OpenAI
+from datetime import date, datetime, timedelta
+from dedup_service import ResultDeduplicator
+from tracing import tracer
+
+
+# 分面字段在侧边栏中的显示名称
+FACET_LABELS = {
+    "industry": "📊 行业",
+    "organization": "🏢 机构",
+    "author": "👤 作者",
+    "source": "🔗 来源",
+}
+
+# 分面筛选控件的会话状态键前缀
+FACET_KEY_PREFIX = "facet_"
+
+# 外部依赖的显示名称和熔断期间的降级方式（键为熔断器名称中":"之前的部分）
+DEPENDENCY_STATUS = {
+    "embedding": ("向量嵌入服务", "已改用关键词搜索"),
+    "meilisearch": ("Meilisearch", "知识库搜索暂不可用"),
+    "web_search": ("网络搜索", "问答不使用网络搜索结果"),
+    "llm": ("AI服务", "暂停生成摘要和关键词，问答暂不可用"),
+}
+
+# 熔断器状态的显示名称
+BREAKER_STATE_LABELS = {"closed": "正常", "open": "已熔断", "half_open": "探测恢复中"}
 
 
 class UIComponents:
@@ -22,11 +47,15 @@ class UIComponents:
         self.config_manager = config_manager
         self.search_config = config_manager.get_search_config()
         self.ai_service = ai_service
+        self.deduplicator = ResultDeduplicator(config_manager.get_dedup_config())
     
-    def render_sidebar(self):
+    def render_sidebar(self, ai_service=None):
         """
         渲染侧边栏配置界面
         
+        Args:
+            ai_service: AI服务实例（可选，默认使用初始化时传入的实例），切换模型时更新其服务商
+        
         Returns:
             tuple: (知识库名称, 语义权重, 返回结果数量, 搜索时间占位符, 结果数量占位符)
         """
@@ -62,13 +91,9 @@ class UIComponents:
                 st.info(f"当前使用: {selected_provider} - {model_name}")
                 
                 # 更新AI服务配置（如果提供了AI服务实例）
-                if self.ai_service and selected_provider != self.ai_service.default_provider:
-                    self.ai_service.default_provider = selected_provider
-                    self.ai_service.current_provider_config = config.get(selected_provider, {})
-                    self.ai_service.client = OpenAI(
-                        base_url=self.ai_service.current_provider_config.get("base_url", "https://api.openai.com/v1"),
-                        api_key=self.ai_service.current_provider_config.get("api_key", ""),
-                    )
+                ai_service = ai_service or self.ai_service
+                if ai_service and selected_provider != ai_service.default_provider:
+                    ai_service.set_provider(selected_provider)
                     st.success(f"✅ 已切换到 {selected_provider}")
             else:
                 st.warning("⚠️ 未配置任何AI服务商，请前往设置页面进行配置")
@@ -121,6 +146,129 @@ class UIComponents:
         # 保留此方法仅为向后兼容
         return "", False
     
+    def render_search_suggestions(self, suggestions):
+        """
+        渲染搜索建议按钮
+        
+        Args:
+            suggestions (list): 建议词列表
+        """
+        if not suggestions:
+            return
+        
+        def _apply_suggestion(suggestion):
+            # 在下一次重跑渲染输入框之前写入，点击后直接执行搜索
+            st.session_state.search_query_input = suggestion
+            st.session_state.run_suggested_search = True
+        
+        columns = st.columns(len(suggestions))
+        for column, suggestion in zip(columns, suggestions):
+            with column:
+                st.button(
+                    f"💡 {suggestion}",
+                    key=f"suggestion_{suggestion}",
+                    on_click=_apply_suggestion,
+                    args=(suggestion,),
+                    use_container_width=True
+                )
+    
+    def get_facet_selection(self):
+        """
+        读取侧边栏中当前的分面筛选条件（控件值在上一次运行时已写入会话状态）
+        
+        Returns:
+            dict: build_filter_expression 的参数（values、date_field、date_from、date_to、date_format）
+        """
+        facet_config = self.config_manager.get_facet_config()
+        date_field = facet_config.get("date_field", "publish_time")
+        values = {
+            field: list(st.session_state.get(f"{FACET_KEY_PREFIX}{field}", []))
+            for field in facet_config.get("fields", ["industry", "organization"]) if field != date_field
+        }
+        date_from = date_to = None
+        if date_field and st.session_state.get(f"{FACET_KEY_PREFIX}date_enabled"):
+            # 日期范围控件在只选了开始日期时返回单元素元组
+            date_range = st.session_state.get(f"{FACET_KEY_PREFIX}date_range") or ()
+            if isinstance(date_range, date):
+                date_range = (date_range,)
+            # 默认范围覆盖全部结果，等同于不筛选
+            if tuple(date_range) != st.session_state.get(f"{FACET_KEY_PREFIX}date_default"):
+                date_from = date_range[0] if len(date_range) > 0 else None
+                date_to = date_range[1] if len(date_range) > 1 else None
+        return {
+            "values": values,
+            "date_field": date_field,
+            "date_from": date_from,
+            "date_to": date_to,
+            "date_format": facet_config.get("date_format", "string"),
+        }
+    
+    @staticmethod
+    def reset_facet_filters():
+        """清除分面筛选条件（新查询的可选值不同）"""
+        for key in [key for key in st.session_state if str(key).startswith(FACET_KEY_PREFIX)]:
+            del st.session_state[key]
+    
+    def render_facet_filters(self, facets):
+        """
+        渲染分面筛选控件（选项后附带各取值在当前查询中的文档数）
+        
+        Args:
+            facets (dict): 分面统计 {"distribution": {字段: {取值: 数量}}, "stats": {字段: {"min", "max"}}}
+        """
+        facet_config = self.config_manager.get_facet_config()
+        if not facet_config.get("enabled", True):
+            return
+        max_values = facet_config.get("max_values", 20)
+        date_field = facet_config.get("date_field", "publish_time")
+        distribution = facets.get("distribution", {})
+        
+        st.markdown("### 🔎 结果筛选")
+        selection = self.get_facet_selection()
+        for field, selected in selection["values"].items():
+            counts = distribution.get(field) or {}
+            if not counts and not selected:
+                continue
+            top = [value for value, _ in sorted(counts.items(), key=lambda item: item[1], reverse=True)[:max_values]]
+            # 已选中的取值始终保留在选项中
+            options = top + [value for value in selected if value not in top]
+            st.multiselect(
+                FACET_LABELS.get(field, field),
+                options,
+                key=f"{FACET_KEY_PREFIX}{field}",
+                format_func=lambda value, counts=counts: f"{value} ({counts.get(value, 0)})",
+            )
+        
+        if date_field:
+            if st.checkbox("📅 按发布时间筛选", key=f"{FACET_KEY_PREFIX}date_enabled"):
+                bounds = self._date_bounds(facets, date_field, facet_config.get("date_format", "string"))
+                st.session_state[f"{FACET_KEY_PREFIX}date_default"] = bounds
+                st.date_input("发布时间范围", value=bounds, key=f"{FACET_KEY_PREFIX}date_range")
+        
+        if not distribution:
+            st.caption("当前知识库未提供分面统计，请确认筛选字段已设置为 filterableAttributes")
+    
+    @staticmethod
+    def _date_bounds(facets, date_field, date_format):
+        """根据分面统计推断日期范围控件的默认起止日期，无法推断时使用最近一年"""
+        try:
+            if date_format == "timestamp":
+                stats = facets.get("stats", {}).get(date_field)
+                if stats:
+                    return date.fromtimestamp(stats["min"]), date.fromtimestamp(stats["max"])
+            else:
+                days = sorted(
+                    datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+                    for value in facets.get("distribution", {}).get(date_field, {})
+                    if str(value)[:10].count("-") == 2
+                )
+                if days:
+                    return days[0], days[-1]
+        except (ValueError, KeyError, TypeError, OverflowError):
+            pass
+        today = date.today()
+        return today - timedelta(days=365), today
+    
     def update_search_status(self, search_time_placeholder, result_count_placeholder, 
                            duration_ms, result_count):
         """
@@ -135,7 +283,7 @@ class UIComponents:
         search_time_placeholder.markdown(f"### 搜索耗时：{duration_ms:.2f} ms")
         result_count_placeholder.markdown(f"### 返回结果数：{result_count} 条")
     
-    def render_search_result(self, hit, index, ai_service):
+    def render_search_result(self, hit, index, ai_service, duplicates=None):
         """
         渲染单个搜索结果
         
@@ -143,6 +291,7 @@ class UIComponents:
             hit (dict): 搜索结果项
             index (int): 结果索引
             ai_service: AI服务实例
+            duplicates (list, optional): 与该结果重复的其他结果
         """
         # 显示文档标题和基本信息
         st.markdown(f"### {index}. {hit.get('title', '无标题')}")
@@ -153,9 +302,12 @@ class UIComponents:
         st.write(f"📅 发布时间: {hit.get('publish_time', '无')}")
         st.write(f"🔗 来源: {hit.get('source', '无')}")
         
-        # 获取文档内容并生成AI摘要和关键词
-        content = hit.get('content', '') or hit.get('abstract', '')
-        summary, keywords = ai_service.process_content(content)
+        # 优先使用离线任务预先生成的摘要和关键词，缺失时才实时生成
+        summary = hit.get('ai_summary')
+        keywords = hit.get('ai_keywords')
+        if not summary or not keywords:
+            content = hit.get('content', '') or hit.get('abstract', '')
+            summary, keywords = ai_service.process_content(content)
         
         # 显示AI生成的摘要和关键词（markdown格式需要两个以上空格+\n才能换行）
         st.write(f"📝 千问摘要:  \n{summary}")
@@ -164,8 +316,24 @@ class UIComponents:
         # 显示文档链接
         self._render_document_links(hit)
         
+        # 显示被折叠的重复来源
+        if duplicates:
+            self._render_duplicate_sources(duplicates)
+        
         st.divider()  # 分隔线
     
+    def _render_duplicate_sources(self, duplicates):
+        """
+        渲染被折叠的重复结果来源
+        
+        Args:
+            duplicates (list): 重复结果列表
+        """
+        with st.expander(f"🔁 另有 {len(duplicates)} 个来源发布了相同或相似内容", expanded=False):
+            for dup in duplicates:
+                st.write(f"- {dup.get('title', '无标题')}（🏢 {dup.get('organization', '无')} / 🔗 {dup.get('source', '无')}）")
+                self._render_document_links(dup)
+    
     def _render_document_links(self, hit):
         """
         渲染文档链接
@@ -181,7 +349,7 @@ class UIComponents:
         if file_url:
             st.markdown(f"[📁 文件下载]({file_url})")
     
-    def render_search_results(self, results, success, ai_service):
+    def render_search_results(self, results, success, ai_service, start_index=1):
         """
         渲染搜索结果列表
         
@@ -189,13 +357,209 @@ class UIComponents:
             results (list): 搜索结果列表
             success (bool): 搜索是否成功
             ai_service: AI服务实例
+            start_index (int): 第一条结果的序号（翻页时递增）
         """
         if success and results:
-            for i, hit in enumerate(results, start=1):
-                self.render_search_result(hit, i, ai_service)
+            with tracer.span("render.search_results", hits=len(results)):
+                # 去重后每个聚类只渲染一张卡片，只生成一次摘要和关键词
+                with tracer.span("dedup"):
+                    clusters = self.deduplicator.deduplicate(results)
+                for i, cluster in enumerate(clusters, start=start_index):
+                    self.render_search_result(cluster["primary"], i, ai_service, cluster["duplicates"])
         elif not results:
             st.info("未找到匹配结果，请尝试其他关键词")
     
+    def render_pagination(self, page, has_next):
+        """
+        渲染翻页按钮（页码保存在 st.session_state.search_state 中）
+        
+        Args:
+            page (int): 当前页码（从0开始）
+            has_next (bool): 是否可能存在下一页
+        """
+        def _change_page(delta):
+            st.session_state.search_state["page"] = max(0, page + delta)
+        
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        with prev_col:
+            st.button("⬅️ 上一页", key="search_prev_page", on_click=_change_page, args=(-1,),
+                      disabled=page == 0, use_container_width=True)
+        with page_col:
+            st.markdown(f"<p style='text-align: center;'>第 {page + 1} 页</p>", unsafe_allow_html=True)
+        with next_col:
+            st.button("下一页 ➡️", key="search_next_page", on_click=_change_page, args=(1,),
+                      disabled=not has_next, use_container_width=True)
+    
+    def render_performance_dashboard(self, tracer, token_minutes=30, slow_limit=10):
+        """
+        渲染性能监控面板
+        
+        Args:
+            tracer: 追踪器实例
+            token_minutes (int): Token统计时间范围（分钟）
+            slow_limit (int): 慢请求显示条数
+        """
+        st.markdown(f"### ⏱️ 各阶段延迟（最近 {tracer.window_seconds // 60} 分钟）")
+        stage_rows = [
+            {
+                "阶段": row["stage"],
+                "服务商": row["provider"] or "-",
+                "次数": row["count"],
+                "p50 (ms)": round(row["p50"], 1) if row["p50"] is not None else None,
+                "p95 (ms)": round(row["p95"], 1) if row["p95"] is not None else None,
+                "p99 (ms)": round(row["p99"], 1) if row["p99"] is not None else None,
+            }
+            for row in tracer.stage_percentiles() if row["count"]
+        ]
+        if stage_rows:
+            st.dataframe(stage_rows, use_container_width=True, hide_index=True)
+        else:
+            st.info("暂无延迟数据，执行搜索或问答后再查看")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("### 🗄️ 缓存命中率")
+            cache_rows = [
+                {
+                    "缓存": row["cache"],
+                    "命中": row["hits"],
+                    "未命中": row["misses"],
+                    "命中率": f"{row['hit_ratio']:.1%}" if row["hit_ratio"] is not None else "-",
+                }
+                for row in tracer.cache_hit_ratios()
+            ]
+            if cache_rows:
+                st.dataframe(cache_rows, use_container_width=True, hide_index=True)
+            else:
+                st.info("暂无缓存访问记录")
+        
+        with col2:
+            st.markdown(f"### 🪙 LLM Token消耗（每分钟，最近 {token_minutes} 分钟）")
+            usage = tracer.token_usage_per_minute(token_minutes)
+            if usage:
+                chart_data = {}
+                for minute, providers in usage.items():
+                    label = datetime.fromtimestamp(minute).strftime("%H:%M")
+                    for provider, tokens in providers.items():
+                        chart_data.setdefault(provider or "未知", {})[label] = tokens
+                st.bar_chart(chart_data)
+            else:
+                st.info("暂无Token消耗记录")
+        
+        st.markdown("### 🐢 最近最慢的请求")
+        slow_rows = [
+            {
+                "时间": datetime.fromtimestamp(record["timestamp"]).strftime("%H:%M:%S"),
+                "类型": "搜索" if record["name"] == "search.request" else "问答",
+                "查询": record.get("query", ""),
+                "耗时 (ms)": round(record["duration_ms"], 1),
+                "错误": record.get("error") or "",
+            }
+            for record in tracer.slowest_spans(limit=slow_limit)
+        ]
+        if slow_rows:
+            st.dataframe(slow_rows, use_container_width=True, hide_index=True)
+        else:
+            st.info("暂无请求记录")
+    
+    def render_memory_governor(self, report, current_session=None):
+        """
+        渲染进程内存概况和各会话的估算内存
+        
+        Args:
+            report (dict): MemoryGovernor.report() 的结果
+            current_session (str, optional): 当前会话标识（前8位），用于标记
+        """
+        st.markdown("### 🧮 进程内存")
+        col1, col2, col3, col4 = st.columns(4)
+        limit_mb = report["limit_bytes"] / 1024 / 1024
+        col1.metric("会话估算内存", f"{report['sessions_bytes'] / 1024 / 1024:.1f} MB",
+                    help=f"会话与共享缓存合计超过 {limit_mb:.0f} MB 时回收空闲会话")
+        col2.metric("共享内存缓存", f"{report['cache_bytes'] / 1024 / 1024:.1f} MB")
+        col3.metric("进程常驻内存", f"{report['rss_bytes'] / 1024 / 1024:.1f} MB" if report["rss_bytes"] else "-")
+        col4.metric("已回收会话 / 缓存裁剪", f"{report['evictions']} / {report['cache_trims']}")
+        session_rows = [
+            {
+                "会话": f"{row['session']}{' (当前)' if row['session'] == current_session else ''}",
+                "空闲 (秒)": row["idle_seconds"],
+                "估算内存 (KB)": round(row["bytes"] / 1024, 1),
+                "已回收": "是" if row["evicted"] else "",
+            }
+            for row in report["sessions"]
+        ]
+        if session_rows:
+            st.dataframe(session_rows, use_container_width=True, hide_index=True)
+        else:
+            st.info("暂无会话数据")
+    
+    def render_service_status(self, states, show_healthy=False):
+        """
+        渲染外部依赖状态（默认只提示已熔断或正在探测恢复的依赖）
+        
+        Args:
+            states (list): circuit_breaker_states() 的结果
+            show_healthy (bool): 是否以表格显示全部依赖（性能监控页面）
+        """
+        if show_healthy:
+            st.markdown("### 🔌 外部依赖")
+            rows = [
+                {
+                    "依赖": self._dependency_label(state["name"]),
+                    "状态": BREAKER_STATE_LABELS.get(state["state"], state["state"]),
+                    "连续失败": state["failures"],
+                    "剩余熔断 (秒)": state["retry_after"],
+                    "最近错误": state["last_error"],
+                }
+                for state in states
+            ]
+            if rows:
+                st.dataframe(rows, use_container_width=True, hide_index=True)
+            else:
+                st.info("暂无外部依赖调用")
+            return
+        
+        for state in states:
+            if state["state"] == "closed":
+                continue
+            degraded = DEPENDENCY_STATUS.get(state["name"].split(":")[0], ("", "部分功能暂不可用"))[1]
+            label = self._dependency_label(state["name"])
+            if state["state"] == "open":
+                st.warning(f"⚠️ {label}暂不可用，{degraded}（约 {state['retry_after']:.0f} 秒后重试）")
+            else:
+                st.info(f"🔄 {label}正在恢复，{degraded}")
+    
+    @staticmethod
+    def _dependency_label(name):
+        """外部依赖的显示名称，服务商后缀原样保留（如 AI服务 (openai)）"""
+        prefix, _, suffix = name.partition(":")
+        label = DEPENDENCY_STATUS.get(prefix, (prefix, ""))[0]
+        return f"{label} ({suffix})" if suffix else label
+    
+    def render_memory_report(self, report, current_owner=None):
+        """
+        渲染会话内存报告
+        
+        Args:
+            report (list): chat_models.memory_report() 的结果
+            current_owner (str, optional): 当前用户的标识（前8位），用于标记
+        """
+        st.markdown("### 🧠 会话内存（对话历史）")
+        memory_rows = [
+            {
+                "会话": f"{row['owner']}{' (当前)' if row['owner'] == current_owner else ''}",
+                "对话数": row["sessions"],
+                "内存中消息": row["messages_in_memory"],
+                "已归档消息": row["archived_messages"],
+                "内存 (KB)": round(row["bytes"] / 1024, 1),
+            }
+            for row in report
+        ]
+        if memory_rows:
+            st.caption(f"共 {len(memory_rows)} 个会话，合计 {sum(row['bytes'] for row in report) / 1024:.1f} KB")
+            st.dataframe(memory_rows, use_container_width=True, hide_index=True)
+        else:
+            st.info("暂无会话数据")
+    
     def measure_search_time(self, search_function, *args, **kwargs):
         """
         测量搜索耗时
@@ -208,8 +572,9 @@ class UIComponents:
         Returns:
             tuple: (搜索结果, 耗时毫秒)
         """
-        start_time = time.time()
+        # 使用单调时钟，避免系统时间调整影响耗时统计
+        start_time = time.perf_counter()
         results = search_function(*args, **kwargs)
-        end_time = time.time()
+        end_time = time.perf_counter()
         duration_ms = (end_time - start_time) * 1000
         return results, duration_ms
\ No newline at end of file
@@ -7,6 +7,9 @@ import requests
 import json
 import logging
 from typing import Dict, Any, List, Optional
+from cache_backend import get_cache_backend, make_cache_key
+from circuit_breaker import get_circuit_breaker
+from tracing import tracer
 
 
 class WebSearchService:
@@ -21,13 +24,32 @@ class WebSearchService:
         """
         self.config_manager = config_manager
         self.logger = logging.getLogger(__name__)
-        
+        self._apply_config()
+        # 只有相关配置节变化时才重新读取
+        config_manager.subscribe(self._on_config_change, ("web_search", "cache", "circuit_breaker"))
+    
+    def _apply_config(self):
+        """根据当前配置初始化搜索参数"""
         # 从配置文件中读取搜索API配置
         web_search_config = self.config_manager.get_config().get("web_search", {})
         self.search_url = web_search_config.get("url")
         self.api_key = web_search_config.get("api_key")
         self.default_tool = web_search_config.get("default_tool")
-        self.timeout = web_search_config.get("timeout")
+        self.timeout = web_search_config.get("timeout", 30)
+        # 网络搜索熔断器（进程级共享），不可用时问答不再等待网络搜索
+        self.breaker = get_circuit_breaker("web_search", self.config_manager.get_circuit_breaker_config())
+        
+        # 进程级共享缓存（只缓存成功的搜索结果）
+        self.cache = get_cache_backend(self.config_manager.get_cache_config())
+    
+    def _on_config_change(self, old_config, new_config):
+        """配置变更回调"""
+        self._apply_config()
+    
+    @property
+    def available(self) -> bool:
+        """网络搜索当前是否可用（未熔断）"""
+        return self.breaker.available
     
     def search_web(self, query: str, tool: str = None) -> Dict[str, Any]:
         """
@@ -40,9 +62,27 @@ class WebSearchService:
         Returns:
             Dict[str, Any]: 搜索结果
         """
+        search_tool = tool or self.default_tool
+        return self.cache.get_or_compute(
+            "web_search",
+            make_cache_key(search_tool, query),
+            lambda: self._search_web(query, search_tool),
+            cacheable=lambda result: result.get("success", False)
+        )
+    
+    def _search_web(self, query: str, search_tool: str) -> Dict[str, Any]:
+        """执行网络搜索请求（不使用缓存）"""
+        if not self.breaker.allow():
+            error_msg = f"网络搜索暂不可用（已熔断，{self.breaker.retry_after():.0f} 秒后重试）"
+            self.logger.warning(error_msg)
+            return {
+                "success": False,
+                "query": query,
+                "error": error_msg
+            }
+        
         try:
             # 准备请求数据
-            search_tool = tool or self.default_tool
             payload = {
                 "query": query,
                 "tools": search_tool
@@ -56,13 +96,23 @@ class WebSearchService:
             
             self.logger.info(f"开始网络搜索: {query}")
             
-            # 发送搜索请求
-            response = requests.post(
-                self.search_url,
-                headers=headers,
-                json=payload,
-                timeout=self.timeout
-            )
+            # 发送搜索请求（超时、连接失败和 5xx 响应计入熔断）
+            with tracer.span("web_search", provider=search_tool) as span:
+                try:
+                    response = requests.post(
+                        self.search_url,
+                        headers=headers,
+                        json=payload,
+                        timeout=self.timeout
+                    )
+                except Exception as e:
+                    self.breaker.record_failure(e)
+                    raise
+                span.set(status_code=response.status_code)
+            if response.status_code >= 500:
+                self.breaker.record_failure(f"状态码 {response.status_code}")
+            else:
+                self.breaker.record_success()
             
             # 检查响应状态
             if response.status_code == 200: